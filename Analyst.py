@@ -1,5 +1,9 @@
 # requirement_analyzer.py
 from LLM_Engine import call_llm
+from tracing import tracer
+from structured_output import compile_schema, complete_structured, StructuredOutputError
+from similarity_cache import (SimilarityCache, seed_prompt, ANALYSIS_INDEX_PATH,
+                              DEFAULT_REUSE_THRESHOLD, DEFAULT_SEED_THRESHOLD)
 import json
 
 SYSTEM_PROMPT = """你是一个需求分析师，负责从用户输入的需求中识别核心业务目标、功能模块、关键流程，并以json格式输出。
@@ -26,26 +30,58 @@ SYSTEM_PROMPT = """你是一个需求分析师，负责从用户输入的需求
   ]
 }"""
 
-def analyze_requirements(user_input: str) -> dict:
-    """分析用户需求并返回结构化结果"""
+# 与 SYSTEM_PROMPT 中格式一致的校验规则
+ANALYSIS_SCHEMA = compile_schema({
+    "project_name": str,
+    "description": str,
+    "core_features": [str],
+    "optional_features": [str],
+    "technical_constraints": [str],
+    "summary": [str],
+})
+
+# 近似重复需求的分析结果索引
+similar_analyses = SimilarityCache(path=ANALYSIS_INDEX_PATH)
+
+@tracer.traced("analyze_requirements")
+def analyze_requirements(user_input: str, reuse_similar: bool = False) -> dict:
+    """分析用户需求并返回结构化结果
+
+    reuse_similar=True 时先查询相似需求：相似度足够高时直接复用历史结果，
+    否则把较相似的历史结果作为参考附加到提示词中。
+    """
     try:
+        prompt = user_input
+        if reuse_similar:
+            found = similar_analyses.lookup(user_input)
+            if found and found[1] >= DEFAULT_REUSE_THRESHOLD:
+                print(f"复用相似需求的分析结果（相似度 {found[1]:.2f}）")
+                return json.loads(json.dumps(found[0]['analysis']))
+            if found and found[1] >= DEFAULT_SEED_THRESHOLD:
+                prompt = seed_prompt(user_input, found[0]['analysis'], "相似需求的历史分析结果")
+        
         # 调用LLM引擎
         response = call_llm(
-            prompt=user_input,
+            prompt=prompt,
             system=SYSTEM_PROMPT,
             json_output=True,
-            temperature=0.3  # 降低temperature使输出更稳定
+            temperature=0.3,  # 降低temperature使输出更稳定
+            stage="Analyst"
         )
         
         # 处理可能的错误响应
         if response.startswith("[ERROR]"):
             return {"error": response}
             
-        # 尝试解析JSON
-        return json.loads(response)
+        # 解析JSON，截断或缺失的字段单独补充请求
+        result = complete_structured(response, ANALYSIS_SCHEMA, prompt=prompt, system=SYSTEM_PROMPT,
+                                     stage="Analyst", temperature=0.3)
+        if reuse_similar:
+            similar_analyses.add(user_input, {'analysis': result})
+        return result
         
-    except json.JSONDecodeError:
-        return {"error": "响应格式无效，解析JSON失败"}
+    except StructuredOutputError as e:
+        return {"error": f"响应格式无效，{str(e)}"}
     except Exception as e:
         return {"error": f"分析过程异常: {str(e)}"}
 
@@ -1,38 +1,403 @@
-from openai import OpenAI
 import os
+import time
+import asyncio
+import contextvars
+from typing import Iterator, AsyncIterator, Optional
+from llm_cache import LLMCache, make_cache_key
+from llm_clients import ClientRegistry
+from llm_metrics import LLMMetrics, read_usage
+from llm_governor import RequestGovernor, past_deadline
+from llm_hedging import HedgePolicy
+from llm_router import ModelRouter
+from tracing import tracer
 
-# 设置你的 OpenAI API key（推荐用环境变量）
-DEEPSEEK_API_KEY = os.environ["DEEPSEEK_API_KEY"]
-client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com")
+# 设置你的 OpenAI API key（推荐用环境变量）；未设置时在第一次调用模型时才报错
+DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY")
+# 接口地址可通过环境变量切换到其他 OpenAI 兼容服务（例如本地压测桩服务）
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+# 按接口地址复用的客户端连接池，openai SDK 与客户端都在第一次调用时才创建
+clients = ClientRegistry(base_url=DEEPSEEK_BASE_URL, api_key=DEEPSEEK_API_KEY)
 
-def call_llm(prompt: str, system:str = " ",json_output:bool = False,model: str = "deepseek-chat", temperature: float = 0.7) -> str:
+def configure_client(base_url: str = None, api_key: str = None):
+    """运行时切换默认接口地址或 API key，之后的调用使用新建的客户端"""
+    clients.configure(base_url=base_url, api_key=api_key)
+
+def run_async(coro):
+    """在新的事件循环中运行协程（代替 asyncio.run），结束前关闭该循环中创建的异步客户端"""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await clients.aclose_loop()
+    return asyncio.run(main())
+
+def __getattr__(name: str):
+    """兼容旧代码直接访问 LLM_Engine.client / LLM_Engine.async_client"""
+    if name == "client":
+        return clients.sync_client()
+    if name == "async_client":
+        return clients.async_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# 持久化响应缓存，相同请求（模型、提示词、temperature、json_output）直接返回历史结果
+response_cache = LLMCache()
+# 每次实际发往模型的调用的耗时、token 与费用统计
+metrics = LLMMetrics()
+# 所有调用共享的限流、重试与自适应并发控制
+governor = RequestGovernor()
+# 异步调用的请求对冲策略，默认关闭（CODEGEN_HEDGING=1 开启）
+hedging = HedgePolicy(enabled=os.environ.get("CODEGEN_HEDGING") == "1")
+# 按阶段、预计输出大小与实时统计选择模型和接口，失败时改用备用路由（策略见 CODEGEN_ROUTING）
+router = ModelRouter()
+# 当前任务（线程或 asyncio 任务）中是否有调用由备用路由完成；调用方据此决定是否把结果记入构建清单
+fallback_used = contextvars.ContextVar("fallback_used", default=False)
+# 单次请求的默认超时（秒）
+DEFAULT_CALL_TIMEOUT = float(os.environ.get("CODEGEN_CALL_TIMEOUT", "120"))
+# 流式调用写入缓存的最大字符数；更长的输出不缓存，流式调用的内存占用不随输出大小增长
+STREAM_CACHE_MAX_CHARS = 256 * 1024
+
+def _estimate_prompt_tokens(prompt: str, system: str) -> int:
+    """粗略估计请求的输入 token 数，用于 TPM 限流"""
+    return (len(prompt) + len(system)) // 2 + 1
+
+def _debit_completion_tokens(usage):
+    """按实际完成 token 数补扣 TPM 配额"""
+    governor.tokens.debit(read_usage(usage)["completion_tokens"])
+
+def _build_request(prompt: str, system: str, json_output: bool, model: str, temperature: float,
+                   timeout: Optional[float] = None) -> dict:
+    """构造 chat.completions.create 的请求参数（同步与异步调用共用）"""
+    request = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": temperature,
+        "timeout": timeout or DEFAULT_CALL_TIMEOUT,
+    }
+    if json_output:
+        request["response_format"] = {'type': 'json_object'}
+    return request
+
+def _attempt_timeout(timeout: Optional[float], deadline: Optional[float]) -> float:
+    """单次请求的超时，不超过截止时间（time.monotonic() 读数）剩余的时间"""
+    timeout = timeout or DEFAULT_CALL_TIMEOUT
+    if deadline is None:
+        return timeout
+    return max(0.001, min(timeout, deadline - time.monotonic()))
+
+def _route_cache_key(route, system: str, prompt: str, temperature: float, json_output: bool) -> str:
+    """按实际使用的路由计算缓存键
+
+    默认接口上的调用只按模型区分（与未配置路由时的缓存键相同）；指定了接口地址的路由
+    （例如备用接口）再加上路由名，避免其他接口或模型的结果被当作请求模型的结果返回。
+    """
+    model = f"{route.name}:{route.model}" if route.base_url else route.model
+    return make_cache_key(model, system, prompt, temperature, json_output)
+
+def _cache_get(key: str) -> Optional[str]:
+    """读取响应缓存；缓存不可用（例如被其他进程锁住）时视为未命中"""
     try:
-        print("LLM调用中")
-        if json_output:
-            response = client.chat.completions.create(
-              model=model,
-              messages=[
-                  {"role": "system", "content": system},
-                  {"role": "user", "content": prompt}
-              ],
-              temperature=temperature,
-              response_format={
-                  'type': 'json_object'
-              }
-            )
+        return response_cache.get(key)
+    except Exception as e:
+        print(f"读取响应缓存失败: {str(e)}")
+        return None
+
+def _cache_put(key: str, content: Optional[str]):
+    """写入响应缓存；写入失败只打印提示，不影响已经成功的调用"""
+    if content is None:
+        return
+    try:
+        response_cache.put(key, content)
+    except Exception as e:
+        print(f"写入响应缓存失败: {str(e)}")
+
+def forget_cached(prompt: str, system: str = " ", json_output: bool = False, model: str = "deepseek-chat",
+                  temperature: float = 0.7, stage: str = "default", expected_tokens: Optional[int] = None):
+    """删除该请求在各条候选路由下的缓存结果，用于结果不可用（例如生成的代码未通过检查）的场景"""
+    if response_cache is None:
+        return
+    for route in router.choose(stage, model, expected_tokens):
+        try:
+            response_cache.delete(_route_cache_key(route, system, prompt, temperature, json_output))
+        except Exception as e:
+            print(f"删除响应缓存失败: {str(e)}")
+
+def _trace_call(name: str, stage: str, route, started: float, elapsed: float, usage=None,
+                ttft: Optional[float] = None, error: bool = False):
+    """把一次实际发出的调用记录为追踪 span，附带阶段、模型、路由与 token 数"""
+    if not tracer.enabled:
+        return
+    tokens = read_usage(usage)
+    tracer.record(name, started, elapsed, stage=stage, model=route.model, route=route.name,
+                  prompt_tokens=tokens["prompt_tokens"], completion_tokens=tokens["completion_tokens"],
+                  cached_tokens=tokens["cached_tokens"], ttft=ttft, error=error or None)
+
+class _StreamCapture:
+    """记录流式调用已产出的字符数，并保留用于写入缓存的内容（超过 STREAM_CACHE_MAX_CHARS 后丢弃）"""
+
+    def __init__(self):
+        self.chars = 0
+        self._pieces = []
+
+    def add(self, text: str):
+        self.chars += len(text)
+        if self._pieces is None:
+            return
+        if self.chars > STREAM_CACHE_MAX_CHARS:
+            self._pieces = None
         else:
-            response = client.chat.completions.create(
-              model=model,
-              messages=[
-                  {"role": "system", "content": system},
-                  {"role": "user", "content": prompt}
-              ],
-              temperature=temperature,
+            self._pieces.append(text)
+
+    def content(self) -> Optional[str]:
+        return None if self._pieces is None else "".join(self._pieces)
+
+def _record_discarded(stage: str, route, result, seconds: float, winner_usage):
+    """记录对冲中落败的请求，使对冲的花费出现在统计中并补扣 TPM 配额
+
+    已完成的按实际用量记录；被取消的请求服务端可能已经计费，按获胜请求的用量估计（上限）。
+    """
+    usage = getattr(result, "usage", None) if result is not None else winner_usage
+    _debit_completion_tokens(usage)
+    metrics.record(f"{stage}_hedge", route.model, seconds, usage=usage)
+
+def _next_route_notice(routes, index: int, error: Exception):
+    """当前路由失败、还有备用路由时打印提示，返回是否继续尝试"""
+    if index + 1 >= len(routes):
+        return False
+    print(f"路由 {routes[index].name} 调用失败（{str(error)}），改用 {routes[index + 1].name}")
+    return True
+
+def call_llm(prompt: str, system:str = " ",json_output:bool = False,model: str = "deepseek-chat", temperature: float = 0.7, use_cache: bool = True, stage: str = "default", timeout: Optional[float] = None, expected_tokens: Optional[int] = None, deadline: Optional[float] = None) -> str:
+    """调用模型；use_cache=False 时跳过缓存读取，用于需要重新采样的场景
+
+    stage 标记调用来源（如 Analyst、Software_Architect 或任务类型），用于统计报告与模型路由。
+    timeout 为单次请求的超时（秒），默认 DEFAULT_CALL_TIMEOUT。
+    expected_tokens 为预计输出 token 数，路由据此决定小任务能否交给更快的模型。
+    deadline 为整个调用（含重试与备用路由）的截止时间（time.monotonic() 读数），
+    每次请求的超时不超过剩余时间，到达后不再重试。
+    """
+    # 只查询首选路由的缓存；由备用路由生成的结果按备用路由的键保存，不会在这里命中
+    routes = router.choose(stage, model, expected_tokens)
+    if use_cache:
+        cached = _cache_get(_route_cache_key(routes[0], system, prompt, temperature, json_output))
+        if cached is not None:
+            return cached
+    print("LLM调用中")
+    for index, route in enumerate(routes):
+        if past_deadline(deadline):
+            return "[ERROR] 模型调用失败：超出截止时间"
+        started = time.perf_counter()
+        try:
+            request = _build_request(prompt, system, json_output, route.model, temperature, timeout)
+            client = clients.sync_client(route.model, route.base_url, route.api_key)
+            response = governor.run(
+                lambda: client.chat.completions.create(**dict(request, timeout=_attempt_timeout(timeout, deadline))),
+                estimated_tokens=_estimate_prompt_tokens(prompt, system),
+                deadline=deadline
             )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"[ERROR] 模型调用失败：{str(e)}"
+            _debit_completion_tokens(response.usage)
+            elapsed = time.perf_counter() - started
+            hedging.observe(stage, elapsed)
+            metrics.record(stage, route.model, elapsed, usage=response.usage)
+            router.record(route, elapsed)
+            _trace_call("call_llm", stage, route, started, elapsed, usage=response.usage)
+            content = response.choices[0].message.content
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            metrics.record(stage, route.model, elapsed, error=True)
+            router.record(route, elapsed, error=True)
+            _trace_call("call_llm", stage, route, started, elapsed, error=True)
+            if not _next_route_notice(routes, index, e):
+                return f"[ERROR] 模型调用失败：{str(e)}"
+            continue
+        if index:
+            fallback_used.set(True)
+        _cache_put(_route_cache_key(route, system, prompt, temperature, json_output), content)
+        return content
+
+async def call_llm_async(prompt: str, system:str = " ",json_output:bool = False,model: str = "deepseek-chat", temperature: float = 0.7, use_cache: bool = True, stage: str = "default", timeout: Optional[float] = None, hedge: Optional[bool] = None, expected_tokens: Optional[int] = None, deadline: Optional[float] = None) -> str:
+    """call_llm 的异步版本，基于 AsyncOpenAI 客户端，可被多个任务并发等待
+
+    hedge 控制是否对慢请求发出对冲请求，None 时使用全局 hedging 策略的开关。
+    """
+    # 只查询首选路由的缓存；由备用路由生成的结果按备用路由的键保存，不会在这里命中
+    routes = router.choose(stage, model, expected_tokens)
+    if use_cache:
+        cached = _cache_get(_route_cache_key(routes[0], system, prompt, temperature, json_output))
+        if cached is not None:
+            return cached
+    print("LLM调用中（异步）")
+    for index, route in enumerate(routes):
+        if past_deadline(deadline):
+            return "[ERROR] 模型调用失败：超出截止时间"
+        started = time.perf_counter()
+        try:
+            request = _build_request(prompt, system, json_output, route.model, temperature, timeout)
+            async_client = clients.async_client(route.model, route.base_url, route.api_key)
+            discarded = []
+            response = await hedging.run(
+                stage,
+                lambda: governor.run_async(
+                    lambda: async_client.chat.completions.create(**dict(request, timeout=_attempt_timeout(timeout, deadline))),
+                    estimated_tokens=_estimate_prompt_tokens(prompt, system),
+                    deadline=deadline
+                ),
+                enabled=hedge,
+                on_discard=lambda result, seconds: discarded.append((result, seconds))
+            )
+            _debit_completion_tokens(response.usage)
+            elapsed = time.perf_counter() - started
+            metrics.record(stage, route.model, elapsed, usage=response.usage)
+            for result, seconds in discarded:
+                _record_discarded(stage, route, result, seconds, response.usage)
+            router.record(route, elapsed)
+            _trace_call("call_llm", stage, route, started, elapsed, usage=response.usage)
+            content = response.choices[0].message.content
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            metrics.record(stage, route.model, elapsed, error=True)
+            router.record(route, elapsed, error=True)
+            _trace_call("call_llm", stage, route, started, elapsed, error=True)
+            if not _next_route_notice(routes, index, e):
+                return f"[ERROR] 模型调用失败：{str(e)}"
+            continue
+        if index:
+            fallback_used.set(True)
+        _cache_put(_route_cache_key(route, system, prompt, temperature, json_output), content)
+        return content
+
+def stream_llm(prompt: str, system:str = " ",json_output:bool = False,model: str = "deepseek-chat", temperature: float = 0.7, use_cache: bool = True, stage: str = "default", timeout: Optional[float] = None, expected_tokens: Optional[int] = None, deadline: Optional[float] = None) -> Iterator[str]:
+    """流式调用模型，逐块产出生成的文本
+
+    与 call_llm 不同，调用失败时直接抛出异常，避免错误信息混入已写出的内容。
+    尚未产出任何内容时失败会改用下一条路由，已经产出内容后无法切换。
+    缓存命中时一次性产出完整结果；未命中时在流结束后写入缓存（超过 STREAM_CACHE_MAX_CHARS 的输出不缓存）。
+    """
+    # 只查询首选路由的缓存；由备用路由生成的结果按备用路由的键保存，不会在这里命中
+    routes = router.choose(stage, model, expected_tokens)
+    if use_cache:
+        cached = _cache_get(_route_cache_key(routes[0], system, prompt, temperature, json_output))
+        if cached is not None:
+            yield cached
+            return
+    print("LLM流式调用中")
+    captured = _StreamCapture()
+    for index, route in enumerate(routes):
+        if past_deadline(deadline):
+            raise TimeoutError("模型调用超出截止时间")
+        request = _build_request(prompt, system, json_output, route.model, temperature, timeout)
+        started = time.perf_counter()
+        ttft = None
+        usage = None
+        attempt = 0
+        try:
+            while True:
+                request["timeout"] = _attempt_timeout(timeout, deadline)
+                try:
+                    with governor.slot(_estimate_prompt_tokens(prompt, system), deadline):
+                        client = clients.sync_client(route.model, route.base_url, route.api_key)
+                        for chunk in client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request):
+                            usage = getattr(chunk, "usage", None) or usage
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                if ttft is None:
+                                    ttft = time.perf_counter() - started
+                                captured.add(delta)
+                                yield delta
+                    governor.on_success()
+                    break
+                except Exception as e:
+                    # 已经产出内容后无法透明重试，直接抛出
+                    delay = None if captured.chars else governor.retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        raise
+                print(f"LLM流式请求失败，{delay:.1f}秒后重试（第 {attempt + 1} 次）")
+                time.sleep(delay)
+                attempt += 1
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            metrics.record(stage, route.model, elapsed, usage=usage, ttft=ttft, error=True)
+            router.record(route, elapsed, error=True)
+            _trace_call("stream_llm", stage, route, started, elapsed, usage=usage, ttft=ttft, error=True)
+            if captured.chars or not _next_route_notice(routes, index, e):
+                raise
+            continue
+        elapsed = time.perf_counter() - started
+        _debit_completion_tokens(usage)
+        metrics.record(stage, route.model, elapsed, usage=usage, ttft=ttft)
+        router.record(route, elapsed)
+        _trace_call("stream_llm", stage, route, started, elapsed, usage=usage, ttft=ttft)
+        if index:
+            fallback_used.set(True)
+        _cache_put(_route_cache_key(route, system, prompt, temperature, json_output), captured.content())
+        return
 
+async def stream_llm_async(prompt: str, system:str = " ",json_output:bool = False,model: str = "deepseek-chat", temperature: float = 0.7, use_cache: bool = True, stage: str = "default", timeout: Optional[float] = None, expected_tokens: Optional[int] = None, deadline: Optional[float] = None) -> AsyncIterator[str]:
+    """stream_llm 的异步版本，返回异步迭代器"""
+    # 只查询首选路由的缓存；由备用路由生成的结果按备用路由的键保存，不会在这里命中
+    routes = router.choose(stage, model, expected_tokens)
+    if use_cache:
+        cached = _cache_get(_route_cache_key(routes[0], system, prompt, temperature, json_output))
+        if cached is not None:
+            yield cached
+            return
+    print("LLM流式调用中（异步）")
+    captured = _StreamCapture()
+    for index, route in enumerate(routes):
+        if past_deadline(deadline):
+            raise TimeoutError("模型调用超出截止时间")
+        request = _build_request(prompt, system, json_output, route.model, temperature, timeout)
+        started = time.perf_counter()
+        ttft = None
+        usage = None
+        attempt = 0
+        try:
+            while True:
+                request["timeout"] = _attempt_timeout(timeout, deadline)
+                try:
+                    async with governor.slot_async(_estimate_prompt_tokens(prompt, system), deadline):
+                        client = clients.async_client(route.model, route.base_url, route.api_key)
+                        async for chunk in await client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request):
+                            usage = getattr(chunk, "usage", None) or usage
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                if ttft is None:
+                                    ttft = time.perf_counter() - started
+                                captured.add(delta)
+                                yield delta
+                    governor.on_success()
+                    break
+                except Exception as e:
+                    # 已经产出内容后无法透明重试，直接抛出
+                    delay = None if captured.chars else governor.retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        raise
+                print(f"LLM流式请求失败，{delay:.1f}秒后重试（第 {attempt + 1} 次）")
+                await asyncio.sleep(delay)
+                attempt += 1
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            metrics.record(stage, route.model, elapsed, usage=usage, ttft=ttft, error=True)
+            router.record(route, elapsed, error=True)
+            _trace_call("stream_llm", stage, route, started, elapsed, usage=usage, ttft=ttft, error=True)
+            if captured.chars or not _next_route_notice(routes, index, e):
+                raise
+            continue
+        elapsed = time.perf_counter() - started
+        _debit_completion_tokens(usage)
+        metrics.record(stage, route.model, elapsed, usage=usage, ttft=ttft)
+        router.record(route, elapsed)
+        _trace_call("stream_llm", stage, route, started, elapsed, usage=usage, ttft=ttft)
+        if index:
+            fallback_used.set(True)
+        _cache_put(_route_cache_key(route, system, prompt, temperature, json_output), captured.content())
+        return
 
 if __name__ == "__main__":
     task = "请用 Python 写一个快速排序的函数。"
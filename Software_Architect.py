@@ -1,5 +1,12 @@
-from LLM_Engine import call_llm
+from LLM_Engine import call_llm, stream_llm_async
+from tracing import tracer
+from streaming_json import IncrementalJSONParser
+from structured_output import compile_schema, complete_structured, optional, StructuredOutputError
+from similarity_cache import (SimilarityCache, seed_prompt, ARCHITECTURE_INDEX_PATH,
+                              DEFAULT_REUSE_THRESHOLD, DEFAULT_SEED_THRESHOLD)
+from typing import AsyncIterator, Tuple, Any
 import json
+import asyncio
 
 ARCHITECTURE_PROMPT = """
 你是一位经验丰富的软件系统架构师，现在你需要根据一份结构化的功能需求，输出一个完整的软件系统架构设计。
@@ -31,32 +38,124 @@ ARCHITECTURE_PROMPT = """
 }
 """
 
-def design_architecture(structured_requirements: dict) -> dict:
-    """根据结构化需求设计系统架构"""
+# 与 ARCHITECTURE_PROMPT 中格式一致的校验规则；data_models 不在提示词中，可以缺失
+ARCHITECTURE_SCHEMA = compile_schema({
+    "project_name": str,
+    "tech_stack": {
+        "frontend": optional(str),
+        "backend": optional(str),
+        "database": optional(str),
+        "communication": optional(str),
+        "infrastructure": optional(str),
+    },
+    "modules": [{
+        "name": str,
+        "description": str,
+        "interfaces": [{
+            "name": str,
+            "method": str,
+            "endpoint": str,
+            "description": optional(str),
+        }],
+    }],
+    "data_models": optional([{
+        "name": str,
+        "fields": [dict],
+    }]),
+})
+# 响应被截断时，这些可选字段也需要补充请求
+ARCHITECTURE_OPTIONAL_KEYS = ["data_models"]
+
+# 近似重复需求的架构设计结果索引（以结构化需求文本为键）
+similar_architectures = SimilarityCache(path=ARCHITECTURE_INDEX_PATH)
+
+@tracer.traced("design_architecture")
+def design_architecture(structured_requirements: dict, reuse_similar: bool = False) -> dict:
+    """根据结构化需求设计系统架构
+
+    reuse_similar=True 时复用或参考相似需求的历史架构，规则同 analyze_requirements。
+    """
     try:
         # 将结构化需求转换为字符串作为提示
         requirements_str = json.dumps(structured_requirements, ensure_ascii=False)
         
+        prompt = requirements_str
+        if reuse_similar:
+            found = similar_architectures.lookup(requirements_str)
+            if found and found[1] >= DEFAULT_REUSE_THRESHOLD:
+                print(f"复用相似需求的架构设计（相似度 {found[1]:.2f}）")
+                return json.loads(json.dumps(found[0]['architecture']))
+            if found and found[1] >= DEFAULT_SEED_THRESHOLD:
+                prompt = seed_prompt(requirements_str, found[0]['architecture'], "相似需求的历史架构设计")
+        
         # 调用LLM引擎
         response = call_llm(
-            prompt=requirements_str,
+            prompt=prompt,
             system=ARCHITECTURE_PROMPT,
             json_output=True,
-            temperature=0.3  # 降低temperature使输出更稳定
+            temperature=0.3,  # 降低temperature使输出更稳定
+            stage="Software_Architect"
         )
         
         # 处理可能的错误响应
         if response.startswith("[ERROR]"):
             return {"error": response}
             
-        # 尝试解析JSON
-        return json.loads(response)
+        # 解析JSON，截断或缺失的字段单独补充请求
+        result = complete_structured(response, ARCHITECTURE_SCHEMA, prompt=prompt, system=ARCHITECTURE_PROMPT,
+                                     stage="Software_Architect", temperature=0.3,
+                                     optional_keys=ARCHITECTURE_OPTIONAL_KEYS)
+        if reuse_similar:
+            similar_architectures.add(requirements_str, {'architecture': result})
+        return result
         
-    except json.JSONDecodeError:
-        return {"error": "响应格式无效，解析JSON失败"}
+    except StructuredOutputError as e:
+        return {"error": f"响应格式无效，{str(e)}"}
     except Exception as e:
         return {"error": f"架构设计过程异常: {str(e)}"}
 
+async def stream_architecture_async(structured_requirements: dict) -> AsyncIterator[Tuple[str, str, Any]]:
+    """流式设计系统架构，边接收边解析
+
+    每当顶层字段（如 tech_stack）或 modules / data_models 中的一个元素解析完整时，
+    立即产出 ("field", 字段名, 值) 或 ("item", 字段名, 元素) 事件。
+    """
+    requirements_str = json.dumps(structured_requirements, ensure_ascii=False)
+    parser = IncrementalJSONParser()
+    emitted_fields = set()
+    emitted_items = {}
+    async for chunk in stream_llm_async(
+        prompt=requirements_str,
+        system=ARCHITECTURE_PROMPT,
+        json_output=True,
+        temperature=0.3,
+        stage="Software_Architect"
+    ):
+        for kind, key, value in parser.feed(chunk):
+            if kind == "field":
+                emitted_fields.add(key)
+            else:
+                emitted_items[key] = emitted_items.get(key, 0) + 1
+            yield kind, key, value
+
+    # 响应被截断或缺少字段时只补充请求缺失的部分，再补发尚未产出的事件
+    try:
+        result = await asyncio.to_thread(
+            complete_structured, parser.buffer, ARCHITECTURE_SCHEMA, prompt=requirements_str,
+            system=ARCHITECTURE_PROMPT, stage="Software_Architect", temperature=0.3,
+            optional_keys=ARCHITECTURE_OPTIONAL_KEYS
+        )
+    except StructuredOutputError as e:
+        raise ValueError(f"架构设计响应不完整，{str(e)}")
+    for key, value in result.items():
+        if key in emitted_fields:
+            continue
+        if isinstance(value, list):
+            for item in value[emitted_items.get(key, 0):]:
+                if isinstance(item, dict):
+                    yield "item", key, item
+        yield "field", key, value
+
 def pretty_print_architecture(result: dict):
     """美化输出架构设计结果"""
     if "error" in result:
@@ -0,0 +1,223 @@
+# batch_runner.py
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from typing import List, Dict
+
+from Analyst import analyze_requirements
+from Software_Architect import design_architecture
+from task_scheduler import TaskScheduler
+from code_verifier import CodeVerifier
+from LLM_Engine import run_async, metrics, governor, response_cache
+
+# 所有项目共享的 LLM 并发上限
+DEFAULT_BATCH_CONCURRENCY = 16
+
+
+class FairShareLimiter:
+    """多个项目共享的公平并发限制器
+
+    名额空出时优先分配给当前占用名额最少的项目，
+    避免任务很多的大项目长期占满并发，饿死其他项目。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.active = {}
+        self.waiters = {}
+
+    def for_project(self, project_id: str) -> "ProjectSlot":
+        """返回某个项目使用的异步上下文管理器，可直接作为 TaskScheduler 的 limiter"""
+        return ProjectSlot(self, project_id)
+
+    async def acquire(self, project_id: str):
+        if self.in_use < self.capacity and not any(self.waiters.values()):
+            self._grant(project_id)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(project_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已经分配但调用方被取消，归还名额
+                self.release(project_id)
+            elif future in self.waiters.get(project_id, ()):
+                self.waiters[project_id].remove(future)
+            raise
+
+    def release(self, project_id: str):
+        self.in_use -= 1
+        self.active[project_id] -= 1
+        self._dispatch()
+
+    def _grant(self, project_id: str):
+        self.in_use += 1
+        self.active[project_id] = self.active.get(project_id, 0) + 1
+
+    def _dispatch(self):
+        """把空出的名额分给等待中、占用最少的项目"""
+        while self.in_use < self.capacity:
+            candidates = [pid for pid, queue in self.waiters.items() if queue]
+            if not candidates:
+                return
+            project_id = min(candidates, key=lambda pid: self.active.get(pid, 0))
+            future = self.waiters[project_id].popleft()
+            if future.cancelled():
+                continue
+            self._grant(project_id)
+            future.set_result(None)
+
+
+class ProjectSlot:
+    """FairShareLimiter 针对单个项目的上下文管理器"""
+
+    def __init__(self, limiter: FairShareLimiter, project_id: str):
+        self.limiter = limiter
+        self.project_id = project_id
+
+    async def __aenter__(self):
+        await self.limiter.acquire(self.project_id)
+
+    async def __aexit__(self, *exc):
+        self.limiter.release(self.project_id)
+
+
+def load_requirements(path: str) -> List[Dict]:
+    """读取 JSONL 需求文件，每行包含 requirement（或 input）字段，可选 id"""
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            text = data.get('requirement') or data.get('input')
+            if not text:
+                raise ValueError(f"第 {line_no} 行缺少 requirement 字段")
+            items.append({'id': str(data.get('id', line_no)), 'requirement': text})
+    return items
+
+
+def write_project_result(project_dir: str, result: Dict) -> str:
+    """序列化并写出单个项目的结果（在线程中执行，不阻塞事件循环）"""
+    os.makedirs(project_dir, exist_ok=True)
+    path = os.path.join(project_dir, "result.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _safe_dir_name(text: str) -> str:
+    return re.sub(r'[^\w.-]+', '_', text).strip('_') or 'project'
+
+
+async def run_project(item: Dict, limiter: FairShareLimiter, output_dir: str,
+                      verifier: CodeVerifier = None) -> Dict:
+    """对单个需求执行分析、架构设计与代码生成"""
+    project_id = item['id']
+    project_dir = os.path.join(output_dir, _safe_dir_name(project_id))
+    slot = limiter.for_project(project_id)
+    summary = {'id': project_id, 'status': 'failed', 'timings': {}}
+    result = {'id': project_id, 'requirement': item['requirement']}
+    started = time.perf_counter()
+    try:
+        async with slot:
+            analysis = await asyncio.to_thread(analyze_requirements, item['requirement'])
+        summary['timings']['analysis'] = time.perf_counter() - started
+        result['analysis'] = analysis
+        if "error" in analysis:
+            summary['error'] = analysis['error']
+            return summary
+
+        phase = time.perf_counter()
+        async with slot:
+            architecture = await asyncio.to_thread(design_architecture, analysis)
+        summary['timings']['architecture'] = time.perf_counter() - phase
+        result['architecture'] = architecture
+        if "error" in architecture:
+            summary['error'] = architecture['error']
+            return summary
+
+        phase = time.perf_counter()
+        scheduler = TaskScheduler(architecture, output_root=project_dir, limiter=slot, verifier=verifier)
+        try:
+            scheduler.create_project_structure()
+            scheduler.build_task_queue()
+            await scheduler.execute_tasks_async()
+        finally:
+            scheduler.close()
+        summary['timings']['generation'] = time.perf_counter() - phase
+        summary['tasks'] = len(scheduler.task_queue)
+        summary['skipped'] = scheduler.skipped_tasks
+        summary['failed_tasks'] = len(scheduler.task_errors)
+        summary['regenerations'] = sum(scheduler.regenerations.values())
+        result['task_results'] = scheduler.task_results
+        result['task_errors'] = scheduler.task_errors
+        summary['status'] = 'success' if not scheduler.task_errors else 'partial'
+        return summary
+    except Exception as e:
+        summary['error'] = str(e)
+        return summary
+    finally:
+        summary['timings']['total'] = time.perf_counter() - started
+        result['summary'] = summary
+        await asyncio.to_thread(write_project_result, project_dir, result)
+
+
+async def run_batch_async(items: List[Dict], output_dir: str, concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+                          workers: int = 2) -> Dict:
+    """并发处理所有需求，共享 LLM 限流器与缓存，最后写出批处理汇总"""
+    os.makedirs(output_dir, exist_ok=True)
+    limiter = FairShareLimiter(concurrency)
+    started = time.perf_counter()
+    # 所有项目共享同一个代码检查进程池：批处理中主要的 CPU 工作（语法检查、外部 linter）在这里并行。
+    # 结构化输出的解析会发起补充请求并使用进程内的缓存与限流器，不适合放进进程池；
+    # 结果序列化与写文件以 I/O 为主，用线程即可
+    verifier = CodeVerifier(max_workers=workers)
+    try:
+        projects = await asyncio.gather(*(run_project(item, limiter, output_dir, verifier) for item in items))
+    finally:
+        verifier.close()
+    summary = {
+        'projects': projects,
+        'total': len(projects),
+        'succeeded': sum(1 for p in projects if p['status'] == 'success'),
+        'partial': sum(1 for p in projects if p['status'] == 'partial'),
+        'failed': sum(1 for p in projects if p['status'] == 'failed'),
+        'wall_time': time.perf_counter() - started,
+        'llm': metrics.report(),
+        'governor': governor.stats(),
+        'cache': response_cache.stats(),
+    }
+    with open(os.path.join(output_dir, "batch_summary.json"), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从 JSONL 文件批量生成多个项目")
+    parser.add_argument("input", help="需求 JSONL 文件，每行形如 {\"id\": \"...\", \"requirement\": \"...\"}")
+    parser.add_argument("--output-dir", default="batch_output", help="输出目录")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_BATCH_CONCURRENCY, help="所有项目共享的 LLM 并发上限")
+    parser.add_argument("--workers", type=int, default=2, help="代码检查进程池的进程数")
+    args = parser.parse_args(argv)
+
+    items = load_requirements(args.input)
+    print(f"读取到 {len(items)} 个需求")
+    summary = run_async(run_batch_async(items, args.output_dir, args.concurrency, args.workers))
+    print(f"\n📋 批处理完成: 成功 {summary['succeeded']}，部分成功 {summary['partial']}，"
+          f"失败 {summary['failed']}，耗时 {summary['wall_time']:.1f}s")
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
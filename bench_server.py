@@ -0,0 +1,296 @@
+# bench_server.py
+import re
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional
+
+# 本地 OpenAI 兼容桩服务的默认配置
+DEFAULT_STUB_CONFIG = {
+    "latency_median": 0.05,   # 首 token 前的服务端延迟中位数（秒），按对数正态分布采样
+    "latency_sigma": 0.5,     # 对数正态分布的 sigma，越大长尾越明显
+    "jitter": 0.01,           # 叠加的均匀抖动上限（秒）
+    "tokens_per_second": 2000.0,  # 生成速度，决定完成 token 的耗时
+    "error_429_rate": 0.0,    # 返回 429 的概率
+    "retry_after": 1,         # 429 响应中的 Retry-After（秒）
+    "modules": 10,            # 架构设计响应中的模块数量
+    "code_tokens": 300,       # 代码响应的大致 token 数
+    "invalid_code_rate": 0.0, # 返回语法错误代码的概率，用于压测代码检查与重新生成
+    "truncated_json_rate": 0.0,  # 需求分析 / 架构设计响应被截断的概率，用于压测结构化输出补全
+}
+
+STUB_ANALYSIS = {
+    "project_name": "bench_project",
+    "description": "压测用的合成项目",
+    "core_features": ["功能1", "功能2", "功能3"],
+    "optional_features": ["可选功能1"],
+    "technical_constraints": ["使用 Node.js 与 MongoDB"],
+    "summary": ["合成需求分析结果"]
+}
+
+
+def synthetic_architecture(modules: int, project_name: str = "bench_project") -> Dict:
+    """生成包含指定数量模块的合成架构，数据模型数量约为模块的四分之一"""
+    return {
+        "project_name": project_name,
+        "tech_stack": {
+            "frontend": "React",
+            "backend": "Node.js",
+            "database": "MongoDB",
+            "communication": "REST API",
+            "infrastructure": "Docker"
+        },
+        "modules": [
+            {
+                "name": f"Module{i}",
+                "description": f"合成模块 {i}，使用 Model{i % max(modules // 4, 1)}",
+                "interfaces": [
+                    {
+                        "name": f"listModel{i % max(modules // 4, 1)}s",
+                        "method": "GET",
+                        "endpoint": f"/api/model{i % max(modules // 4, 1)}s",
+                        "description": "查询"
+                    },
+                    {
+                        "name": f"createModel{i % max(modules // 4, 1)}",
+                        "method": "POST",
+                        "endpoint": f"/api/model{i % max(modules // 4, 1)}s",
+                        "description": "创建"
+                    }
+                ]
+            }
+            for i in range(modules)
+        ],
+        "data_models": [
+            {
+                "name": f"Model{i}",
+                "fields": [
+                    {"name": "id", "type": "string", "description": "主键"},
+                    {"name": "value", "type": "number", "description": "数值"}
+                ]
+            }
+            for i in range(max(modules // 4, 1))
+        ]
+    }
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(len(text) // 4, 1)
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """处理 /chat/completions 请求，按配置模拟延迟、限流与生成速度"""
+
+    config = DEFAULT_STUB_CONFIG
+    stats = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        try:
+            self._handle_post()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消了请求（例如对冲或超时），忽略即可
+            pass
+
+    def _handle_post(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.stats["lock"]:
+            self.stats["requests"] += 1
+
+        if random.random() < self.config["error_429_rate"]:
+            with self.stats["lock"]:
+                self.stats["rate_limited"] += 1
+            payload = json.dumps({"error": {"message": "rate limited", "type": "rate_limit"}}).encode()
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Retry-After", str(self.config["retry_after"]))
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        messages = body.get("messages", [])
+        system = messages[0]["content"] if messages else ""
+        prompt = messages[-1]["content"] if messages else ""
+        content = self._content_for(system, prompt, body.get("response_format") is not None)
+        usage = {
+            "prompt_tokens": _estimate_tokens(system + prompt),
+            "completion_tokens": _estimate_tokens(content),
+            "total_tokens": _estimate_tokens(system + prompt) + _estimate_tokens(content),
+            "prompt_cache_hit_tokens": self._cached_prefix_tokens(system + prompt),
+        }
+
+        delay = random.lognormvariate(0, self.config["latency_sigma"]) * self.config["latency_median"]
+        time.sleep(delay + random.uniform(0, self.config["jitter"]))
+        if body.get("stream"):
+            self._send_stream(body.get("model", ""), content, usage)
+        else:
+            time.sleep(usage["completion_tokens"] / self.config["tokens_per_second"])
+            self._send_json({
+                "id": "stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", ""),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+
+    def _cached_prefix_tokens(self, text: str) -> int:
+        """模拟服务端前缀缓存：与最近请求的最长公共前缀按 64 token 为单位命中"""
+        with self.stats["lock"]:
+            recent = self.stats["recent_prompts"]
+            longest = max((_common_prefix_length(text, previous) for previous in recent), default=0)
+            recent.append(text)
+            del recent[:-64]
+        return _estimate_tokens(text[:longest]) // 64 * 64 if longest else 0
+
+    def _content_for(self, system: str, prompt: str, json_output: bool) -> str:
+        """根据系统提示词判断调用阶段，返回对应的预置响应"""
+        if "需求分析师" in system or "架构师" in system:
+            if "上一次输出的 JSON 不完整" in prompt:
+                return self._missing_fields_for(system, prompt)
+            document = STUB_ANALYSIS if "需求分析师" in system else synthetic_architecture(self.config["modules"])
+            text = json.dumps(document, ensure_ascii=False, indent=2)
+            if random.random() < self.config["truncated_json_rate"]:
+                with self.stats["lock"]:
+                    self.stats["truncated_json"] += 1
+                text = text[:random.randint(len(text) // 3, len(text) - 2)]
+            return text
+        if json_output:
+            paths = re.findall(r'"file_path":\s*"([^"]+)"', prompt)
+            return json.dumps({"files": {path: self._code_for(path) for path in paths}}, ensure_ascii=False)
+        if "SEARCH/REPLACE" in prompt:
+            return self._patch_for(prompt)
+        match = re.search(r'文件路径:\s*(\S+)', prompt)
+        path = match.group(1) if match else ""
+        language = "python" if path.endswith(".py") else "javascript"
+        return f"```{language}\n{self._code_for(path)}\n```"
+
+    def _missing_fields_for(self, system: str, prompt: str) -> str:
+        """按补充请求中列出的键返回缺失部分（续写数组时返回剩余元素）"""
+        document = STUB_ANALYSIS if "需求分析师" in system else synthetic_architecture(self.config["modules"])
+        patch = {}
+        for key, start in re.findall(r'^- "(\w+)": 数组，包含 \w+ 中从第 (\d+) 个元素起', prompt, re.M):
+            patch[key] = document.get(key, [])[int(start) - 1:]
+        for key in re.findall(r'^- "(\w+)": 该字段完整的值', prompt, re.M):
+            patch[key] = document.get(key)
+        for key in re.findall(r'^- "(\w+)": 对象，键为元素下标', prompt, re.M):
+            patch[key] = {str(i): item for i, item in enumerate(document.get(key, []))}
+        return json.dumps(patch, ensure_ascii=False)
+
+    def _patch_for(self, prompt: str) -> str:
+        """补丁更新请求：在现有文件最后一个非空行之后追加一行，返回 SEARCH/REPLACE 块"""
+        match = re.search(r'现有文件内容:\n(.*?)\n\n请不要重新输出整个文件', prompt, re.S)
+        lines = [line for line in (match.group(1) if match else "").splitlines() if line.strip()]
+        last = lines[-1] if lines else ""
+        added = "patched = 1" if not last.rstrip().endswith(";") else "const patched = 1;"
+        return f"<<<<<<< SEARCH\n{last}\n=======\n{last}\n{added}\n>>>>>>> REPLACE"
+
+    def _code_for(self, path: str) -> str:
+        """按文件类型生成合成代码，按配置的概率混入语法错误"""
+        lines = self.config["code_tokens"] // 6
+        if path.endswith(".py"):
+            code = "\n".join(f"value{i} = {i}" for i in range(lines))
+        else:
+            code = "\n".join(f"const value{i} = {i};" for i in range(lines))
+        if random.random() < self.config["invalid_code_rate"]:
+            with self.stats["lock"]:
+                self.stats["invalid_code"] += 1
+            code += "\ndef broken(:\n"
+        return code
+
+    def _send_json(self, data: Dict):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, model: str, content: str, usage: Dict):
+        """以 SSE 形式按生成速度分块返回内容，最后发送 usage"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        step = 64
+        for start in range(0, len(content), step):
+            piece = content[start:start + step]
+            time.sleep(_estimate_tokens(piece) / self.config["tokens_per_second"])
+            self._send_event({"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                              "model": model, "choices": [{"index": 0, "delta": {"content": piece}}]})
+        self._send_event({"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                          "model": model, "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, data: Dict):
+        self.wfile.write(b"data: " + json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+
+class StubServer:
+    """在后台线程中运行的本地 OpenAI 兼容桩服务"""
+
+    def __init__(self, config: Optional[Dict] = None, host: str = "127.0.0.1", port: int = 0):
+        handler = type("ConfiguredStubHandler", (StubHandler,), {
+            "config": {**DEFAULT_STUB_CONFIG, **(config or {})},
+            "stats": {"requests": 0, "rate_limited": 0, "invalid_code": 0, "truncated_json": 0, "recent_prompts": [], "lock": threading.Lock()},
+        })
+        self.handler = handler
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def config(self) -> Dict:
+        return self.handler.config
+
+    @property
+    def stats(self) -> Dict:
+        return {k: v for k, v in self.handler.stats.items() if k not in ("lock", "recent_prompts")}
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    with StubServer(port=8765) as server:
+        print(f"桩服务已启动: {server.base_url}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
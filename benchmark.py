@@ -0,0 +1,367 @@
+# benchmark.py
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from typing import List, Dict
+
+from bench_server import StubServer, synthetic_architecture
+
+# 任务队列基准默认测量的模块数量
+QUEUE_SIZES = [100, 1000, 10000]
+
+# 在全新解释器中计时的导入语句
+IMPORT_SNIPPETS = {
+    "LLM_Engine": "import LLM_Engine",
+    "pretty_print": "from Analyst import pretty_print_analysis; from Software_Architect import pretty_print_architecture",
+    "openai": "import openai",
+    "first_client": "import LLM_Engine; LLM_Engine.clients.sync_client()",
+}
+
+try:
+    import resource
+except ImportError:  # Windows 下没有 resource 模块
+    resource = None
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存（MB）"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KB 为单位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_pipeline(module_count: int, server: StubServer, concurrency: int, stream: bool, templates: bool = False) -> Dict:
+    """对合成架构跑一遍需求分析 → 架构设计 → 任务执行，返回耗时与吞吐数据
+
+    合成架构（Node.js + MongoDB + Docker、纯 CRUD 接口）全部有本地模板，默认关闭模板以测量 LLM 调用。
+    """
+    import LLM_Engine
+    from llm_cache import LLMCache
+    from Analyst import analyze_requirements
+    from Software_Architect import design_architecture
+    from task_scheduler import TaskScheduler
+
+    server.config["modules"] = module_count
+    LLM_Engine.metrics.reset()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # 每轮使用全新的缓存与输出目录，保证所有调用都真正发往桩服务
+        LLM_Engine.response_cache = LLMCache(path=os.path.join(workdir, "cache.sqlite"))
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            timings = {}
+            started = time.perf_counter()
+            analysis = analyze_requirements("压测需求：一个合成的电商平台")
+            timings["analyze_requirements"] = time.perf_counter() - started
+
+            phase = time.perf_counter()
+            architecture = design_architecture(analysis)
+            timings["design_architecture"] = time.perf_counter() - phase
+            if "error" in architecture:
+                raise RuntimeError(architecture["error"])
+
+            phase = time.perf_counter()
+            scheduler = TaskScheduler(architecture, max_concurrency=concurrency, stream=stream, incremental=False,
+                                      templates=templates)
+            scheduler.create_project_structure()
+            task_count = scheduler.build_task_queue()
+            timings["build_task_queue"] = time.perf_counter() - phase
+
+            phase = time.perf_counter()
+            scheduler.execute_tasks(concurrent=concurrency > 1)
+            timings["execute_tasks"] = time.perf_counter() - phase
+            wall_time = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+
+    report = LLM_Engine.metrics.report()
+    return {
+        "modules": module_count,
+        "tasks": task_count,
+        "failed_tasks": len(scheduler.task_errors),
+        "templated_files": scheduler.template_stats["rendered"],
+        "wall_time": wall_time,
+        "phases": timings,
+        "llm_calls": report["calls"],
+        "calls_per_second": report["calls"] / wall_time if wall_time else 0.0,
+        "latency_p50": report["latency_p50"],
+        "latency_p95": report["latency_p95"],
+        "prompt_tokens": report["prompt_tokens"],
+        "routes": LLM_Engine.router.stats(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def measure_task_queue(module_count: int) -> Dict:
+    """不调用 LLM，测量构建任务队列、规划波次与渲染全部提示词的耗时和内存峰值"""
+    from task_scheduler import TaskScheduler
+
+    architecture = synthetic_architecture(module_count)
+    with tempfile.TemporaryDirectory() as workdir:
+        tracemalloc.start()
+        try:
+            scheduler = TaskScheduler(architecture, output_root=workdir)
+            scheduler._load_manifest()
+            timings = {}
+
+            phase = time.perf_counter()
+            task_count = scheduler.build_task_queue()
+            timings["build_task_queue"] = time.perf_counter() - phase
+            _, queue_peak = tracemalloc.get_traced_memory()
+
+            phase = time.perf_counter()
+            scheduler._plan_waves(scheduler.task_queue)
+            timings["plan_waves"] = time.perf_counter() - phase
+
+            phase = time.perf_counter()
+            prompt_chars = 0
+            for task in scheduler.iter_tasks():
+                if task.file_path:
+                    prompt, system = scheduler.prompt_builder.build(task)
+                    prompt_chars += len(prompt)
+            timings["render_prompts"] = time.perf_counter() - phase
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "modules": module_count,
+        "tasks": task_count,
+        "phases": timings,
+        "prompt_chars": prompt_chars,
+        "queue_peak_mb": queue_peak / (1024 * 1024),
+        "peak_mb": peak / (1024 * 1024),
+    }
+
+
+def measure_context(module_count: int) -> Dict:
+    """不调用 LLM，测量跨模块上下文检索：建索引与检索耗时、每个提示词附带的 token 数，
+    以及与附带完整架构（其余全部模块与数据模型的签名）相比节省的 token 数"""
+    from task_scheduler import TaskScheduler
+    from task_batching import estimate_tokens
+
+    architecture = synthetic_architecture(module_count)
+    with tempfile.TemporaryDirectory() as workdir:
+        scheduler = TaskScheduler(architecture, output_root=workdir, verify=False)
+        try:
+            phase = time.perf_counter()
+            index = scheduler._get_context_index()
+            build_seconds = time.perf_counter() - phase
+
+            prompt_tokens = 0
+            for task in scheduler.iter_tasks():
+                if task.file_path:
+                    prompt, system = scheduler._build_task_prompt(task)
+                    prompt_tokens += estimate_tokens(prompt)
+        finally:
+            scheduler.close()
+
+    stats = index.stats()
+    queries = stats["queries"] or 1
+    return {
+        "modules": module_count,
+        "documents": stats["documents"],
+        "index_seconds": build_seconds,
+        "query_ms": stats["seconds"] * 1000 / queries,
+        "context_tokens": stats["context_tokens"] / queries,
+        "full_tokens": stats["full_tokens"] / queries,
+        "prompt_tokens": prompt_tokens / queries,
+        "saved_ratio": stats["saved_tokens"] / stats["full_tokens"] if stats["full_tokens"] else 0.0,
+    }
+
+
+def measure_patch_updates(module_count: int, concurrency: int) -> Dict:
+    """先完整生成一次合成项目，再给每个模块新增一个接口，分别用补丁更新与完整重新生成
+    处理这次变化，比较输出 token 数与耗时（需要已配置好桩服务）"""
+    import shutil
+    import LLM_Engine
+    from llm_cache import LLMCache
+    from task_scheduler import TaskScheduler
+
+    def build(architecture: Dict, root: str, patch_updates: bool) -> Dict:
+        scheduler = TaskScheduler(architecture, max_concurrency=concurrency, output_root=root,
+                                  patch_updates=patch_updates, verify=False, templates=False)
+        try:
+            scheduler.create_project_structure()
+            scheduler.build_task_queue()
+            mark = LLM_Engine.metrics.mark()
+            started = time.perf_counter()
+            scheduler.execute_tasks(concurrent=concurrency > 1)
+            wall_time = time.perf_counter() - started
+        finally:
+            scheduler.close()
+        report = LLM_Engine.metrics.report(since=mark)
+        return {
+            "calls": report["calls"],
+            "completion_tokens": report["completion_tokens"],
+            "prompt_tokens": report["prompt_tokens"],
+            "latency_p50": report["latency_p50"],
+            "wall_time": wall_time,
+            "patched": scheduler.patch_stats["applied"],
+            "fallback": scheduler.patch_stats["fallback"],
+            "failed_tasks": len(scheduler.task_errors),
+        }
+
+    architecture = synthetic_architecture(module_count)
+    with tempfile.TemporaryDirectory() as workdir:
+        LLM_Engine.response_cache = LLMCache(path=os.path.join(workdir, "cache.sqlite"))
+        # 两种方式在同一个输出目录中进行（文件路径参与提示词与指纹），第二种开始前恢复第一次生成的结果
+        root = os.path.join(workdir, "output")
+        backup = os.path.join(workdir, "backup")
+        build(architecture, root, True)
+        shutil.copytree(root, backup)
+        for i, module in enumerate(architecture["modules"]):
+            module["interfaces"].append({
+                "name": f"delete{i}", "method": "DELETE", "endpoint": f"/api/module{i}", "description": "删除"
+            })
+        patch = build(architecture, root, True)
+        shutil.rmtree(root)
+        shutil.copytree(backup, root)
+        full = build(architecture, root, False)
+        return {"modules": module_count, "patch": patch, "full": full}
+
+
+def measure_import_time(repeats: int = 5) -> Dict:
+    """在全新子进程中测量各导入语句的耗时中位数（秒）
+
+    LLM_Engine 不再在导入时加载 openai，openai 一行即是推迟到第一次调用的开销。
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env.pop("DEEPSEEK_API_KEY", None)
+    results = {}
+    for name, snippet in IMPORT_SNIPPETS.items():
+        run_env = dict(env, DEEPSEEK_API_KEY="benchmark") if name == "first_client" else env
+        code = f"import time; t = time.perf_counter(); {snippet}; print(time.perf_counter() - t)"
+        samples = []
+        for _ in range(repeats):
+            output = subprocess.run([sys.executable, "-c", code], cwd=here, env=run_env,
+                                    capture_output=True, text=True, check=True).stdout
+            samples.append(float(output.strip().splitlines()[-1]))
+        results[name] = sorted(samples)[len(samples) // 2]
+    return results
+
+
+def print_queue_results(results: List[Dict]):
+    """打印任务队列的规模扩展曲线"""
+    print("\n📈 任务队列基准:")
+    print(f"{'模块数':>8} {'任务数':>8} {'构建(s)':>9} {'规划(s)':>9} {'渲染(s)':>9} {'队列峰值(MB)':>13} {'总峰值(MB)':>11}")
+    for r in results:
+        phases = r["phases"]
+        print(f"{r['modules']:>8} {r['tasks']:>8} {phases['build_task_queue']:>9.3f} {phases['plan_waves']:>9.3f} "
+              f"{phases['render_prompts']:>9.3f} {r['queue_peak_mb']:>13.2f} {r['peak_mb']:>11.2f}")
+
+
+def print_context_results(results: List[Dict]):
+    """打印跨模块上下文检索的规模扩展曲线（token 数为每个提示词的平均值）"""
+    print("\n📈 跨模块上下文基准:")
+    print(f"{'模块数':>8} {'文档数':>8} {'建索引(s)':>10} {'检索(ms)':>9} {'附带token':>10} {'完整架构token':>14} {'提示词token':>12} {'节省':>7}")
+    for r in results:
+        print(f"{r['modules']:>8} {r['documents']:>8} {r['index_seconds']:>10.3f} {r['query_ms']:>9.3f} "
+              f"{r['context_tokens']:>10.0f} {r['full_tokens']:>14.0f} {r['prompt_tokens']:>12.0f} {r['saved_ratio']:>7.1%}")
+
+
+def print_patch_results(results: List[Dict]):
+    """打印补丁更新与完整重新生成的对比"""
+    print("\n📈 补丁更新 vs 完整重新生成（每个模块新增一个接口）:")
+    print(f"{'模块数':>8} {'方式':>6} {'调用数':>8} {'输出token':>10} {'输入token':>10} {'p50(s)':>8} {'总耗时(s)':>10} {'补丁成功':>8}")
+    for r in results:
+        for mode in ("patch", "full"):
+            m = r[mode]
+            print(f"{r['modules']:>8} {mode:>6} {m['calls']:>8} {m['completion_tokens']:>10} {m['prompt_tokens']:>10} "
+                  f"{m['latency_p50']:>8.3f} {m['wall_time']:>10.2f} {m['patched']:>8}")
+
+
+def print_results(results: List[Dict]):
+    """打印规模扩展曲线"""
+    print("\n📈 压测结果:")
+    print(f"{'模块数':>8} {'任务数':>8} {'总耗时(s)':>10} {'调用数':>8} {'模板文件':>8} {'调用/秒':>8} {'p95(s)':>8} {'峰值RSS(MB)':>12}")
+    for r in results:
+        print(f"{r['modules']:>8} {r['tasks']:>8} {r['wall_time']:>10.2f} {r['llm_calls']:>8} {r['templated_files']:>8} "
+              f"{r['calls_per_second']:>8.1f} {r['latency_p95']:>8.3f} {r['peak_rss_mb']:>12.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="使用本地桩服务离线压测完整生成流程")
+    parser.add_argument("--sizes", type=int, nargs="+", help="合成架构的模块数量")
+    parser.add_argument("--queue", action="store_true", help="只测量任务队列的构建耗时与内存，不调用 LLM")
+    parser.add_argument("--context", action="store_true", help="只测量跨模块上下文检索的耗时与 token 节省，不调用 LLM")
+    parser.add_argument("--patch", action="store_true", help="比较补丁更新与完整重新生成的输出 token 数与耗时")
+    parser.add_argument("--templates", action="store_true", help="启用本地模板（合成架构的任务全部由模板生成）")
+    parser.add_argument("--import-time", action="store_true", help="只测量模块导入耗时")
+    parser.add_argument("--concurrency", type=int, default=8, help="任务执行并发数，1 表示串行")
+    parser.add_argument("--stream", action="store_true", help="使用流式生成")
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务延迟中位数（秒）")
+    parser.add_argument("--sigma", type=float, default=0.5, help="延迟对数正态分布的 sigma")
+    parser.add_argument("--jitter", type=float, default=0.01, help="延迟抖动上限（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="桩服务生成速度")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="注入 429 的概率")
+    parser.add_argument("--output", help="把结果以 JSON 写入该文件")
+    parser.add_argument("--trace", help="记录追踪并以 Chrome trace-event JSON 写入该文件（可在 Perfetto 中查看）")
+    parser.add_argument("--trace-sample-ms", type=float, default=0.0, help="追踪时同时运行采样分析器的采样间隔（毫秒）")
+    args = parser.parse_args(argv)
+
+    if args.import_time:
+        results = measure_import_time()
+        print("\n⏱️ 导入耗时（中位数）:")
+        for name, seconds in results.items():
+            print(f"- {name}: {seconds * 1000:.1f} ms")
+        return results
+
+    if args.queue or args.context:
+        if args.context:
+            results = [measure_context(size) for size in args.sizes or QUEUE_SIZES]
+            print_context_results(results)
+        else:
+            results = [measure_task_queue(size) for size in args.sizes or QUEUE_SIZES]
+            print_queue_results(results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        return results
+
+    config = {
+        "latency_median": args.latency,
+        "latency_sigma": args.sigma,
+        "jitter": args.jitter,
+        "tokens_per_second": args.tokens_per_second,
+        "error_429_rate": args.rate_429,
+    }
+    with StubServer(config) as server:
+        # 第一次调用模型时才创建客户端，这里设置的 API key 与接口地址即可生效
+        os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+        os.environ["DEEPSEEK_BASE_URL"] = server.base_url
+        import LLM_Engine
+        LLM_Engine.configure_client(base_url=server.base_url)
+
+        from tracing import tracer
+        if args.trace:
+            tracer.enable(args.trace_sample_ms)
+        if args.patch:
+            results = [measure_patch_updates(size, args.concurrency) for size in args.sizes or [10, 100]]
+            print_patch_results(results)
+        else:
+            results = [run_pipeline(size, server, args.concurrency, args.stream, args.templates) for size in args.sizes or [10, 100, 1000]]
+            print_results(results)
+        print(f"桩服务统计: {server.stats}")
+        if args.trace:
+            tracer.disable()
+            tracer.print_report()
+            print(f"追踪已导出: {tracer.export(args.trace)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# build_manifest.py
+import os
+import json
+import hashlib
+from typing import Callable, Dict, List, Optional
+
+# 构建清单文件名，保存在项目根目录下
+MANIFEST_FILE_NAME = ".codegen_manifest.json"
+
+
+def fingerprint(*parts) -> str:
+    """对任务的有效输入（提示词、系统提示词、模型、temperature 等）计算指纹"""
+    payload = json.dumps(list(parts), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    """记录每个任务上次成功生成时的输入指纹（用于增量构建）以及各类任务的历史耗时"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tasks = {}
+        self.latency = {}
+
+    @classmethod
+    def load(cls, project_dir: str) -> "BuildManifest":
+        """从项目目录读取构建清单，不存在或损坏时返回空清单"""
+        manifest = cls(os.path.join(project_dir, MANIFEST_FILE_NAME))
+        try:
+            with open(manifest.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            manifest.tasks = data.get('tasks', {})
+            manifest.latency = data.get('latency', {})
+        except (OSError, ValueError, AttributeError):
+            manifest.tasks = {}
+            manifest.latency = {}
+        return manifest
+
+    def is_up_to_date(self, task_key: str, task_fingerprint: str, output_paths: List[str],
+                      exists: Callable[[str], bool] = os.path.exists) -> bool:
+        """指纹未变化且输出文件都存在时，任务无需重新生成"""
+        entry = self.tasks.get(task_key)
+        if not entry or entry.get('fingerprint') != task_fingerprint:
+            return False
+        return all(exists(path) for path in output_paths)
+
+    def record(self, task_key: str, task_fingerprint: str, detail: Optional[Dict] = None):
+        """记录任务成功生成时的指纹，以及用于下次补丁更新的任务详情"""
+        entry = {'fingerprint': task_fingerprint}
+        if detail is not None:
+            entry['detail'] = detail
+        self.tasks[task_key] = entry
+
+    def save(self):
+        """写回构建清单"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'tasks': self.tasks, 'latency': self.latency}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
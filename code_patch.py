@@ -0,0 +1,138 @@
+# code_patch.py
+import re
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+from task_model import Task, MODULE_TASK
+
+# 现有文件超过该长度时不使用补丁更新（提示词过长，直接重新生成更划算）
+MAX_PATCH_SOURCE_CHARS = 40000
+
+_BLOCK_RE = re.compile(
+    r"<{5,9} ?SEARCH[^\n]*\n(.*?)\n?={5,9}[^\n]*\n(.*?)\n?>{5,9} ?REPLACE",
+    re.S
+)
+
+
+class PatchError(ValueError):
+    """补丁无法解析或无法应用到现有文件"""
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def _by_name(items: List) -> Dict[str, Dict]:
+    return {str(item.get('name')): item for item in items if isinstance(item, dict)}
+
+
+def task_snapshot(task: Task) -> Dict:
+    """记录在构建清单中的任务详情，下次构建时与新的架构比较得到变化"""
+    if task.type == MODULE_TASK:
+        return {'description': task.source.get('description'), 'interfaces': task.interfaces}
+    return {'fields': task.fields}
+
+
+def describe_delta(old: Dict, new: Dict) -> str:
+    """描述任务详情（模块接口或数据模型字段）的变化：新增、删除与修改的条目"""
+    lines = []
+    for key in sorted(set(old) | set(new)):
+        old_value, new_value = old.get(key), new.get(key)
+        if old_value == new_value:
+            continue
+        if isinstance(old_value, list) and isinstance(new_value, list):
+            before, after = _by_name(old_value), _by_name(new_value)
+            for name in after:
+                if name not in before:
+                    lines.append(f"- 新增 {key} 条目: {_dumps(after[name])}")
+                elif before[name] != after[name]:
+                    lines.append(f"- 修改 {key} 条目 {name}: {_dumps(before[name])} -> {_dumps(after[name])}")
+            for name in before:
+                if name not in after:
+                    lines.append(f"- 删除 {key} 条目: {name}")
+        else:
+            lines.append(f"- {key}: {_dumps(old_value)} -> {_dumps(new_value)}")
+    return "\n".join(lines)
+
+
+def parse_edits(text: str) -> List[Tuple[str, str]]:
+    """从响应中解析 SEARCH/REPLACE 块，返回 [(查找内容, 替换内容)]"""
+    edits = [(search, replace) for search, replace in _BLOCK_RE.findall(text)]
+    if not edits:
+        raise PatchError("响应中没有 SEARCH/REPLACE 块")
+    return edits
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _find_lines(content: str, search: str, normalize: Callable[[str], str]) -> Optional[Tuple[int, int, int]]:
+    """用 normalize 处理每行后逐行匹配，返回 (起始位置, 结束位置, 匹配的首行行号)；
+    没有找到时返回 None，匹配不唯一时报错"""
+    lines = content.splitlines(keepends=True)
+    wanted = [normalize(line) for line in search.splitlines()]
+    while wanted and not wanted[-1].strip():
+        wanted.pop()
+    while wanted and not wanted[0].strip():
+        wanted.pop(0)
+    if not wanted:
+        raise PatchError("SEARCH 内容为空")
+    normalized = [normalize(line) for line in lines]
+    matches = [
+        i for i in range(len(lines) - len(wanted) + 1)
+        if normalized[i:i + len(wanted)] == wanted
+    ]
+    if not matches:
+        return None
+    if len(matches) > 1:
+        raise PatchError(f"SEARCH 内容在文件中出现多次: {wanted[0].strip()[:80]}")
+    start = sum(len(line) for line in lines[:matches[0]])
+    end = start + sum(len(line) for line in lines[matches[0]:matches[0] + len(wanted)])
+    return start, end, matches[0]
+
+
+def _reindent(replace: str, search: str, matched_line: str) -> str:
+    """SEARCH 与原文缩进不同时，把 REPLACE 中相同的缩进差异一并改正"""
+    first = next((line for line in search.splitlines() if line.strip()), "")
+    wrong, right = _indent(first), _indent(matched_line)
+    if wrong == right:
+        return replace
+    fixed = []
+    for line in replace.splitlines(keepends=True):
+        if line.startswith(wrong) and line.strip():
+            line = right + line[len(wrong):]
+        fixed.append(line)
+    return "".join(fixed)
+
+
+def apply_edits(content: str, edits: List[Tuple[str, str]]) -> str:
+    """依次应用编辑，每个编辑的匹配必须唯一：
+
+    1. 精确匹配；
+    2. 忽略行尾空白逐行匹配（缩进必须一致）；
+    3. 忽略行首行尾空白逐行匹配，仅在唯一时使用，并按缩进差异调整替换内容。
+    """
+    for search, replace in edits:
+        count = content.count(search) if search.strip() else 0
+        if count == 1:
+            content = content.replace(search, replace, 1)
+            continue
+        if count > 1:
+            raise PatchError(f"SEARCH 内容在文件中出现多次: {search.strip().splitlines()[0][:80]}")
+        found = _find_lines(content, search, str.rstrip)
+        if found is None:
+            found = _find_lines(content, search, str.strip)
+            if found is None:
+                raise PatchError(f"SEARCH 内容在文件中没有找到: {search.strip().splitlines()[0][:80]}")
+            replace = _reindent(replace, search, content.splitlines()[found[2]])
+        start, end = found[0], found[1]
+        if replace and content[start:end].endswith("\n") and not replace.endswith("\n"):
+            replace += "\n"
+        content = content[:start] + replace + content[end:]
+    return content
+
+
+def apply_patch_response(content: str, response: str) -> str:
+    """解析并应用模型返回的补丁，失败时抛出 PatchError"""
+    return apply_edits(content, parse_edits(response))
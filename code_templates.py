@@ -0,0 +1,358 @@
+# code_templates.py
+import re
+from typing import Dict, List, Optional
+
+from task_model import Task, MODULE_TASK, DATA_MODEL_TASK
+
+# 字段类型（小写）到 Mongoose / SQLAlchemy 类型的映射；出现未知类型时不使用模板
+MONGOOSE_TYPES = {
+    'string': 'String', 'str': 'String', 'text': 'String', 'email': 'String', 'url': 'String', 'uuid': 'String',
+    'number': 'Number', 'int': 'Number', 'integer': 'Number', 'float': 'Number', 'double': 'Number', 'decimal': 'Number',
+    'boolean': 'Boolean', 'bool': 'Boolean',
+    'date': 'Date', 'datetime': 'Date', 'timestamp': 'Date',
+    'array': '[mongoose.Schema.Types.Mixed]', 'list': '[mongoose.Schema.Types.Mixed]',
+    'object': 'mongoose.Schema.Types.Mixed', 'json': 'mongoose.Schema.Types.Mixed', 'dict': 'mongoose.Schema.Types.Mixed',
+    'objectid': 'mongoose.Schema.Types.ObjectId',
+}
+SQLALCHEMY_TYPES = {
+    'string': 'String(255)', 'str': 'String(255)', 'email': 'String(255)', 'url': 'String(2048)', 'uuid': 'String(36)',
+    'text': 'Text',
+    'number': 'Float', 'float': 'Float', 'double': 'Float', 'decimal': 'Numeric(18, 4)',
+    'int': 'Integer', 'integer': 'Integer',
+    'boolean': 'Boolean', 'bool': 'Boolean',
+    'date': 'Date', 'datetime': 'DateTime', 'timestamp': 'DateTime',
+    'array': 'JSON', 'list': 'JSON', 'object': 'JSON', 'json': 'JSON', 'dict': 'JSON',
+}
+# 使用 SQLAlchemy 模板的数据库
+SQL_DATABASES = ('postgresql', 'mysql', 'sqlite', 'mariadb')
+# 标准 CRUD 接口的形式：(名称前缀, 操作, 允许的 HTTP 方法, 路径是否以 /:id 结尾)。
+# 接口名称必须恰好是 前缀 + 数据模型名（列表查询为复数），例如 getUser、listUsers、deleteUser；
+# 所有接口都符合时模块才使用 CRUD 路由模板，其他接口（如 searchProducts、addToCart）可能包含业务逻辑，由模型生成
+CRUD_OPERATIONS = (
+    ('list', 'list', ('GET',), False),
+    ('get', 'list', ('GET',), False),
+    ('get', 'read', ('GET',), True),
+    ('create', 'create', ('POST',), False),
+    ('update', 'update', ('PUT', 'PATCH'), True),
+    ('delete', 'delete', ('DELETE',), True),
+)
+# 配置文件模板使用的服务端口
+DEFAULT_PORT = {'node': 3000, 'python': 8000}
+
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _stack_value(tech_stack: Dict, key: str) -> str:
+    return str(tech_stack.get(key) or '').strip().lower()
+
+
+def _backend_kind(tech_stack: Dict) -> Optional[str]:
+    """后端技术栈归类为 node / python，其他技术栈返回 None（没有模板）"""
+    backend = _stack_value(tech_stack, 'backend')
+    if backend in ('node.js', 'nodejs', 'node', 'express'):
+        return 'node'
+    if backend in ('python', 'django', 'flask', 'fastapi'):
+        return 'python'
+    return None
+
+
+def _fields(model: Dict) -> Optional[List[Dict]]:
+    """校验字段名与类型都能直接映射，否则返回 None"""
+    fields = model.get('fields') or []
+    if not isinstance(fields, list) or not all(isinstance(field, dict) for field in fields):
+        return None
+    for field in fields:
+        if not _IDENTIFIER_RE.match(str(field.get('name', ''))):
+            return None
+    return fields
+
+
+def _class_name(name: str) -> Optional[str]:
+    return name[:1].upper() + name[1:] if _IDENTIFIER_RE.match(name or '') else None
+
+
+def render_mongoose_model(model: Dict) -> Optional[str]:
+    """MongoDB / Mongoose 数据模型；id 字段由 Mongoose 的 _id 代替"""
+    name = _class_name(str(model.get('name', '')))
+    fields = _fields(model)
+    if name is None or fields is None:
+        return None
+    lines = []
+    for field in fields:
+        if field['name'] in ('id', '_id'):
+            continue
+        field_type = MONGOOSE_TYPES.get(str(field.get('type', 'string')).lower())
+        if field_type is None:
+            return None
+        options = [f"type: {field_type}"]
+        if field.get('required'):
+            options.append("required: true")
+        if field.get('unique'):
+            options.append("unique: true")
+        comment = f"  // {field['description']}" if field.get('description') else ""
+        lines.append(f"  {field['name']}: {{ {', '.join(options)} }},{comment}")
+    body = "\n".join(lines)
+    return (
+        "const mongoose = require('mongoose');\n"
+        "\n"
+        f"const {name}Schema = new mongoose.Schema({{\n"
+        f"{body}\n"
+        "}, { timestamps: true });\n"
+        "\n"
+        f"module.exports = mongoose.model('{name}', {name}Schema);\n"
+    )
+
+
+def render_sqlalchemy_base() -> str:
+    """SQLAlchemy 数据模型共用的 Base（models/base.py），所有表注册在同一个元数据中"""
+    return (
+        "from sqlalchemy.orm import declarative_base\n"
+        "\n"
+        "Base = declarative_base()\n"
+    )
+
+
+def render_sqlalchemy_model(model: Dict) -> Optional[str]:
+    """关系型数据库 / SQLAlchemy 数据模型，继承 models/base.py 中共用的 Base；没有 id 字段时补充自增主键"""
+    name = _class_name(str(model.get('name', '')))
+    fields = _fields(model)
+    if name is None or name == 'Base' or fields is None:
+        return None
+    columns = []
+    types = set()
+    has_id = False
+    for field in fields:
+        field_name = field['name']
+        field_type = SQLALCHEMY_TYPES.get(str(field.get('type', 'string')).lower())
+        if field_type is None:
+            return None
+        types.add(field_type.split('(')[0])
+        options = []
+        if field_name == 'id':
+            has_id = True
+            options.append("primary_key=True")
+        elif field.get('required'):
+            options.append("nullable=False")
+        if field.get('unique'):
+            options.append("unique=True")
+        if field.get('description'):
+            options.append(f"comment={str(field['description'])!r}")
+        columns.append(f"    {field_name} = Column({', '.join([field_type] + options)})")
+    if not has_id:
+        types.add('Integer')
+        columns.insert(0, "    id = Column(Integer, primary_key=True, autoincrement=True)")
+    table = re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower() + 's'
+    return (
+        f"from sqlalchemy import Column, {', '.join(sorted(types))}\n"
+        "\n"
+        "from models.base import Base\n"
+        "\n"
+        "\n"
+        f"class {name}(Base):\n"
+        f"    __tablename__ = {table!r}\n"
+        "\n"
+        + "\n".join(columns) + "\n"
+        "\n"
+        "    def to_dict(self):\n"
+        "        return {column.name: getattr(self, column.name) for column in self.__table__.columns}\n"
+    )
+
+
+def render_model_base(tech_stack: Dict) -> Optional[str]:
+    """数据模型共用的基础文件，只有关系型数据库需要"""
+    if _stack_value(tech_stack, 'database') in SQL_DATABASES:
+        return render_sqlalchemy_base()
+    return None
+
+
+def render_data_model(tech_stack: Dict, model: Dict) -> Optional[str]:
+    """按数据库渲染数据模型，没有对应模板时返回 None"""
+    database = _stack_value(tech_stack, 'database')
+    if database == 'mongodb':
+        return render_mongoose_model(model)
+    if database in SQL_DATABASES:
+        return render_sqlalchemy_model(model)
+    return None
+
+
+def _crud_operation(interface: Dict, model_name: str) -> Optional[str]:
+    """接口是对 model_name 的标准增删改查时返回操作名，否则返回 None"""
+    name = re.sub(r'[_\-\s]', '', str(interface.get('name', ''))).lower()
+    method = str(interface.get('method', '')).upper()
+    segments = [segment for segment in str(interface.get('endpoint', '')).split('/') if segment]
+    if not str(interface.get('endpoint', '')).startswith('/') or any(segment.startswith(':') for segment in segments[:-1]):
+        return None
+    has_id = bool(segments) and segments[-1] == ':id'
+    if segments and segments[-1].startswith(':') and not has_id:
+        return None
+    model = model_name.lower()
+    # 路径必须以数据模型的集合结尾（如 /api/tasks 或 /api/tasks/:id），/tasks/archived 之类的不是标准操作
+    collection = segments[-2] if has_id and len(segments) > 1 else (segments[-1] if segments and not has_id else '')
+    if re.sub(r'[_\-]', '', collection).lower() not in (model, model + 's', model + 'es'):
+        return None
+    for prefix, operation, methods, with_id in CRUD_OPERATIONS:
+        names = (prefix + model + 's', prefix + model + 'es') if operation == 'list' else (prefix + model,)
+        if prefix == 'list':
+            names += (prefix + model,)
+        if method in methods and has_id == with_id and name in names:
+            return operation
+    return None
+
+
+def _referenced_model(module: Dict, data_models: List[Dict]) -> Optional[str]:
+    """模块名称、职责或接口路径中只提到一个数据模型时返回其名称"""
+    text = " ".join([str(module.get('name', '')), str(module.get('description', ''))] + [
+        str(interface.get('endpoint', '')) for interface in module.get('interfaces', []) if isinstance(interface, dict)
+    ])
+    names = {
+        str(model.get('name')) for model in data_models
+        if model.get('name') and re.search(rf"(?<![A-Za-z0-9_]){re.escape(str(model.get('name')))}(?![A-Za-z0-9_])", text, re.I)
+    }
+    return names.pop() if len(names) == 1 else None
+
+
+def render_express_crud(module: Dict, data_models: List[Dict]) -> Optional[str]:
+    """Express + Mongoose 的 CRUD 路由骨架；只有所有接口都是对单个数据模型的增删改查时才渲染"""
+    interfaces = [interface for interface in module.get('interfaces', []) if isinstance(interface, dict)]
+    model_name = _referenced_model(module, data_models)
+    if not interfaces or model_name is None:
+        return None
+    class_name = _class_name(model_name)
+    if class_name is None:
+        return None
+    handlers = []
+    for interface in interfaces:
+        operation = _crud_operation(interface, model_name)
+        if operation is None:
+            return None
+        endpoint = str(interface.get('endpoint', ''))
+        method = str(interface.get('method')).lower()
+        body = {
+            'list': f"    res.json(await {class_name}.find(req.query));",
+            'read': (f"    const item = await {class_name}.findById(req.params.id);\n"
+                     "    if (!item) return res.status(404).json({ error: 'Not found' });\n"
+                     "    res.json(item);"),
+            'create': f"    res.status(201).json(await {class_name}.create(req.body));",
+            'update': (f"    const item = await {class_name}.findByIdAndUpdate(req.params.id, req.body, {{ new: true, runValidators: true }});\n"
+                       "    if (!item) return res.status(404).json({ error: 'Not found' });\n"
+                       "    res.json(item);"),
+            'delete': (f"    const item = await {class_name}.findByIdAndDelete(req.params.id);\n"
+                       "    if (!item) return res.status(404).json({ error: 'Not found' });\n"
+                       "    res.status(204).end();"),
+        }[operation]
+        comment = f"// {interface.get('name')}: {interface.get('description')}\n" if interface.get('description') else ""
+        handlers.append(
+            f"{comment}router.{method}('{endpoint}', async (req, res, next) => {{\n"
+            "  try {\n"
+            f"{body}\n"
+            "  } catch (err) {\n"
+            "    next(err);\n"
+            "  }\n"
+            "});\n"
+        )
+    return (
+        "const express = require('express');\n"
+        f"const {class_name} = require('../models/{model_name.lower()}_schema');\n"
+        "\n"
+        "const router = express.Router();\n"
+        "\n"
+        + "\n".join(handlers) +
+        "\n"
+        "module.exports = router;\n"
+    )
+
+
+def render_module(tech_stack: Dict, module: Dict, data_models: List[Dict]) -> Optional[str]:
+    """只覆盖纯 CRUD 模块（Node.js + MongoDB），包含业务逻辑的模块仍由模型生成"""
+    if _backend_kind(tech_stack) == 'node' and _stack_value(tech_stack, 'database') == 'mongodb':
+        return render_express_crud(module, data_models)
+    return None
+
+
+def render_dockerfile(tech_stack: Dict) -> Optional[str]:
+    kind = _backend_kind(tech_stack)
+    if kind == 'node':
+        port = DEFAULT_PORT['node']
+        return (
+            "FROM node:18-alpine\n"
+            "WORKDIR /app\n"
+            "COPY package*.json ./\n"
+            "RUN npm install --omit=dev\n"
+            "COPY . .\n"
+            f"EXPOSE {port}\n"
+            'CMD ["node", "backend/server.js"]\n'
+        )
+    if kind == 'python':
+        port = DEFAULT_PORT['python']
+        backend = _stack_value(tech_stack, 'backend')
+        command = {
+            'django': f'["python", "backend/manage.py", "runserver", "0.0.0.0:{port}"]',
+            'fastapi': f'["uvicorn", "backend.main:app", "--host", "0.0.0.0", "--port", "{port}"]',
+        }.get(backend, '["python", "backend/app.py"]')
+        return (
+            "FROM python:3.11-slim\n"
+            "WORKDIR /app\n"
+            "COPY requirements.txt ./\n"
+            "RUN pip install --no-cache-dir -r requirements.txt\n"
+            "COPY . .\n"
+            f"EXPOSE {port}\n"
+            f"CMD {command}\n"
+        )
+    return None
+
+
+def render_k8s_deployment(project_name: str, tech_stack: Dict) -> str:
+    name = re.sub(r'[^a-z0-9-]+', '-', project_name.lower()).strip('-') or 'app'
+    port = DEFAULT_PORT.get(_backend_kind(tech_stack) or 'node')
+    return (
+        "apiVersion: apps/v1\n"
+        "kind: Deployment\n"
+        "metadata:\n"
+        f"  name: {name}\n"
+        "spec:\n"
+        "  replicas: 2\n"
+        "  selector:\n"
+        "    matchLabels:\n"
+        f"      app: {name}\n"
+        "  template:\n"
+        "    metadata:\n"
+        "      labels:\n"
+        f"        app: {name}\n"
+        "    spec:\n"
+        "      containers:\n"
+        f"        - name: {name}\n"
+        f"          image: {name}:latest\n"
+        "          ports:\n"
+        f"            - containerPort: {port}\n"
+        "---\n"
+        "apiVersion: v1\n"
+        "kind: Service\n"
+        "metadata:\n"
+        f"  name: {name}\n"
+        "spec:\n"
+        "  selector:\n"
+        f"    app: {name}\n"
+        "  ports:\n"
+        "    - port: 80\n"
+        f"      targetPort: {port}\n"
+    )
+
+
+def render_config(file_path: str, project_name: str, tech_stack: Dict) -> Optional[str]:
+    """按文件名渲染配置文件，没有对应模板时返回 None"""
+    file_name = file_path.replace('\\', '/').rsplit('/', 1)[-1]
+    if file_name == 'Dockerfile':
+        return render_dockerfile(tech_stack)
+    if file_name == 'k8s-deployment.yaml':
+        return render_k8s_deployment(project_name, tech_stack)
+    return None
+
+
+def render_task(task: Task, architecture: Dict) -> Optional[str]:
+    """用本地模板渲染任务的输出文件，没有适用的模板时返回 None（由模型生成）"""
+    tech_stack = architecture.get('tech_stack') or {}
+    if task.type == DATA_MODEL_TASK:
+        return render_data_model(tech_stack, task.source)
+    if task.type == MODULE_TASK:
+        return render_module(tech_stack, task.source, architecture.get('data_models') or [])
+    return None
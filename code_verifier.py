@@ -0,0 +1,139 @@
+# code_verifier.py
+import os
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Dict, List, Optional, Tuple
+
+# 外部检查工具配置 {扩展名: [命令参数列表, ...]}，命令中的 {path} 替换为待检查的文件路径。
+# 默认不启用，可通过环境变量 CODEGEN_LINTERS 以 JSON 形式配置，例如
+# {".js": [["node", "--check", "{path}"]], ".py": [["ruff", "check", "--quiet", "{path}"]]}
+DEFAULT_LINTERS = json.loads(os.environ.get("CODEGEN_LINTERS", "{}"))
+# 单个外部检查工具的超时（秒）
+LINTER_TIMEOUT = 30
+# 错误信息最多保留的字符数，避免把过长的输出塞进重新生成的提示词
+MAX_ERROR_CHARS = 2000
+
+
+def _check_python(path: str, content: str) -> Optional[str]:
+    """与 py_compile 相同的语法检查，但不写出 .pyc 文件"""
+    try:
+        compile(content, path, 'exec', dont_inherit=True)
+    except SyntaxError as e:
+        return f"Python 语法错误（第 {e.lineno} 行）: {e.msg}"
+    except ValueError as e:
+        return f"Python 源码无效: {str(e)}"
+    return None
+
+
+def _check_json(path: str, content: str) -> Optional[str]:
+    try:
+        json.loads(content)
+    except ValueError as e:
+        return f"JSON 格式错误: {str(e)}"
+    return None
+
+
+BUILTIN_CHECKS = {
+    '.py': _check_python,
+    '.json': _check_json,
+}
+
+
+def has_check(path: str, linters: Optional[Dict[str, List[List[str]]]] = None) -> bool:
+    """是否有内置检查或外部检查工具适用于该文件"""
+    suffix = os.path.splitext(path)[1].lower()
+    return suffix in BUILTIN_CHECKS or bool((linters or {}).get(suffix))
+
+
+def _run_linter(command: List[str], path: str, content: str) -> Optional[str]:
+    """把内容写入临时文件后运行外部检查工具；工具未安装时跳过"""
+    if shutil.which(command[0]) is None:
+        return None
+    suffix = os.path.splitext(path)[1]
+    with tempfile.TemporaryDirectory() as workdir:
+        tmp_path = os.path.join(workdir, "check" + suffix)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        args = [arg.replace("{path}", tmp_path) for arg in command]
+        try:
+            result = subprocess.run(args, capture_output=True, text=True, timeout=LINTER_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            return f"{command[0]} 检查超时"
+        if result.returncode == 0:
+            return None
+        output = (result.stdout + result.stderr).replace(tmp_path, os.path.basename(path)).strip()
+        return f"{command[0]} 检查失败: {output}"
+
+
+def verify_source(path: str, content: str, linters: Optional[Dict[str, List[List[str]]]] = None) -> Optional[str]:
+    """检查单个生成文件，通过时返回 None，否则返回错误信息
+
+    模块级函数，便于在进程池中执行。
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    check = BUILTIN_CHECKS.get(suffix)
+    error = check(path, content) if check else None
+    if error is None:
+        for command in (linters or {}).get(suffix, []):
+            error = _run_linter(command, path, content)
+            if error:
+                break
+    if error and len(error) > MAX_ERROR_CHARS:
+        error = error[:MAX_ERROR_CHARS] + "..."
+    return error
+
+
+def _verify_file_timed(path: str, linters: Optional[Dict[str, List[List[str]]]]) -> Tuple[Optional[str], float]:
+    """在检查进程中读取已写出的文件再检查，流式写出的文件不必把完整内容留在生成进程的内存中"""
+    started = time.perf_counter()
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            content = f.read()
+    except (OSError, ValueError) as e:
+        return f"读取文件失败: {str(e)}", time.perf_counter() - started
+    error = verify_source(path, content, linters)
+    return error, time.perf_counter() - started
+
+
+def _verify_timed(path: str, content: str, linters: Optional[Dict[str, List[List[str]]]]) -> Tuple[Optional[str], float]:
+    """verify_source 并返回检查耗时（秒）"""
+    started = time.perf_counter()
+    error = verify_source(path, content, linters)
+    return error, time.perf_counter() - started
+
+
+class CodeVerifier:
+    """在进程池中并行检查生成的文件，不阻塞仍在进行的生成任务
+
+    进程池在第一次提交时才创建；多个 TaskScheduler 可以共享同一个实例。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, linters: Optional[Dict[str, List[List[str]]]] = None):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.linters = DEFAULT_LINTERS if linters is None else linters
+        self._pool = None
+
+    def needs_check(self, path: str) -> bool:
+        """没有任何检查适用的文件（如 README）不提交到进程池"""
+        return has_check(path, self.linters)
+
+    def submit(self, path: str, content: str) -> Future:
+        """提交一个检查，返回结果为 (错误信息或 None, 检查耗时) 的 Future"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool.submit(_verify_timed, path, content, self.linters)
+
+    def submit_file(self, path: str) -> Future:
+        """提交一个已写入磁盘的文件，由检查进程读取内容"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool.submit(_verify_file_timed, path, self.linters)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -0,0 +1,234 @@
+# context_index.py
+import re
+import math
+import heapq
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from task_model import Task, MODULE_TASK
+from task_batching import estimate_tokens
+
+# 每个任务提示词中注入的相关签名数量上限与 token 预算
+DEFAULT_TOP_K = 8
+DEFAULT_CONTEXT_TOKENS = 800
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 出现在超过该比例文档中的词区分度很低，检索时跳过，避免每次查询遍历几乎全部文档
+MAX_DOCUMENT_FREQUENCY = 0.2
+# 文档数少于该值时不跳过常见词
+MIN_PRUNE_DOCUMENTS = 50
+# 从单个生成文件中提取的签名行数上限
+MAX_SIGNATURE_LINES = 30
+
+# 标识符（含 camelCase / snake_case 拆分）、数字与中文单字
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+|[\u4e00-\u9fff]")
+_PART_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+# 生成代码中可以作为签名的行：函数、类、导出与路由定义
+_SIGNATURE_RE = re.compile(
+    r"^\s*(?:async\s+def|def|class|(?:export\s+)?(?:default\s+)?(?:async\s+)?function|export|module\.exports"
+    r"|(?:router|app)\.(?:get|post|put|delete|patch)|@(?:app|router)\.)\b"
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """把文本切分为检索用的词：标识符保留整体并拆出各个组成部分，中文按单字"""
+    tokens = []
+    for word in _WORD_RE.findall(text):
+        lower = word.lower()
+        tokens.append(lower)
+        if len(word) > 1 and not word.isdigit():
+            parts = [part.lower() for part in _PART_RE.findall(word)]
+            if len(parts) > 1:
+                tokens.extend(parts)
+    return tokens
+
+
+def module_signature(module: Dict) -> str:
+    """模块在上下文中的签名：名称、职责与接口列表"""
+    lines = [f"模块 {module.get('name')}: {module.get('description', '')}"]
+    for interface in module.get('interfaces', []) or []:
+        if isinstance(interface, dict):
+            lines.append(f"  {interface.get('method', '')} {interface.get('endpoint', '')} "
+                         f"{interface.get('name', '')}: {interface.get('description', '')}")
+    return "\n".join(lines)
+
+
+def model_signature(model: Dict) -> str:
+    """数据模型在上下文中的签名：名称与字段"""
+    fields = ", ".join(
+        f"{field.get('name')}: {field.get('type', '')}".rstrip(': ')
+        for field in model.get('fields', []) or [] if isinstance(field, dict)
+    )
+    return f"数据模型 {model.get('name')}({fields})"
+
+
+def extract_signatures(content: str) -> List[str]:
+    """从生成的代码中提取函数、类、导出与路由定义行"""
+    signatures = []
+    for line in content.splitlines():
+        if _SIGNATURE_RE.match(line):
+            signatures.append(line.strip().rstrip('{').rstrip())
+            if len(signatures) >= MAX_SIGNATURE_LINES:
+                break
+    return signatures
+
+
+class SignatureCollector:
+    """流式写出文件时逐块提取签名，只保留尚未结束的一行与已提取的签名，不保存整个文件"""
+
+    def __init__(self):
+        self.signatures = []
+        self._line = ""
+
+    def feed(self, text: str):
+        if not text or len(self.signatures) >= MAX_SIGNATURE_LINES:
+            return
+        lines = (self._line + text).split('\n')
+        self._line = lines.pop()
+        for line in lines:
+            self._add(line)
+
+    def finish(self) -> List[str]:
+        if self._line:
+            self._add(self._line)
+            self._line = ""
+        return self.signatures
+
+    def _add(self, line: str):
+        if len(self.signatures) < MAX_SIGNATURE_LINES and _SIGNATURE_RE.match(line):
+            self.signatures.append(line.strip().rstrip('{').rstrip())
+
+
+class ContextIndex:
+    """模块、数据模型以及已生成文件签名的 BM25 倒排索引
+
+    文档以文件路径为标识，初始内容来自架构设计；文件生成后用代码中提取的签名增量更新，
+    每个任务的提示词只附带与其最相关的 top-k 个签名，并受 token 预算限制，
+    而不是把整个架构放进每一个提示词。
+    """
+
+    def __init__(self, top_k: int = DEFAULT_TOP_K, max_tokens: int = DEFAULT_CONTEXT_TOKENS):
+        self.top_k = top_k
+        self.max_tokens = max_tokens
+        # {词: {文档标识: 词频}}
+        self.postings = {}
+        # {文档标识: (架构签名, 完整签名文本, 文档长度, token 数, 词频)}
+        self.documents = {}
+        self._total_length = 0
+        self._total_tokens = 0
+        self._stats = {'queries': 0, 'seconds': 0.0, 'context_tokens': 0, 'full_tokens': 0, 'updates': 0}
+
+    @classmethod
+    def from_tasks(cls, tasks: Iterable[Task], **kwargs) -> "ContextIndex":
+        """用任务对应的模块与数据模型建立索引"""
+        index = cls(**kwargs)
+        for task in tasks:
+            if task.file_path:
+                index.add(task.file_path, task_signature(task))
+        return index
+
+    def add(self, doc_id: str, signature: str, code_signatures: Optional[List[str]] = None):
+        """加入或替换一个文档"""
+        self.remove(doc_id)
+        text = signature
+        if code_signatures:
+            text += "\n" + "\n".join(f"  {line}" for line in code_signatures)
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        tokens = estimate_tokens(text)
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        self.documents[doc_id] = (signature, text, length, tokens, terms)
+        self._total_length += length
+        self._total_tokens += tokens
+
+    def remove(self, doc_id: str):
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return
+        _, _, length, tokens, terms = document
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+        self._total_length -= length
+        self._total_tokens -= tokens
+
+    def update_file(self, doc_id: str, content: str) -> bool:
+        """文件写出后用代码中的签名更新对应文档；不在索引中的文件（如配置文件）忽略"""
+        return self.update_signatures(doc_id, extract_signatures(content))
+
+    def update_signatures(self, doc_id: str, signatures: List[str]) -> bool:
+        """用已提取的签名（见 SignatureCollector）更新对应文档"""
+        document = self.documents.get(doc_id)
+        if document is None:
+            return False
+        if signatures:
+            self.add(doc_id, document[0], signatures)
+            self._stats['updates'] += 1
+        return True
+
+    def search(self, query: str, top_k: Optional[int] = None, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """返回与查询最相关的 [(文档标识, 分数)]，只遍历查询词中非常见词的倒排表"""
+        count = len(self.documents)
+        if not count:
+            return []
+        average = self._total_length / count
+        max_postings = count * MAX_DOCUMENT_FREQUENCY if count >= MIN_PRUNE_DOCUMENTS else count
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting or len(posting) > max_postings:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, frequency in posting.items():
+                length = self.documents[doc_id][2]
+                norm = frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+        scores.pop(exclude, None)
+        return heapq.nlargest(top_k or self.top_k, scores.items(), key=lambda item: item[1])
+
+    def context_for(self, task: Task) -> str:
+        """任务提示词中附带的相关签名，按相关度依次加入直到 token 预算用完"""
+        if self.max_tokens <= 0 or task.file_path not in self.documents:
+            return ""
+        started = time.perf_counter()
+        lines = []
+        used = 0
+        for doc_id, _ in self.search(task_query(task), exclude=task.file_path):
+            text, tokens = self.documents[doc_id][1], self.documents[doc_id][3]
+            if used + tokens > self.max_tokens:
+                continue
+            lines.append(text)
+            used += tokens
+        self._stats['queries'] += 1
+        self._stats['seconds'] += time.perf_counter() - started
+        self._stats['context_tokens'] += used
+        # 对比：把其余所有模块与数据模型的签名都放进提示词所需的 token 数
+        self._stats['full_tokens'] += self._total_tokens - self.documents[task.file_path][3]
+        return "\n".join(lines)
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats['documents'] = len(self.documents)
+        stats['saved_tokens'] = stats['full_tokens'] - stats['context_tokens']
+        return stats
+
+
+def task_signature(task: Task) -> str:
+    """任务自身在索引中的签名"""
+    if task.type == MODULE_TASK:
+        return module_signature(task.source)
+    return model_signature(task.source)
+
+
+def task_query(task: Task) -> str:
+    """检索相关上下文的查询：模块用名称、职责与接口；数据模型只用名称，
+    字段名（id、name 等）在各个模型之间普遍重复，作为查询只会召回无关的模型"""
+    if task.type == MODULE_TASK:
+        return module_signature(task.source)
+    return str(task.name)
@@ -1,7 +1,8 @@
 import json
 from Analyst import analyze_requirements, pretty_print_analysis
 from Software_Architect import design_architecture, pretty_print_architecture
-from Task_Scheduler import build_project
+from task_scheduler import build_project
+from pipeline import run_pipeline
 
 def test_full_workflow():
     # 测试用例1：简单的任务管理系统
@@ -57,6 +58,30 @@ def test_full_workflow():
     print("✅ 全流程测试完成")
     print("="*50)
 
+def test_pipelined_workflow():
+    """流水线方式测试全流程：架构设计边流式输出边开始生成代码"""
+    test_input = """
+    开发一个小型电商平台，要求包含：
+    - 用户注册登录
+    - 商品浏览和搜索
+    - 购物车功能
+    - 订单管理
+    """
+    
+    print("="*50)
+    print("🚀 开始流水线全流程测试")
+    print("="*50)
+    # 模拟用户确认（在实际应用中应从用户获取）
+    result = run_pipeline(test_input, confirm=lambda analysis: True)
+    
+    if "error" in result:
+        print(f"流水线执行失败: {result['error']}")
+        return
+    
+    print("\n" + "="*50)
+    print("✅ 流水线全流程测试完成")
+    print("="*50)
+
 def debug_single_stage():
     """调试单个阶段（可选）"""
     # 可以直接在这里测试特定阶段的代码
@@ -79,5 +104,8 @@ if __name__ == "__main__":
     # 运行完整流程测试
     test_full_workflow()
     
+    # 或者以流水线方式运行
+    # test_pipelined_workflow()
+    
     # 或者调试单个阶段
     # debug_single_stage()
\ No newline at end of file
@@ -0,0 +1,141 @@
+# llm_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+# 缓存默认位置，可通过环境变量覆盖
+DEFAULT_CACHE_PATH = os.environ.get("CODEGEN_CACHE_PATH", ".llm_cache.sqlite")
+# 默认容量：最多 5000 条、200MB、保存 30 天
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+# 多个进程（批量构建、持久化队列的 worker）共享同一个缓存文件时，等待写锁的最长时间（秒）
+BUSY_TIMEOUT = 30.0
+# 每写入多少条执行一次淘汰；两次淘汰之间条目数最多超出上限这么多
+DEFAULT_EVICT_INTERVAL = 100
+
+
+def make_cache_key(model: str, system: str, prompt: str, temperature: float, json_output: bool) -> str:
+    """根据请求内容计算缓存键（内容寻址）"""
+    payload = json.dumps(
+        [model, system, prompt, temperature, json_output],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """基于 SQLite 的持久化 LLM 响应缓存，按 LRU 及存活时间淘汰"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES, max_age: float = DEFAULT_MAX_AGE,
+                 evict_interval: int = DEFAULT_EVICT_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = max(1, evict_interval)
+        self.hits = 0
+        self.misses = 0
+        # 距上次淘汰的写入次数；从 evict_interval 开始，第一次写入时就清理一次旧的缓存文件
+        self._puts_since_evict = self.evict_interval
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """首次使用时才打开数据库，避免导入时产生文件"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            # WAL 模式下读写互不阻塞，多个进程共享缓存时减少 database is locked
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON responses(created_at)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，过期条目视为未命中"""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """写入缓存，每 evict_interval 次写入执行一次淘汰
+
+        统计整表的条目数与体积需要扫描全表，不在每次写入时执行；
+        缓存文件可能被多个进程共享，也不在进程内维护累计值。
+        """
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode('utf-8')), now, now)
+            )
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= self.evict_interval:
+                self._puts_since_evict = 0
+                self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """删除过期条目，再按最近访问时间淘汰超出数量或体积上限的条目"""
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age,))
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+
+    def delete(self, key: str):
+        """删除一条缓存（例如生成的代码未通过检查），下次相同请求重新调用模型"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.commit()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self) -> dict:
+        """返回命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,140 @@
+# llm_clients.py
+import os
+import sys
+import asyncio
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+# 默认接口地址，可通过环境变量切换到其他 OpenAI 兼容服务（例如本地压测桩服务）
+DEFAULT_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+# 每个接口地址的连接池上限与保持活动连接数
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get("CODEGEN_MAX_CONNECTIONS", "100"))
+DEFAULT_MAX_KEEPALIVE = int(os.environ.get("CODEGEN_MAX_KEEPALIVE", "20"))
+# 空闲连接保持时间（秒）
+DEFAULT_KEEPALIVE_EXPIRY = float(os.environ.get("CODEGEN_KEEPALIVE_EXPIRY", "60"))
+
+
+class ClientRegistry:
+    """按接口地址复用的 OpenAI 客户端注册表
+
+    openai SDK 在第一次取客户端时才导入，客户端按 (base_url, api_key) 缓存，
+    同一接口地址的所有模型共享一个带保持活动连接的连接池。
+    模型可以通过 register_model 指向其他接口地址。
+    异步客户端的连接池绑定事件循环，因此按事件循环分别缓存，
+    需要在事件循环结束前调用 aclose_loop 关闭（见 LLM_Engine.run_async）。
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS, max_keepalive: int = DEFAULT_MAX_KEEPALIVE,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY):
+        self.base_url = base_url or DEFAULT_BASE_URL
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        # {模型: (base_url, api_key)}，未登记的模型使用默认接口
+        self.model_endpoints = {}
+        self._clients = {}
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def configure(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        """修改默认接口地址或 API key，已创建的客户端随之失效"""
+        with self._lock:
+            if base_url:
+                self.base_url = base_url
+            if api_key:
+                self.api_key = api_key
+            stale = list(self._clients.values())
+            self._clients = {}
+            stale_async = list(self._async_clients.items())
+            self._async_clients = weakref.WeakKeyDictionary()
+        for client in stale:
+            client.close()
+        for loop, clients in stale_async:
+            # 异步客户端只能在所属的事件循环中关闭；已经停止的事件循环中的连接随循环一起释放
+            if loop.is_running():
+                for client in clients.values():
+                    asyncio.run_coroutine_threadsafe(client.close(), loop)
+
+    def register_model(self, model: str, base_url: str, api_key: Optional[str] = None):
+        """让指定模型使用另外的接口地址（以及 API key）"""
+        with self._lock:
+            self.model_endpoints[model] = (base_url, api_key)
+
+    def endpoint(self, model: Optional[str] = None, base_url: Optional[str] = None,
+                 api_key: Optional[str] = None) -> Tuple[str, str]:
+        """返回模型对应的 (base_url, api_key)；显式传入的 base_url / api_key 优先（例如路由指定的备用接口）"""
+        registered_url, registered_key = self.model_endpoints.get(model, (None, None))
+        base_url = base_url or registered_url
+        api_key = api_key or registered_key or self.api_key or os.environ.get("DEEPSEEK_API_KEY")
+        if not api_key:
+            raise RuntimeError("未设置 DEEPSEEK_API_KEY 环境变量")
+        return base_url or self.base_url, api_key
+
+    def _limits(self):
+        # 连接池上限使用本模块的默认值；Limits 类型取自 SDK 默认 HTTP 客户端所属的库
+        # （不同 SDK 版本依赖 httpx 或 httpx2），不导入 SDK 的私有模块
+        from openai import DefaultHttpxClient
+        base = next(cls for cls in DefaultHttpxClient.__mro__ if not cls.__module__.startswith("openai"))
+        http_lib = sys.modules[base.__module__.split(".")[0]]
+        return http_lib.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def sync_client(self, model: Optional[str] = None, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        """取得（必要时创建）同步客户端"""
+        endpoint = self.endpoint(model, base_url, api_key)
+        with self._lock:
+            client = self._clients.get(endpoint)
+            if client is None:
+                from openai import OpenAI, DefaultHttpxClient
+                base_url, api_key = endpoint
+                # 重试由 governor 统一负责，关闭 SDK 自带的重试以便观察到每一次 429
+                client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                http_client=DefaultHttpxClient(limits=self._limits()))
+                self._clients[endpoint] = client
+            return client
+
+    def async_client(self, model: Optional[str] = None, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        """取得（必要时创建）当前事件循环中的异步客户端"""
+        endpoint = self.endpoint(model, base_url, api_key)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(endpoint)
+            if client is None:
+                from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+                base_url, api_key = endpoint
+                client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                     http_client=DefaultAsyncHttpxClient(limits=self._limits()))
+                clients[endpoint] = client
+            return client
+
+    async def aclose_loop(self):
+        """关闭当前事件循环中创建的异步客户端，应在事件循环结束前调用"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.pop(loop, {})
+        for client in clients.values():
+            await client.close()
+
+    def close(self):
+        """关闭所有同步客户端的连接池"""
+        with self._lock:
+            stale = list(self._clients.values())
+            self._clients = {}
+        for client in stale:
+            client.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'base_url': self.base_url,
+                'sync_clients': len(self._clients),
+                'async_clients': sum(len(clients) for clients in self._async_clients.values()),
+                'model_endpoints': {model: base_url for model, (base_url, _) in self.model_endpoints.items()},
+            }
@@ -0,0 +1,269 @@
+# llm_governor.py
+import os
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Callable, Optional, Awaitable, TypeVar
+
+T = TypeVar("T")
+
+# 默认限额，可通过环境变量按服务商的实际配额调整
+DEFAULT_RPM = int(os.environ.get("CODEGEN_RPM", "600"))
+DEFAULT_TPM = int(os.environ.get("CODEGEN_TPM", "2000000"))
+DEFAULT_MAX_RETRIES = 6
+# 需要重试的 HTTP 状态码
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = ("APIConnectionError", "APITimeoutError")
+
+
+class TokenBucket:
+    """令牌桶限流器，容量为一分钟的配额，采用预约方式计算需要等待的时间"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """预约 amount 个令牌，返回需要等待的秒数（令牌允许透支）"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def debit(self, amount: float):
+        """事后补扣令牌（例如实际消耗的完成 token），不阻塞"""
+        with self._lock:
+            self.tokens -= amount
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """读取错误响应中的 Retry-After 头（秒）"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """限流、服务端临时错误与网络错误可以重试"""
+    if _status_code(error) in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in RETRYABLE_ERRORS or isinstance(error, (ConnectionError, TimeoutError))
+
+
+def past_deadline(deadline: Optional[float], delay: float = 0.0) -> bool:
+    """deadline（time.monotonic() 读数）在 delay 秒内到达时返回 True"""
+    return deadline is not None and time.monotonic() + delay >= deadline
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RequestGovernor:
+    """所有 LLM 请求共享的调度器
+
+    - 请求数 / token 数两个令牌桶控制每分钟配额
+    - 并发上限按 AIMD 自适应：成功时缓慢增加，遇到 429 时减半
+    - 可重试错误按指数退避加随机抖动重试，优先遵循 Retry-After
+    - 给定截止时间（deadline）时，等待配额或重试会超过截止时间就不再等待，直接抛出
+    """
+
+    def __init__(self, rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM, initial_concurrency: int = 8,
+                 min_concurrency: int = 1, max_concurrency: int = 64, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_base: float = 0.5, backoff_cap: float = 30.0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.in_flight = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self._cond = threading.Condition()
+        # 等待并发名额的异步调用 [(事件循环, Future)]；governor 可能被多个线程中的事件循环共享，
+        # 名额释放或上限提高时通过 call_soon_threadsafe 唤醒
+        self._async_waiters = []
+
+    def _notify(self):
+        """唤醒所有等待并发名额的调用（调用方持有 _cond）"""
+        self._cond.notify_all()
+        for loop, waiter in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _leave(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._notify()
+
+    @contextmanager
+    def slot(self, estimated_tokens: int = 0, deadline: Optional[float] = None):
+        """同步占用一个请求名额（等待配额与并发上限），截止时间前等不到时抛出 TimeoutError"""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if past_deadline(deadline, wait):
+            raise TimeoutError("等待请求配额超出截止时间")
+        time.sleep(wait)
+        with self._cond:
+            while not (self.in_flight < int(self.limit)):
+                if past_deadline(deadline):
+                    raise TimeoutError("等待并发名额超出截止时间")
+                self._cond.wait(None if deadline is None else deadline - time.monotonic())
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            self._leave()
+
+    @asynccontextmanager
+    async def slot_async(self, estimated_tokens: int = 0, deadline: Optional[float] = None):
+        """slot 的异步版本，等待期间不阻塞事件循环"""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if past_deadline(deadline, wait):
+            raise TimeoutError("等待请求配额超出截止时间")
+        await asyncio.sleep(wait)
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    break
+                if past_deadline(deadline):
+                    raise TimeoutError("等待并发名额超出截止时间")
+                entry = (loop, loop.create_future())
+                self._async_waiters.append(entry)
+            try:
+                await asyncio.wait({entry[1]}, timeout=None if deadline is None else deadline - time.monotonic())
+            finally:
+                with self._cond:
+                    self._async_waiters.remove(entry)
+        try:
+            yield
+        finally:
+            self._leave()
+
+    def on_success(self):
+        """请求成功：加性增加并发上限"""
+        with self._cond:
+            previous = int(self.limit)
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+            if int(self.limit) > previous:
+                self._notify()
+
+    def retry_delay(self, error: Exception, attempt: int, deadline: Optional[float] = None) -> Optional[float]:
+        """返回下次重试前的等待秒数；不可重试、次数用尽或等待后已超过截止时间时返回 None
+
+        遇到 429 时并发上限减半（乘性减少）。
+        """
+        if _status_code(error) == 429:
+            with self._cond:
+                self.rate_limited += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, self.backoff_base)
+        else:
+            delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        if past_deadline(deadline, delay):
+            return None
+        self.retries += 1
+        return delay
+
+    def run(self, fn: Callable[[], T], estimated_tokens: int = 0, deadline: Optional[float] = None) -> T:
+        """在配额与并发控制下执行 fn，可重试错误自动退避重试，重试不超过截止时间"""
+        attempt = 0
+        while True:
+            try:
+                with self.slot(estimated_tokens, deadline):
+                    result = fn()
+                self.on_success()
+                return result
+            except Exception as e:
+                delay = self.retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+            print(f"LLM请求失败，{delay:.1f}秒后重试（第 {attempt + 1} 次）")
+            time.sleep(delay)
+            attempt += 1
+
+    async def run_async(self, fn: Callable[[], Awaitable[T]], estimated_tokens: int = 0,
+                        deadline: Optional[float] = None) -> T:
+        """run 的异步版本"""
+        attempt = 0
+        while True:
+            try:
+                async with self.slot_async(estimated_tokens, deadline):
+                    result = await fn()
+                self.on_success()
+                return result
+            except Exception as e:
+                delay = self.retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+            print(f"LLM请求失败，{delay:.1f}秒后重试（第 {attempt + 1} 次）")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> dict:
+        """返回当前并发上限与重试统计"""
+        return {
+            "concurrency_limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
+
+
+class AdaptiveLimiter:
+    """按 RequestGovernor 当前的 AIMD 并发上限放行任务的异步限制器
+
+    用作 TaskScheduler 的任务并发限制：成功时上限加性增加、遇到 429 时减半，
+    调度器同时执行的任务数随之变化；ceiling 为不超过的硬上限。
+    上限提高后在下一个任务结束时生效。
+    """
+
+    def __init__(self, governor: RequestGovernor, ceiling: Optional[int] = None):
+        self.governor = governor
+        self.ceiling = ceiling
+        self.in_use = 0
+        self._cond = None
+
+    @property
+    def limit(self) -> int:
+        limit = max(1, int(self.governor.limit))
+        return min(limit, self.ceiling) if self.ceiling else limit
+
+    async def __aenter__(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_use < self.limit)
+            self.in_use += 1
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_use -= 1
+            self._cond.notify_all()
@@ -0,0 +1,114 @@
+# llm_hedging.py
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Callable, Awaitable, Dict, Optional, TypeVar
+
+from llm_metrics import percentile
+
+T = TypeVar("T")
+
+# 每个阶段保留的最近耗时样本数，以及开始对冲前至少需要的样本数
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+
+
+class HedgePolicy:
+    """请求对冲策略
+
+    当一次调用的耗时超过所属阶段最近的 p95 时，再发出一个相同的请求，
+    取先完成的结果并取消另一个。对冲请求数不超过总请求数的 budget_ratio，
+    以限制额外花费。触发阈值只由主请求的耗时决定，不计入对冲缩短后的耗时。
+    """
+
+    def __init__(self, enabled: bool = False, quantile: float = 0.95, budget_ratio: float = 0.1):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.budget_ratio = budget_ratio
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        """记录一次成功调用的耗时"""
+        with self._lock:
+            self._latencies.setdefault(stage, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def threshold(self, stage: str):
+        """返回该阶段触发对冲的耗时阈值，样本不足时返回 None"""
+        with self._lock:
+            samples = list(self._latencies.get(stage, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return percentile(samples, self.quantile)
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.hedged + 1 > self.budget_ratio * self.requests:
+                return False
+            self.hedged += 1
+            return True
+
+    async def run(self, stage: str, make_call: Callable[[], Awaitable[T]], enabled: Optional[bool] = None,
+                  on_discard: Optional[Callable[[Optional[T], float], None]] = None) -> T:
+        """执行调用，必要时发出对冲请求；enabled 为 None 时使用策略的默认开关
+
+        成功时记录主请求的耗时（主请求被取消时记录取消前的耗时，即耗时的下限）。
+        对冲中落败的请求通过 on_discard(结果, 耗时) 交给调用方记录用量：
+        已完成的传入其结果，被取消的传入 None；失败的请求不回调。
+        """
+        with self._lock:
+            self.requests += 1
+        enabled = self.enabled if enabled is None else enabled
+        delay = self.threshold(stage) if enabled else None
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(make_call())
+        if delay is None:
+            result = await primary
+            self.observe(stage, time.perf_counter() - started)
+            return result
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self._take_budget():
+            result = await primary
+            self.observe(stage, time.perf_counter() - started)
+            return result
+
+        print(f"LLM调用超过 {stage} 阶段 p95（{delay:.1f}s），发出对冲请求")
+        hedge_started = time.perf_counter()
+        hedge = asyncio.ensure_future(make_call())
+        pending = {primary, hedge}
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if winner is None and task.exception() is None:
+                        winner = task
+            if winner is None:
+                # 两个请求都失败时抛出主请求的异常
+                return primary.result()
+            if winner is hedge:
+                with self._lock:
+                    self.hedge_wins += 1
+            return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            now = time.perf_counter()
+            if winner is not None and (winner is primary or primary in pending):
+                self.observe(stage, now - started)
+            if winner is not None and on_discard is not None:
+                loser = primary if winner is hedge else hedge
+                seconds = now - (started if loser is primary else hedge_started)
+                if loser in pending:
+                    on_discard(None, seconds)
+                elif loser.exception() is None:
+                    on_discard(loser.result(), seconds)
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "hedged": self.hedged, "hedge_wins": self.hedge_wins}
+
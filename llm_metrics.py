@@ -0,0 +1,162 @@
+# llm_metrics.py
+import json
+import math
+import threading
+from typing import List, Dict, Optional
+
+# 各模型每百万 token 的价格（美元），用于估算费用
+MODEL_PRICING = {
+    "deepseek-chat": {"input": 0.27, "cached_input": 0.07, "output": 1.10},
+    "deepseek-reasoner": {"input": 0.55, "cached_input": 0.14, "output": 2.19},
+}
+
+
+def read_usage(usage) -> Dict[str, int]:
+    """从响应的 usage 对象中提取 token 数，兼容 DeepSeek 与 OpenAI 的缓存字段"""
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": cached or 0,
+    }
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> float:
+    """按价格表估算单次调用费用（美元），未知模型按 0 计"""
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        return 0.0
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * pricing["input"]
+            + cached_tokens * pricing["cached_input"]
+            + completion_tokens * pricing["output"]) / 1_000_000
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩法计算分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _summarize(records: List[Dict]) -> Dict:
+    """汇总一组调用记录"""
+    latencies = [r["wall_time"] for r in records if not r["error"]]
+    ttfts = [r["ttft"] for r in records if r["ttft"] is not None]
+    return {
+        "calls": len(records),
+        "errors": sum(1 for r in records if r["error"]),
+        "wall_time_total": sum(r["wall_time"] for r in records),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "ttft_p50": percentile(ttfts, 0.5),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in records),
+        "completion_tokens": sum(r["completion_tokens"] for r in records),
+        "cached_tokens": sum(r["cached_tokens"] for r in records),
+        "cost_usd": sum(r["cost_usd"] for r in records),
+        "cache_hit_ratio": (sum(r["cached_tokens"] for r in records)
+                            / max(sum(r["prompt_tokens"] for r in records), 1)),
+    }
+
+
+class LLMMetrics:
+    """记录每次模型调用的耗时、token 用量与费用，并生成运行报告"""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, model: str, wall_time: float, usage=None,
+               ttft: Optional[float] = None, error: bool = False):
+        """记录一次调用"""
+        tokens = read_usage(usage)
+        record = {
+            "stage": stage,
+            "model": model,
+            "wall_time": wall_time,
+            "ttft": ttft,
+            "error": error,
+            "cost_usd": estimate_cost(model, **tokens),
+            **tokens,
+        }
+        with self._lock:
+            self.records.append(record)
+
+    def reset(self):
+        """清空记录，开始新一轮统计"""
+        with self._lock:
+            self.records = []
+
+    def mark(self) -> int:
+        """返回当前记录位置，配合 report(since=...) 统计某一段时间内的调用"""
+        with self._lock:
+            return len(self.records)
+
+    def report(self, since: int = 0) -> Dict:
+        """生成整体与按阶段汇总的报告；since 为 mark() 返回的位置时只统计之后的调用"""
+        with self._lock:
+            records = self.records[since:]
+        stages = {}
+        for r in records:
+            stages.setdefault(r["stage"], []).append(r)
+        report = _summarize(records)
+        report["by_stage"] = {stage: _summarize(items) for stage, items in stages.items()}
+        return report
+
+    def to_json(self) -> str:
+        """以 JSON 格式导出报告"""
+        return json.dumps(self.report(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        """以 Prometheus 文本格式导出按阶段汇总的指标"""
+        by_stage = self.report()["by_stage"]
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        metric("codegen_llm_calls_total", "counter", "LLM calls per stage",
+               [({"stage": s}, v["calls"]) for s, v in by_stage.items()])
+        metric("codegen_llm_errors_total", "counter", "Failed LLM calls per stage",
+               [({"stage": s}, v["errors"]) for s, v in by_stage.items()])
+        metric("codegen_llm_tokens_total", "counter", "Tokens per stage and kind",
+               [({"stage": s, "kind": kind}, v[f"{kind}_tokens"])
+                for s, v in by_stage.items() for kind in ("prompt", "completion", "cached")])
+        metric("codegen_llm_latency_seconds", "summary", "LLM call wall time",
+               [({"stage": s, "quantile": q}, v[f"latency_p{int(float(q) * 100)}"])
+                for s, v in by_stage.items() for q in ("0.5", "0.95")])
+        metric("codegen_llm_cost_usd_total", "counter", "Estimated LLM cost in USD",
+               [({"stage": s}, v["cost_usd"]) for s, v in by_stage.items()])
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_path: Optional[str] = None, prometheus_path: Optional[str] = None):
+        """把报告写入文件"""
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                f.write(self.to_json())
+        if prometheus_path:
+            with open(prometheus_path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+
+    def print_report(self):
+        """打印运行报告"""
+        report = self.report()
+        print("\n📊 LLM调用统计:")
+        print(f"调用次数: {report['calls']}（失败 {report['errors']}）")
+        print(f"延迟 p50/p95: {report['latency_p50']:.2f}s / {report['latency_p95']:.2f}s")
+        print(f"Token: 输入 {report['prompt_tokens']}（缓存命中 {report['cached_tokens']}） / 输出 {report['completion_tokens']}")
+        print(f"预估费用: ${report['cost_usd']:.4f}")
+        for stage, item in report["by_stage"].items():
+            print(f"- {stage}: {item['calls']} 次, p50 {item['latency_p50']:.2f}s, "
+                  f"p95 {item['latency_p95']:.2f}s, ${item['cost_usd']:.4f}")
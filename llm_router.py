@@ -0,0 +1,190 @@
+# llm_router.py
+import os
+import json
+import time
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# 路由策略配置：JSON 文本或 JSON 文件路径，未设置时所有调用使用调用方指定的模型与默认接口
+ROUTING_ENV = "CODEGEN_ROUTING"
+# 备用接口：未配置路由策略时，默认接口失败后改用该接口（以及可选的 API key 与模型）
+FALLBACK_BASE_URL = os.environ.get("DEEPSEEK_FALLBACK_BASE_URL")
+FALLBACK_API_KEY = os.environ.get("DEEPSEEK_FALLBACK_API_KEY")
+FALLBACK_MODEL = os.environ.get("CODEGEN_FALLBACK_MODEL")
+# 耗时与错误率的指数滑动平均系数
+EWMA_ALPHA = 0.2
+# 错误率超过该值（且样本足够）或连续失败达到次数后，路由暂停使用一段时间（秒）
+MAX_ERROR_RATE = 0.5
+MIN_ROUTE_SAMPLES = 5
+MAX_CONSECUTIVE_FAILURES = 3
+ROUTE_COOLDOWN = 30.0
+
+
+@dataclass
+class Route:
+    """一条路由：模型与接口地址
+
+    model 为空时使用调用方指定的模型；base_url 为空时使用默认接口。
+    max_output_tokens 大于 0 时只承接预计输出不超过该值的调用（例如用更快的小模型处理小任务）。
+    """
+    name: str
+    model: Optional[str] = None
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    max_output_tokens: int = 0
+    cost: float = 1.0
+
+
+class RouteStats:
+    """单条路由的实时统计"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.latency = None
+        self.error_rate = 0.0
+        self.total_seconds = 0.0
+        self.paused_until = 0.0
+
+    def record(self, seconds: float, error: bool):
+        self.calls += 1
+        self.total_seconds += seconds
+        self.error_rate += EWMA_ALPHA * ((1.0 if error else 0.0) - self.error_rate)
+        if error:
+            self.errors += 1
+            self.consecutive_failures += 1
+            if (self.consecutive_failures >= MAX_CONSECUTIVE_FAILURES
+                    or (self.calls >= MIN_ROUTE_SAMPLES and self.error_rate > MAX_ERROR_RATE)):
+                self.paused_until = time.monotonic() + ROUTE_COOLDOWN
+            return
+        self.consecutive_failures = 0
+        self.latency = seconds if self.latency is None else self.latency + EWMA_ALPHA * (seconds - self.latency)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.paused_until
+
+    def to_dict(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'error_rate': self.error_rate,
+            'latency_ewma': self.latency,
+            'latency_avg': self.total_seconds / self.calls if self.calls else None,
+            'paused': not self.healthy,
+        }
+
+
+def load_policy(value: Optional[str] = None) -> Dict:
+    """读取路由策略：参数或环境变量 CODEGEN_ROUTING，可以是 JSON 文本或 JSON 文件路径"""
+    value = value if value is not None else os.environ.get(ROUTING_ENV, "")
+    if not value.strip():
+        return {}
+    if value.lstrip().startswith("{"):
+        return json.loads(value)
+    with open(value, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class ModelRouter:
+    """按阶段、预计输出大小与实时耗时 / 错误率为每次调用选择模型与接口
+
+    路由策略格式:
+    {
+      "routes": {"fast": {"model": "...", "base_url": "...", "api_key_env": "...", "max_output_tokens": 1000, "cost": 0.5}, ...},
+      "stages": {"data_model": ["fast", "chat"], "module_implementation": ["chat"], "default": ["chat"]},
+      "fallback": ["backup"],
+      "strategy": "ordered" 或 "latency"
+    }
+    stages 为每个阶段（Analyst、Software_Architect 或任务类型）按优先级列出候选路由，
+    未列出的阶段使用 default，都没有时使用调用方指定的模型与默认接口。
+    strategy 为 latency 时，健康的候选路由按实时耗时 × cost 排序（没有样本的路由先试一次）；
+    暂停中的路由排在最后。所有候选失败后依次尝试 fallback 中的备用路由。
+    """
+
+    def __init__(self, policy: Optional[Dict] = None):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, RouteStats] = {}
+        self.configure(policy if policy is not None else load_policy())
+
+    def configure(self, policy: Dict):
+        """替换路由策略，已有的路由统计保留"""
+        routes = {}
+        for name, spec in (policy.get('routes') or {}).items():
+            api_key = spec.get('api_key') or (os.environ.get(spec['api_key_env']) if spec.get('api_key_env') else None)
+            routes[name] = Route(name, spec.get('model'), spec.get('base_url'), api_key,
+                                 int(spec.get('max_output_tokens', 0)), float(spec.get('cost', 1.0)))
+        fallback = list(policy.get('fallback') or [])
+        if not policy and FALLBACK_BASE_URL:
+            routes['fallback'] = Route('fallback', FALLBACK_MODEL, FALLBACK_BASE_URL, FALLBACK_API_KEY)
+            fallback = ['fallback']
+        unknown = [name for names in list((policy.get('stages') or {}).values()) + [fallback]
+                   for name in names if name not in routes]
+        if unknown:
+            raise ValueError(f"路由策略引用了未定义的路由: {', '.join(sorted(set(unknown)))}")
+        with self._lock:
+            self.policy = policy
+            self.routes = routes
+            self.stages = {stage: list(names) for stage, names in (policy.get('stages') or {}).items()}
+            self.fallback = fallback
+            self.strategy = policy.get('strategy', 'ordered')
+
+    def _route_stats(self, name: str) -> RouteStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = RouteStats()
+        return stats
+
+    def choose(self, stage: str, model: str, expected_tokens: Optional[int] = None) -> List[Route]:
+        """返回本次调用依次尝试的路由列表（首选在前，备用在后）"""
+        with self._lock:
+            names = self.stages.get(stage) or self.stages.get('default') or []
+            candidates = [
+                self.routes[name] for name in names
+                if not self.routes[name].max_output_tokens
+                or (expected_tokens is not None and expected_tokens <= self.routes[name].max_output_tokens)
+            ]
+            if not candidates:
+                candidates = [Route(model, model)]
+            if self.strategy == 'latency':
+                def latency_key(route):
+                    stats = self._stats.get(route.name)
+                    return -1.0 if stats is None or stats.latency is None else stats.latency * route.cost
+                candidates.sort(key=latency_key)
+            healthy = [route for route in candidates
+                       if route.name not in self._stats or self._stats[route.name].healthy]
+            ordered = healthy + [route for route in candidates if route not in healthy]
+            for name in self.fallback:
+                if self.routes[name] not in ordered:
+                    ordered.append(self.routes[name])
+        return [
+            Route(route.name, route.model or model, route.base_url, route.api_key, route.max_output_tokens, route.cost)
+            for route in ordered
+        ]
+
+    def record(self, route: Route, seconds: float, error: bool = False):
+        """记录一次调用在该路由上的结果"""
+        with self._lock:
+            self._route_stats(route.name).record(seconds, error)
+
+    def stats(self) -> Dict[str, Dict]:
+        """每条路由的统计 {路由名: {...}}"""
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+    def export(self, path: str):
+        """把路由统计写入 JSON 文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'strategy': self.strategy, 'routes': self.stats()}, f, ensure_ascii=False, indent=2)
+
+    def print_report(self):
+        stats = self.stats()
+        if len(stats) < 2 and not any(route['errors'] for route in stats.values()):
+            return
+        print("模型路由:")
+        for name, route in stats.items():
+            latency = f"{route['latency_ewma']:.2f}s" if route['latency_ewma'] is not None else "-"
+            paused = "，暂停中" if route['paused'] else ""
+            print(f"- {name}: {route['calls']} 次，失败 {route['errors']} 次，耗时 {latency}{paused}")
@@ -0,0 +1,361 @@
+# output_sink.py
+import io
+import os
+import time
+import hashlib
+import tarfile
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+# 写回磁盘的默认后台线程数
+DEFAULT_WRITE_WORKERS = 4
+# 流式写入临时文件的缓冲区大小（字节），缓冲区满时才写入磁盘，而不是每个 token 写一次
+STREAM_BUFFER_BYTES = 64 * 1024
+
+
+
+def _create_temp(path: str):
+    """在目标文件所在目录创建临时文件，返回 (文件对象, 路径)
+
+    与 open(path, 'w') 一样以 0o666 创建、由内核去掉进程的 umask，
+    不使用 tempfile（固定为 0600），也不需要修改进程级的 umask。
+    """
+    directory, name = os.path.split(path)
+    while True:
+        tmp_path = os.path.join(directory, f".{name}.{os.urandom(6).hex()}.tmp")
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        return os.fdopen(fd, 'w', buffering=STREAM_BUFFER_BYTES, encoding='utf-8', newline=''), tmp_path
+
+
+def content_hash(content: str) -> str:
+    """计算文件内容的哈希，用于跳过内容未变化的写入"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class SinkWriter:
+    """流式写入单个文件：write 追加内容，commit 提交，abort 丢弃
+
+    内容在内存中拼接、commit 时一次性写出，commit 返回写出的完整内容。
+    """
+
+    def __init__(self, sink: "OutputSink", path: str):
+        self.sink = sink
+        self.path = path
+        self._parts = []
+
+    def write(self, text: str):
+        if text:
+            self._parts.append(text)
+
+    def commit(self) -> Optional[str]:
+        content = "".join(self._parts)
+        self._parts = []
+        self.sink.write(self.path, content)
+        return content
+
+    def abort(self):
+        self._parts = []
+
+
+class OutputSink:
+    """生成文件的输出目标
+
+    TaskScheduler 只通过 write / open 输出文件，具体写到磁盘、内存还是归档由子类决定。
+    """
+    # 是否写入本地磁盘；只有磁盘输出才读写增量构建清单
+    persistent = False
+
+    def __init__(self):
+        self.written = 0
+        self.skipped = 0
+        # 写入失败的文件 {路径: 错误信息}，flush 之后完整
+        self.errors = {}
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def write(self, path: str, content: str):
+        """写入完整文件；内容与上次写入相同时跳过"""
+        digest = content_hash(content)
+        with self._lock:
+            if self._hashes.get(path) == digest:
+                self.skipped += 1
+                return
+            self._hashes[path] = digest
+            self.written += 1
+        self._write(path, content)
+
+    def _write(self, path: str, content: str):
+        raise NotImplementedError
+
+    def open(self, path: str) -> SinkWriter:
+        """打开一个流式写入器，内容在 commit 时一次性写出"""
+        return SinkWriter(self, path)
+
+    def makedirs(self, path: str):
+        """创建目录；非磁盘输出时无需操作"""
+
+    def exists(self, path: str) -> bool:
+        with self._lock:
+            return path in self._hashes
+
+    def read(self, path: str) -> Optional[str]:
+        """读回已写入的内容，不支持时返回 None"""
+        return None
+
+    def flush(self):
+        """等待所有尚未完成的写入"""
+
+    def close(self):
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {'written': self.written, 'skipped': self.skipped, 'errors': len(self.errors)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class _AtomicFileWriter(SinkWriter):
+    """边接收边写入同目录的临时文件，提交时原子替换目标文件
+
+    内容只经过固定大小的写缓冲区，不在内存中保留；commit 返回 None，需要内容时从磁盘读取。
+    """
+
+    def __init__(self, sink: "DirectorySink", path: str):
+        super().__init__(sink, path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._hasher = hashlib.sha256()
+        self._tmp, self._tmp_path = _create_temp(path)
+
+    def write(self, text: str):
+        if text:
+            self._tmp.write(text)
+            self._hasher.update(text.encode('utf-8'))
+
+    def commit(self) -> Optional[str]:
+        """与后台写入同样按路径加锁并更新版本号，排队中的旧内容不会在之后覆盖本次提交"""
+        self.sink._commit_stream(self)
+        return None
+
+    def _replace(self):
+        """关闭临时文件并替换目标文件（调用方持有该路径的锁）；已有文件保留原权限"""
+        self._tmp.close()
+        digest = self._hasher.hexdigest()
+        if self.sink._is_unchanged(self.path, digest):
+            os.unlink(self._tmp_path)
+            return
+        try:
+            try:
+                os.chmod(self._tmp_path, os.stat(self.path).st_mode & 0o7777)
+            except FileNotFoundError:
+                pass
+            os.replace(self._tmp_path, self.path)
+        except BaseException:
+            os.unlink(self._tmp_path)
+            raise
+
+    def abort(self):
+        self._tmp.close()
+        os.unlink(self._tmp_path)
+
+
+class DirectorySink(OutputSink):
+    """写入本地目录
+
+    每个文件先写入同目录的临时文件再 os.replace，崩溃时不会留下写了一半的文件；
+    write_behind=True 时由后台线程池写盘，不阻塞生成循环。
+    与磁盘上已有文件内容相同的写入会被跳过，避免无意义地改动文件修改时间。
+    """
+    persistent = True
+
+    def __init__(self, write_behind: bool = True, max_workers: int = DEFAULT_WRITE_WORKERS):
+        super().__init__()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="codegen-writer") if write_behind else None
+        self._pending = set()
+        # 同一路径的多次写入只保留最新版本，并且同一时间只有一个线程写同一路径
+        self._versions = {}
+        self._path_locks = {}
+
+    def _is_unchanged(self, path: str, digest: str) -> bool:
+        """与上次写入或磁盘上已有文件的内容哈希比较，相同则计为跳过"""
+        with self._lock:
+            known = self._hashes.get(path)
+        if known is None:
+            try:
+                hasher = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(STREAM_BUFFER_BYTES), b''):
+                        hasher.update(block)
+                known = hasher.hexdigest()
+            except OSError:
+                known = None
+        with self._lock:
+            self._hashes[path] = digest
+            if known == digest:
+                self.skipped += 1
+                return True
+            self.written += 1
+            return False
+
+    def write(self, path: str, content: str):
+        if self._executor is None:
+            self._write_now(path, content, None)
+            return
+        with self._lock:
+            version = self._versions.get(path, 0) + 1
+            self._versions[path] = version
+            future = self._executor.submit(self._write_now, path, content, version)
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def _commit_stream(self, writer: _AtomicFileWriter):
+        """提交流式写入：占用一个新版本号，使排队中的旧写入放弃，再在该路径的锁内替换文件"""
+        with self._lock:
+            self._versions[writer.path] = self._versions.get(writer.path, 0) + 1
+            path_lock = self._path_locks.setdefault(writer.path, threading.Lock())
+        with path_lock:
+            try:
+                writer._replace()
+            except BaseException:
+                with self._lock:
+                    self._hashes.pop(writer.path, None)
+                raise
+            with self._lock:
+                self.errors.pop(writer.path, None)
+
+    def _write_now(self, path: str, content: str, version: Optional[int]):
+        """在当前线程完成一次原子写入，失败时记录到 errors"""
+        with self._lock:
+            path_lock = self._path_locks.setdefault(path, threading.Lock())
+        with path_lock:
+            if version is not None:
+                with self._lock:
+                    if self._versions.get(path) != version:
+                        # 已有更新的内容排队等待写入
+                        return
+            try:
+                writer = _AtomicFileWriter(self, path)
+                try:
+                    writer.write(content)
+                except BaseException:
+                    writer.abort()
+                    raise
+                writer._replace()
+                with self._lock:
+                    self.errors.pop(path, None)
+            except Exception as e:
+                with self._lock:
+                    self._hashes.pop(path, None)
+                    self.errors[path] = f"写入文件失败: {str(e)}"
+
+    def open(self, path: str) -> SinkWriter:
+        return _AtomicFileWriter(self, path)
+
+    def makedirs(self, path: str):
+        os.makedirs(path, exist_ok=True)
+
+    def exists(self, path: str) -> bool:
+        with self._lock:
+            if path in self._versions:
+                return True
+        return os.path.exists(path)
+
+    def read(self, path: str) -> Optional[str]:
+        self.flush()
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def flush(self):
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                return
+            for future in pending:
+                future.result()
+
+    def close(self):
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+class MemorySink(OutputSink):
+    """内存中的虚拟文件系统，不接触磁盘，files 为 {路径: 内容}"""
+
+    def __init__(self):
+        super().__init__()
+        self.files = {}
+
+    def _write(self, path: str, content: str):
+        with self._lock:
+            self.files[path] = content
+
+    def read(self, path: str) -> Optional[str]:
+        with self._lock:
+            return self.files.get(path)
+
+
+class ArchiveSink(OutputSink):
+    """把生成的文件逐个流式写入 zip 或 tar(.gz) 归档
+
+    target 可以是文件路径或可写的文件对象（可以不支持 seek，例如 HTTP 响应流），
+    文件在生成完成时立即追加到归档中；root 之下的路径以相对路径存入归档。
+    同一路径再次写入不同内容时会追加新条目，解压时以最后一个为准。
+    """
+
+    def __init__(self, target, format: str = "zip", root: str = ""):
+        super().__init__()
+        self.root = root
+        self.format = format
+        self._archive_lock = threading.Lock()
+        if format == "zip":
+            self._archive = zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED)
+        elif format in ("tar", "tar.gz"):
+            mode = 'w|gz' if format == "tar.gz" else 'w|'
+            if isinstance(target, (str, os.PathLike)):
+                self._archive = tarfile.open(target, mode)
+            else:
+                self._archive = tarfile.open(fileobj=target, mode=mode)
+        else:
+            raise ValueError(f"不支持的归档格式: {format}")
+
+    def _arcname(self, path: str) -> str:
+        name = os.path.relpath(path, self.root) if self.root else path
+        return name.replace(os.sep, '/').lstrip('/')
+
+    def _write(self, path: str, content: str):
+        data = content.encode('utf-8')
+        name = self._arcname(path)
+        with self._archive_lock:
+            if self.format == "zip":
+                info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                self._archive.writestr(info, data)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                self._archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        with self._archive_lock:
+            self._archive.close()
@@ -0,0 +1,103 @@
+# pipeline.py
+import asyncio
+from typing import Dict, Callable, Optional
+
+from Analyst import analyze_requirements, pretty_print_analysis
+from Software_Architect import stream_architecture_async, pretty_print_architecture
+from task_scheduler import TaskScheduler, DEFAULT_MAX_CONCURRENCY
+from LLM_Engine import run_async
+
+
+async def _stream_design(analysis: Dict, scheduler: TaskScheduler, tasks: asyncio.Queue, approved: asyncio.Event):
+    """流式设计架构，把每个解析完整的模块、数据模型立即作为任务放入队列
+
+    设计在用户确认需求分析结果之前就开始，但确认（approved 被设置）之前只在内存中解析，
+    不创建项目目录、不写任何文件。
+    文件路径依赖 project_name 与 tech_stack，在两者解析出来之前到达的元素先暂存。
+    已解析的元素同时加入架构，使提示词的架构摘要与检索索引包含目前已知的模块与数据模型；
+    完整的列表解析出来后替换为最终结果。
+    """
+    architecture = scheduler.architecture
+    pending = []
+    structure_ready = False
+
+    def flush():
+        if pending:
+            scheduler.refresh_architecture()
+        for key, item in pending:
+            if key == 'modules':
+                tasks.put_nowait(scheduler.build_module_task(item))
+            else:
+                tasks.put_nowait(scheduler.build_data_model_task(item))
+        pending.clear()
+
+    try:
+        async for kind, key, value in stream_architecture_async(analysis):
+            if kind == 'field':
+                architecture[key] = value
+            elif key in ('modules', 'data_models') and isinstance(value, dict):
+                architecture.setdefault(key, []).append(value)
+                pending.append((key, value))
+            if (not structure_ready and approved.is_set()
+                    and 'project_name' in architecture and 'tech_stack' in architecture):
+                structure_ready = scheduler.create_project_structure()
+            if structure_ready:
+                flush()
+        await approved.wait()
+        if not structure_ready:
+            scheduler.create_project_structure()
+        flush()
+        scheduler.refresh_architecture()
+        tasks.put_nowait(scheduler.build_config_task())
+    finally:
+        tasks.put_nowait(None)
+
+
+async def run_pipeline_async(user_input: str, confirm: Optional[Callable[[Dict], bool]] = None,
+                             max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> Dict:
+    """流水线方式执行需求分析 → 架构设计 → 代码生成
+
+    - 需求分析完成后立即开始（推测性的）架构设计，同时等待用户确认分析结果
+    - 用户确认后，架构设计中每解析出一个模块就立即开始生成其代码
+    confirm 接收分析结果并返回是否继续，为 None 时视为自动确认。
+    """
+    analysis = await asyncio.to_thread(analyze_requirements, user_input)
+    pretty_print_analysis(analysis)
+    if "error" in analysis:
+        return {"analysis": analysis, "error": analysis["error"]}
+
+    tasks = asyncio.Queue()
+    approved = asyncio.Event()
+    scheduler = TaskScheduler({}, max_concurrency=max_concurrency)
+    try:
+        design = asyncio.ensure_future(_stream_design(analysis, scheduler, tasks, approved))
+        if confirm and not await asyncio.to_thread(confirm, analysis):
+            design.cancel()
+            await asyncio.gather(design, return_exceptions=True)
+            return {"analysis": analysis, "error": "用户未确认需求分析结果"}
+        approved.set()
+
+        generation = asyncio.ensure_future(scheduler.execute_task_stream_async(tasks))
+        try:
+            await design
+        except Exception as e:
+            await generation
+            return {"analysis": analysis, "error": f"架构设计过程异常: {str(e)}", "scheduler": scheduler}
+        await generation
+    finally:
+        scheduler.close()
+
+    pretty_print_architecture(scheduler.architecture)
+    scheduler.print_summary()
+    return {"analysis": analysis, "architecture": scheduler.architecture, "scheduler": scheduler}
+
+
+def run_pipeline(user_input: str, confirm: Optional[Callable[[Dict], bool]] = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> Dict:
+    """run_pipeline_async 的同步入口"""
+    return run_async(run_pipeline_async(user_input, confirm, max_concurrency))
+
+
+if __name__ == "__main__":
+    user_input = input("请输入您的需求描述: ")
+    run_pipeline(user_input, confirm=lambda analysis: input("\n是否确认以上分析结果？(y/n): ").strip().lower() == 'y')
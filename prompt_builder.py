@@ -0,0 +1,167 @@
+# prompt_builder.py
+import json
+from typing import Dict, Tuple, Optional
+
+from task_model import Task, MODULE_TASK
+
+# 所有代码生成任务共用的系统提示词，保证请求前缀逐字节一致
+TASK_SYSTEM_PROMPT = "你是一位资深软件开发工程师，专注于编写高质量、可维护的代码和数据模型。"
+
+SHARED_PREFIX_TEMPLATE = """
+你是一位资深软件开发工程师，现在需要根据架构设计实现具体的代码文件。
+
+请严格按照以下要求输出代码:
+1. 只返回代码内容，不要包含任何解释或注释
+2. 确保代码符合架构设计中指定的技术栈
+3. 代码应该完整可运行，包含必要的导入和依赖
+
+项目名称: {project_name}
+
+技术栈:
+{tech_stack}
+
+架构设计摘要:
+{architecture_digest}
+"""
+
+TASK_TAIL_TEMPLATE = """
+任务详情:
+{task_description}
+
+{detail_title}:
+{task_detail}
+
+文件路径: {file_path}
+"""
+
+CONTEXT_TAIL_TEMPLATE = """
+相关的其他模块与数据模型（调用其他模块或使用数据模型时请与这里的接口、字段保持一致）:
+{context}
+"""
+
+REPAIR_TAIL_TEMPLATE = """
+上一次生成的代码没有通过检查，请修正下面的错误后重新输出完整的文件内容。
+
+检查错误:
+{error}
+
+上一次生成的代码:
+{previous_code}
+"""
+
+PATCH_TAIL_TEMPLATE = """
+该文件已经存在，架构设计发生了以下变化:
+{delta}
+
+现有文件内容:
+{current_code}
+
+请不要重新输出整个文件，只输出实现上述变化所需的修改，格式为一个或多个 SEARCH/REPLACE 块，块之外不要输出任何内容:
+<<<<<<< SEARCH
+现有文件中需要替换的连续若干行（必须与现有文件逐字一致，并且在文件中唯一）
+=======
+替换后的内容
+>>>>>>> REPLACE
+新增代码时，SEARCH 中填写插入位置附近的几行，REPLACE 中保留这些行并加入新代码。
+"""
+
+CONFIG_TAIL_TEMPLATE = """
+任务详情:
+生成项目配置文件，与上面的技术栈和模块保持一致
+
+文件路径: {file_path}
+"""
+
+# 架构摘要的最大长度，超出时省略后面的模块，避免共享前缀过长
+MAX_DIGEST_CHARS = 20000
+
+
+def _dumps(value) -> str:
+    """稳定的 JSON 序列化，保证相同输入得到逐字节相同的文本"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, indent=2)
+
+
+class PromptBuilder:
+    """构造前缀缓存友好的任务提示词
+
+    所有任务共用同一个系统提示词，用户提示词以项目的共享前缀（技术栈与架构摘要）开头，
+    任务相关内容只出现在末尾，使同一次构建中的请求能命中服务商的前缀缓存。
+    共享前缀在首次使用时生成并固定。
+    """
+
+    def __init__(self, architecture: Dict):
+        self.architecture = architecture
+        self._shared_prefix: Optional[str] = None
+
+    @property
+    def shared_prefix(self) -> str:
+        if self._shared_prefix is None:
+            self._shared_prefix = SHARED_PREFIX_TEMPLATE.format(
+                project_name=self.architecture.get('project_name', 'my_project'),
+                tech_stack=_dumps(self.architecture.get('tech_stack', {})),
+                architecture_digest=self._architecture_digest()
+            )
+        return self._shared_prefix
+
+    def refresh(self):
+        """架构仍在变化时（流式设计）丢弃已生成的共享前缀，下次使用时按当前架构重新生成"""
+        self._shared_prefix = None
+
+    def _architecture_digest(self) -> str:
+        """所有模块与数据模型的简要说明（不含接口细节）"""
+        lines = ["模块:"]
+        for module in self.architecture.get('modules', []):
+            lines.append(f"- {module.get('name')}: {module.get('description', '')}")
+        lines.append("数据模型:")
+        for model in self.architecture.get('data_models', []):
+            field_names = ", ".join(str(field.get('name')) for field in model.get('fields', []) if isinstance(field, dict))
+            lines.append(f"- {model.get('name')}({field_names})")
+        digest = "\n".join(lines)
+        if len(digest) > MAX_DIGEST_CHARS:
+            digest = digest[:MAX_DIGEST_CHARS] + "\n...（其余内容省略）"
+        return digest
+
+    def task_tail(self, task: Task) -> str:
+        """提示词中与任务相关的部分（不含共享前缀与检索上下文）"""
+        if task.type == MODULE_TASK:
+            detail_title, detail = "模块接口", {'name': task.name, 'interfaces': task.interfaces}
+        else:
+            detail_title, detail = "数据模型字段", {'name': task.name, 'fields': task.fields}
+        return TASK_TAIL_TEMPLATE.format(
+            task_description=task.description,
+            detail_title=detail_title,
+            task_detail=_dumps(detail),
+            file_path=task.file_path
+        )
+
+    def fingerprint_input(self, task: Task) -> str:
+        """增量构建指纹使用的任务输入：技术栈与任务内容
+
+        不包含共享前缀中的架构摘要，修改一个模块的说明不会使其他所有任务失效。
+        """
+        return _dumps(self.architecture.get('tech_stack', {})) + self.task_tail(task)
+
+    def build(self, task: Task, context: str = "") -> Tuple[str, str]:
+        """返回 (提示词, 系统提示词)；context 为检索到的相关签名，附在任务内容之后"""
+        tail = self.task_tail(task)
+        if context:
+            tail += CONTEXT_TAIL_TEMPLATE.format(context=context)
+        return self.shared_prefix + tail, TASK_SYSTEM_PROMPT
+
+    def build_repair(self, task: Task, previous_code: str, error: str, context: str = "") -> Tuple[str, str]:
+        """在任务提示词末尾附上检查错误与上一次的代码，用于定向重新生成"""
+        prompt, system = self.build(task, context)
+        return prompt + REPAIR_TAIL_TEMPLATE.format(error=error, previous_code=previous_code), system
+
+    def build_patch(self, task: Task, current_code: str, delta: str, context: str = "") -> Tuple[str, str]:
+        """在任务提示词末尾附上现有文件与架构变化，要求只输出 SEARCH/REPLACE 修改"""
+        prompt, system = self.build(task, context)
+        return prompt + PATCH_TAIL_TEMPLATE.format(delta=delta, current_code=current_code), system
+
+    def build_config(self, file_path: str) -> Tuple[str, str]:
+        """没有本地模板的配置文件（例如非 Node.js / Python 后端的 Dockerfile）的提示词"""
+        return self.build_tail(CONFIG_TAIL_TEMPLATE.format(file_path=file_path))
+
+    def build_tail(self, tail: str) -> Tuple[str, str]:
+        """使用共享前缀拼接自定义的任务内容（例如批量任务）"""
+        return self.shared_prefix + tail, TASK_SYSTEM_PROMPT
@@ -0,0 +1,239 @@
+# similarity_cache.py
+import os
+import re
+import json
+import time
+import zlib
+import hashlib
+import random
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+# MinHash 签名长度与 LSH 分段（BANDS * ROWS 必须等于 NUM_PERM）
+NUM_PERM = 64
+BANDS = 16
+ROWS = 4
+# 中文需求较短，使用字符 2-gram 对少量改写更稳健
+SHINGLE_SIZE = 2
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定随机种子，保证签名在不同进程间一致，可持久化
+_rng = random.Random(1234)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+# 相似度达到 DEFAULT_REUSE_THRESHOLD 时直接复用结果，达到 DEFAULT_SEED_THRESHOLD 时作为参考提供给模型
+DEFAULT_REUSE_THRESHOLD = 0.9
+DEFAULT_SEED_THRESHOLD = 0.6
+DEFAULT_MAX_ENTRIES = 2000
+# 追加日志的行数超过当前条目数（且不少于该值）时合并进 JSON 文件
+LOG_COMPACT_MIN = 100
+# 需求分析与架构设计结果的索引文件
+ANALYSIS_INDEX_PATH = os.environ.get("CODEGEN_SIMILAR_ANALYSIS_PATH", ".similar_analyses.json")
+ARCHITECTURE_INDEX_PATH = os.environ.get("CODEGEN_SIMILAR_ARCHITECTURE_PATH", ".similar_architectures.json")
+
+
+def normalize(text: str) -> str:
+    """归一化需求文本：小写、去掉标点与空白"""
+    return re.sub(r'[\W_]+', '', text.lower())
+
+
+def shingles(text: str) -> Set[int]:
+    """字符 n-gram 集合（以 crc32 表示）"""
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {zlib.crc32(text.encode('utf-8'))}
+    return {zlib.crc32(text[i:i + SHINGLE_SIZE].encode('utf-8')) for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set: Set[int]) -> List[int]:
+    """计算 MinHash 签名"""
+    return [
+        min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in shingle_set)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """用签名估计 Jaccard 相似度"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+def _band_keys(signature: List[int]) -> List[str]:
+    return [f"{band}:" + ",".join(map(str, signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+class SimilarityCache:
+    """基于 MinHash/LSH 的近似重复需求索引
+
+    以需求文本为键保存分析、架构等结果；查询时返回最相似的条目及相似度。
+    条目数量有上限，按最近使用时间淘汰，可持久化到 JSON 文件：
+    新条目追加到旁边的 .log 文件（每行一个条目），日志较长时再合并重写 JSON 文件。
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.buckets: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._log_lines = 0
+        if path:
+            self._load()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(normalize(text).encode('utf-8')).hexdigest()
+
+    def lookup(self, text: str) -> Optional[Tuple[Dict, float]]:
+        """返回 (最相似条目的数据, 相似度)，没有候选时返回 None"""
+        signature = minhash(shingles(text))
+        with self._lock:
+            candidates = set()
+            for band_key in _band_keys(signature):
+                candidates |= self.buckets.get(band_key, set())
+            best = None
+            for key in candidates:
+                similarity = estimate_similarity(signature, self.entries[key]['signature'])
+                if best is None or similarity > best[1]:
+                    best = (key, similarity)
+            if best is None:
+                return None
+            self.entries.move_to_end(best[0])
+            return self.entries[best[0]]['data'], best[1]
+
+    def add(self, text: str, data: Dict):
+        """加入或更新一个条目，超出容量时淘汰最久未使用的条目"""
+        signature = minhash(shingles(text))
+        key = self._key(text)
+        entry = {'text': text, 'signature': signature, 'data': data}
+        with self._lock:
+            self._insert(key, entry)
+            if not self.path:
+                return
+            with open(self._log_path(), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._log_lines += 1
+            compact = self._log_lines > max(len(self.entries), LOG_COMPACT_MIN)
+        if compact:
+            self.save()
+
+    def _insert(self, key: str, entry: Dict):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = entry
+        for band_key in _band_keys(entry['signature']):
+            self.buckets.setdefault(band_key, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def _log_path(self) -> str:
+        return self.path + '.log'
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key)
+        for band_key in _band_keys(entry['signature']):
+            bucket = self.buckets.get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def _load(self):
+        """读取 JSON 文件，再按顺序重放追加日志"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        for entry in entries[-self.max_entries:]:
+            self._insert(self._key(entry['text']), entry)
+        try:
+            with open(self._log_path(), 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._log_lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 写入中断留下的不完整行
+                        continue
+                    self._insert(self._key(entry['text']), entry)
+        except OSError:
+            pass
+
+    def save(self):
+        """按最近使用顺序重写 JSON 文件并清空追加日志"""
+        with self._lock:
+            entries = list(self.entries.values())
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            if os.path.exists(self._log_path()):
+                os.remove(self._log_path())
+            self._log_lines = 0
+
+
+def seed_prompt(prompt: str, seed: Dict, title: str) -> str:
+    """把相似需求的历史结果作为参考附加到提示词末尾"""
+    return f"{prompt}\n\n{title}（仅供参考，请根据当前需求修改）:\n{json.dumps(seed, ensure_ascii=False)}"
+
+
+def _mutate(text: str, rng: random.Random, edits: int) -> str:
+    """对文本做少量随机的字符删除、替换与插入"""
+    chars = list(text)
+    for _ in range(edits):
+        op = rng.random()
+        i = rng.randrange(len(chars))
+        if op < 0.33 and len(chars) > 1:
+            del chars[i]
+        elif op < 0.66:
+            chars[i] = rng.choice("的了和与及需要功能系统")
+        else:
+            chars.insert(i, rng.choice("，。 用户支持"))
+    return "".join(chars)
+
+
+def benchmark(base_count: int = 200, variants: int = 5, edits: int = 4, threshold: float = DEFAULT_SEED_THRESHOLD):
+    """离线评估召回率、误匹配率与查询延迟
+
+    以合成需求为基础，每条生成若干处轻微修改的变体，统计变体能否命中其原始需求。
+    """
+    rng = random.Random(42)
+    vocabulary = ["任务", "管理", "用户", "注册", "登录", "商品", "订单", "购物车", "搜索", "评论",
+                  "博客", "文章", "标签", "分类", "提醒", "支付", "库存", "报表", "权限", "消息"]
+    bases = ["我需要开发一个" + "、".join(rng.sample(vocabulary, 6)) + "的系统，支持" + "和".join(rng.sample(vocabulary, 3))
+             for _ in range(base_count)]
+    cache = SimilarityCache(max_entries=base_count)
+    for i, text in enumerate(bases):
+        cache.add(text, {'id': i})
+
+    hits = false_matches = 0
+    latencies = []
+    for i, text in enumerate(bases):
+        for _ in range(variants):
+            query = _mutate(text, rng, edits)
+            started = time.perf_counter()
+            found = cache.lookup(query)
+            latencies.append(time.perf_counter() - started)
+            if found and found[1] >= threshold:
+                if found[0]['id'] == i:
+                    hits += 1
+                else:
+                    false_matches += 1
+    latencies.sort()
+    total = base_count * variants
+    result = {
+        'queries': total,
+        'recall': hits / total,
+        'false_match_rate': false_matches / total,
+        'latency_p50_ms': latencies[len(latencies) // 2] * 1000,
+        'latency_p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+    print(f"查询数: {total}，召回率: {result['recall']:.1%}，误匹配率: {result['false_match_rate']:.1%}，"
+          f"延迟 p50/p95: {result['latency_p50_ms']:.2f}ms / {result['latency_p95_ms']:.2f}ms")
+    return result
+
+
+if __name__ == "__main__":
+    benchmark()
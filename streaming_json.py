@@ -0,0 +1,129 @@
+# streaming_json.py
+import json
+from typing import List, Tuple, Any
+
+WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    """增量解析流式输出的 JSON 对象
+
+    逐块输入文本，返回已经完整的事件：
+    - ("item", key, value)：顶层字段 key 对应数组中的一个对象元素已完整（例如 modules 中的一个模块）
+    - ("field", key, value)：顶层字段 key 的值已完整
+    只解析顶层对象的字段与顶层数组中的对象元素，其余内容在完整后一次性解析。
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.expect_key = False
+        self.value_pending = False
+        self.item_pending = False
+        self.key = None
+        self.key_start = None
+        self.value_start = None
+        self.item_start = None
+        self.result = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        """输入一段文本，返回新完成的事件列表"""
+        self.buffer += chunk
+        events = []
+        buffer = self.buffer
+        while self.pos < len(buffer):
+            i = self.pos
+            c = buffer[i]
+            self.pos += 1
+            depth = len(self.stack)
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if depth == 1 and self.key_start is not None:
+                        self.key = json.loads(buffer[self.key_start:i + 1])
+                        self.key_start = None
+                    elif depth == 1 and self.value_start is not None:
+                        self._emit_field(events, buffer[self.value_start:i + 1])
+                continue
+
+            if c in WHITESPACE:
+                continue
+
+            if c == '"':
+                self.in_string = True
+                if depth == 1 and self.expect_key:
+                    self.key_start = i
+                    self.expect_key = False
+                elif depth == 1 and self.value_pending:
+                    self.value_start = i
+                    self.value_pending = False
+                elif depth == 2:
+                    self.item_pending = False
+                continue
+
+            if c in "{[":
+                if depth == 1 and self.value_pending:
+                    self.value_start = i
+                    self.value_pending = False
+                elif depth == 2 and self.item_pending:
+                    self.item_start = i
+                    self.item_pending = False
+                self.stack.append(c)
+                if len(self.stack) == 1:
+                    self.expect_key = c == "{"
+                elif len(self.stack) == 2:
+                    self.item_pending = c == "["
+                continue
+
+            if c in "}]":
+                if depth == 1 and self.value_start is not None:
+                    # 顶层对象结束时，最后一个字段是数字或字面量
+                    self._emit_field(events, buffer[self.value_start:i])
+                if self.stack:
+                    self.stack.pop()
+                depth = len(self.stack)
+                if depth == 2 and self.item_start is not None:
+                    item = json.loads(buffer[self.item_start:i + 1])
+                    self.item_start = None
+                    events.append(("item", self.key, item))
+                elif depth == 1 and self.value_start is not None:
+                    self._emit_field(events, buffer[self.value_start:i + 1])
+                continue
+
+            if c == ":" and depth == 1:
+                self.value_pending = True
+                continue
+
+            if c == ",":
+                if depth == 1:
+                    if self.value_start is not None:
+                        self._emit_field(events, buffer[self.value_start:i])
+                    self.expect_key = True
+                elif depth == 2 and self.stack[-1] == "[":
+                    self.item_pending = True
+                continue
+
+            # 数字、true/false/null 等字面量的开始
+            if depth == 1 and self.value_pending:
+                self.value_start = i
+                self.value_pending = False
+        return events
+
+    def _emit_field(self, events: List, text: str):
+        value = json.loads(text.strip())
+        self.value_start = None
+        self.result[self.key] = value
+        events.append(("field", self.key, value))
+
+    @property
+    def complete(self) -> bool:
+        """顶层对象是否已经结束"""
+        return bool(self.buffer.strip()) and not self.stack and not self.in_string
@@ -0,0 +1,325 @@
+# structured_output.py
+import re
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from LLM_Engine import call_llm
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库 json
+    orjson = None
+
+# 校验未通过时最多补充请求的轮数
+MAX_REPAIR_ROUNDS = 2
+
+MISSING_FIELDS_TEMPLATE = """
+{prompt}
+
+上一次输出的 JSON 不完整（被截断或缺少字段），已经得到的部分如下:
+{partial}
+
+请不要重复已有内容，只输出缺失的部分。输出一个 JSON 对象，只包含以下键:
+{instructions}
+"""
+
+_FENCE_RE = re.compile(r"```[A-Za-z0-9_-]*\s*\n?(.*?)(?:```|$)", re.S)
+_PATH_RE = re.compile(r"^([^.\[]+)(?:\[(\d+)\])?")
+
+
+class StructuredOutputError(ValueError):
+    """响应无法解析或补全后仍不符合 schema"""
+
+
+def loads(text: str) -> Any:
+    """解析 JSON，安装了 orjson 时使用 orjson"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def dumps(value: Any) -> str:
+    """序列化为 JSON 文本（保留中文）"""
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value, ensure_ascii=False)
+
+
+def extract_json(text: str) -> str:
+    """从响应中取出 JSON 部分：去掉 markdown 代码块标记以及 JSON 前后的说明文字"""
+    match = _FENCE_RE.search(text)
+    if match:
+        text = match.group(1)
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    return text[min(starts):].strip() if starts else text.strip()
+
+
+def repair_json(text: str) -> Tuple[str, bool]:
+    """修复常见的 JSON 格式问题，返回 (修复后的文本, 是否被截断)
+
+    - 删除 } 或 ] 之前多余的逗号
+    - 文本被截断时，回退到最后一个完整的值，并补齐未闭合的括号
+    """
+    out = []
+    length = 0
+    stack = []
+    # 对象内期待的下一个记号：key / colon / value / comma；数组内为 value / comma
+    expect = ['value']
+    # 最后一个可以安全截断的位置及当时未闭合的括号
+    safe = (0, "")
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c in " \t\r\n":
+            out.append(c)
+            length += 1
+            i += 1
+            continue
+        if c == '"':
+            end = i + 1
+            while end < n:
+                if text[end] == '\\':
+                    end += 2
+                    continue
+                if text[end] == '"':
+                    break
+                end += 1
+            if end >= n:
+                break
+            out.append(text[i:end + 1])
+            length += end + 1 - i
+            i = end + 1
+            if stack and stack[-1] == '{' and expect[-1] == 'key':
+                expect[-1] = 'colon'
+            else:
+                expect[-1] = 'comma'
+                safe = (length, "".join(stack))
+            continue
+        if c in '{[':
+            stack.append(c)
+            expect.append('key' if c == '{' else 'value')
+            out.append(c)
+            length += 1
+            i += 1
+            safe = (length, "".join(stack))
+            continue
+        if c in '}]':
+            if not stack:
+                break
+            stack.pop()
+            expect.pop()
+            expect[-1] = 'comma'
+            out.append(c)
+            length += 1
+            i += 1
+            safe = (length, "".join(stack))
+            if not stack:
+                break
+            continue
+        if c == ':':
+            expect[-1] = 'value'
+            out.append(c)
+            length += 1
+            i += 1
+            continue
+        if c == ',':
+            j = i + 1
+            while j < n and text[j] in " \t\r\n":
+                j += 1
+            if j < n and text[j] in '}]':
+                # 多余的逗号
+                i += 1
+                continue
+            expect[-1] = 'key' if stack and stack[-1] == '{' else 'value'
+            out.append(c)
+            length += 1
+            i += 1
+            continue
+        # 数字或 true / false / null
+        end = i
+        while end < n and text[end] not in " \t\r\n,:]}\"":
+            end += 1
+        if end >= n:
+            break
+        out.append(text[i:end])
+        length += end - i
+        i = end
+        expect[-1] = 'comma'
+        safe = (length, "".join(stack))
+
+    if not stack and out:
+        return "".join(out).strip(), False
+    cut, open_brackets = safe
+    body = "".join(out)[:cut].rstrip().rstrip(',')
+    closers = "".join('}' if b == '{' else ']' for b in reversed(open_brackets))
+    return body + closers, True
+
+
+def parse_json(text: str) -> Tuple[Any, bool]:
+    """解析模型输出的 JSON，必要时去除代码块标记并修复，返回 (值, 是否被截断)"""
+    try:
+        return loads(text), False
+    except ValueError:
+        pass
+    repaired, truncated = repair_json(extract_json(text))
+    try:
+        return loads(repaired), truncated
+    except ValueError:
+        raise StructuredOutputError("解析JSON失败")
+
+
+class optional:
+    """schema 中可以缺失（或为 null）的字段"""
+
+    def __init__(self, spec: Any):
+        self.spec = spec
+
+
+def compile_schema(spec: Any) -> Callable[[Any], List[str]]:
+    """把 schema 描述编译为校验函数，校验函数返回所有缺失或类型不符的字段路径
+
+    schema 描述：类型（如 str）、[元素描述] 表示数组、{键: 描述} 表示对象，
+    optional(描述) 表示可以缺失的字段。
+    """
+    if isinstance(spec, dict):
+        fields = [
+            (key, compile_schema(value.spec if isinstance(value, optional) else value), isinstance(value, optional))
+            for key, value in spec.items()
+        ]
+
+        def check_object(value: Any, path: str = "") -> List[str]:
+            if not isinstance(value, dict):
+                return [path or "$"]
+            problems = []
+            for key, check, is_optional in fields:
+                child = f"{path}.{key}" if path else key
+                if value.get(key) is None:
+                    if not is_optional:
+                        problems.append(child)
+                    continue
+                problems.extend(check(value[key], child))
+            return problems
+        return check_object
+
+    if isinstance(spec, list):
+        check_item = compile_schema(spec[0]) if spec else (lambda value, path="": [])
+
+        def check_array(value: Any, path: str = "") -> List[str]:
+            if not isinstance(value, list):
+                return [path or "$"]
+            problems = []
+            for index, item in enumerate(value):
+                problems.extend(check_item(item, f"{path}[{index}]"))
+            return problems
+        return check_array
+
+    def check_type(value: Any, path: str = "") -> List[str]:
+        return [] if isinstance(value, spec) else [path or "$"]
+    return check_type
+
+
+def _plan_requests(result: Dict, problems: List[str], truncated: bool, optional_keys: List[str]) -> Dict[str, Any]:
+    """把校验问题归并为补充请求：{键: None 表示整个字段, ('from', i) 表示从第 i 个元素续写, ('items', [i...]) 表示替换元素}"""
+    requests = {}
+    for path in problems:
+        match = _PATH_RE.match(path)
+        key, index = match.group(1), match.group(2)
+        value = result.get(key)
+        if index is None or not isinstance(value, list):
+            requests[key] = None
+            continue
+        index = int(index)
+        current = requests.get(key, ('items', []))
+        if current is None:
+            continue
+        if truncated and index == len(value) - 1:
+            # 截断发生在数组的最后一个元素中：从该元素（或更早的无效元素）开始续写数组
+            earlier = current[1] if current[0] == 'items' else [current[1]]
+            requests[key] = ('from', min([index] + earlier))
+        elif current[0] == 'items':
+            requests[key] = ('items', sorted(set(current[1]) | {index}))
+    if truncated:
+        # 截断发生在最后一个字段中：对象重新请求整个字段；数组从最后一个元素续写，
+        # 最后一个元素是对象或数组时其内部可能也不完整，一并重新请求
+        last_key = next(reversed(result), None)
+        value = result.get(last_key)
+        if isinstance(value, dict):
+            requests[last_key] = None
+        elif isinstance(value, list) and requests.get(last_key, ()) is not None:
+            start = len(value) - 1 if value and isinstance(value[-1], (dict, list)) else len(value)
+            current = requests.get(last_key, ('items', []))
+            earlier = current[1] if current[0] == 'items' else [current[1]]
+            requests[last_key] = ('from', min([start] + earlier))
+        for key in optional_keys:
+            if key not in result:
+                requests.setdefault(key, None)
+    return requests
+
+
+def _describe_requests(requests: Dict[str, Any]) -> str:
+    lines = []
+    for key, request in requests.items():
+        if request is None:
+            lines.append(f'- "{key}": 该字段完整的值')
+        elif request[0] == 'from':
+            lines.append(f'- "{key}": 数组，包含 {key} 中从第 {request[1] + 1} 个元素起的所有剩余元素'
+                         f'（已有的前 {request[1]} 个元素不要重复）')
+        else:
+            positions = ", ".join(str(i) for i in request[1])
+            lines.append(f'- "{key}": 对象，键为元素下标（{positions}，从 0 开始），值为 {key} 中对应元素修正后的完整内容')
+    return "\n".join(lines)
+
+
+def _merge(result: Dict, requests: Dict[str, Any], response: Dict):
+    """把补充请求的结果合并回已有结果"""
+    for key, request in requests.items():
+        if key not in response:
+            continue
+        value = response[key]
+        if request is None:
+            result[key] = value
+        elif request[0] == 'from' and isinstance(value, list):
+            result[key] = result[key][:request[1]] + value
+        elif request[0] == 'items' and isinstance(value, dict):
+            for index, item in value.items():
+                if str(index).isdigit() and int(index) < len(result[key]):
+                    result[key][int(index)] = item
+
+
+def complete_structured(response: str, validate: Callable[[Any], List[str]], prompt: str, system: str,
+                        stage: str, temperature: float = 0.3, optional_keys: Optional[List[str]] = None,
+                        max_rounds: int = MAX_REPAIR_ROUNDS) -> Dict:
+    """解析并校验结构化响应，缺失或无效的字段单独补充请求，不重新生成整个文档
+
+    无法解析或补充后仍不符合 schema 时抛出 StructuredOutputError。
+    """
+    result, truncated = parse_json(response)
+    if not isinstance(result, dict):
+        raise StructuredOutputError("解析JSON失败")
+    problems = validate(result)
+    rounds = 0
+    while problems and rounds < max_rounds:
+        rounds += 1
+        requests = _plan_requests(result, problems, truncated, optional_keys or [])
+        print(f"结构化输出不完整，补充请求字段: {', '.join(requests)}")
+        follow_up = call_llm(
+            prompt=MISSING_FIELDS_TEMPLATE.format(
+                prompt=prompt,
+                partial=dumps(result),
+                instructions=_describe_requests(requests)
+            ),
+            system=system,
+            json_output=True,
+            temperature=temperature,
+            stage=stage
+        )
+        if follow_up.startswith("[ERROR]"):
+            raise StructuredOutputError(follow_up)
+        patch, truncated = parse_json(follow_up)
+        if isinstance(patch, dict):
+            _merge(result, requests, patch)
+        problems = validate(result)
+    if problems:
+        raise StructuredOutputError(f"缺少或无效的字段: {', '.join(problems[:10])}")
+    return result
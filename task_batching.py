@@ -0,0 +1,88 @@
+# task_batching.py
+import json
+from typing import List, Dict, Optional
+
+from task_model import Task, DATA_MODEL_TASK, BATCH_TASK
+from structured_output import parse_json
+
+# 批量任务的任务内容，拼接在项目共享前缀之后（见 prompt_builder）
+BATCH_TASK_TEMPLATE = """
+任务详情:
+一次性实现以下多个数据模型文件。
+
+需要实现的数据模型:
+{models}
+
+请以JSON格式返回，格式为 {{"files": {{"文件路径": "文件完整代码"}}}}，
+每个文件路径必须与上面给出的路径完全一致，且每个数据模型对应一个文件。
+"""
+
+# 可以合并进批次的任务类型
+BATCHABLE_TASK_TYPES = (DATA_MODEL_TASK,)
+# 单个批次最多包含的任务数
+MAX_BATCH_SIZE = 8
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计文本的 token 数（中英文混合按每 2 个字符约 1 个 token 计）"""
+    return len(text) // 2 + 1
+
+
+def _task_payload(task: Task) -> Dict:
+    """批量提示词中描述单个数据模型任务的内容"""
+    return {
+        'name': task.name,
+        'fields': task.fields,
+        'file_path': task.file_path,
+    }
+
+
+def pack_batches(tasks: List[Task], token_budget: int) -> List[Task]:
+    """把可批量处理的小任务按 token 预算打包成批次任务，其余任务原样返回
+
+    只包含一个任务的批次不做打包，直接保留原任务。
+    """
+    result = []
+    batch = []
+    batch_tokens = 0
+
+    def flush():
+        if len(batch) > 1:
+            result.append(Task(BATCH_TASK, tasks=list(batch)))
+        else:
+            result.extend(batch)
+        batch.clear()
+
+    for task in tasks:
+        if task.type not in BATCHABLE_TASK_TYPES:
+            result.append(task)
+            continue
+        tokens = estimate_tokens(json.dumps(_task_payload(task), ensure_ascii=False))
+        if batch and (batch_tokens + tokens > token_budget or len(batch) >= MAX_BATCH_SIZE):
+            flush()
+            batch_tokens = 0
+        batch.append(task)
+        batch_tokens += tokens
+    flush()
+    return result
+
+
+def build_batch_task(batch: Task) -> str:
+    """构造批量生成的任务内容，技术栈等共享信息由共享前缀提供，只出现一次"""
+    return BATCH_TASK_TEMPLATE.format(
+        models=json.dumps([_task_payload(task) for task in batch.tasks], ensure_ascii=False, indent=2)
+    )
+
+
+def parse_batch_response(response: str) -> Optional[Dict[str, str]]:
+    """解析批量响应，返回 {文件路径: 代码}；格式不正确时返回 None"""
+    if response.startswith("[ERROR]"):
+        return None
+    # 响应被截断时只保留已完整输出的文件，缺少的文件由调用方单独生成
+    try:
+        files = parse_json(response)[0].get('files')
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(files, dict):
+        return None
+    return {path: code for path, code in files.items() if isinstance(code, str) and code.strip()}
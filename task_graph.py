@@ -0,0 +1,95 @@
+# task_graph.py
+import re
+from typing import List, Dict, Set
+
+from task_model import Task, MODULE_TASK, DATA_MODEL_TASK
+
+# 没有历史记录时各类任务的预估耗时（秒）
+DEFAULT_TASK_LATENCY = {
+    'module_implementation': 30.0,
+    'data_model': 10.0,
+    'config_files': 0.1,
+}
+# 历史耗时的指数滑动平均系数
+LATENCY_SMOOTHING = 0.3
+
+_WORD_RE = re.compile(r'[A-Za-z0-9_]+')
+
+
+def _mentions(text: str, name: str) -> bool:
+    """判断文本中是否以独立单词形式出现了名称（忽略大小写）"""
+    if not name:
+        return False
+    return re.search(r'(?<![A-Za-z0-9_])' + re.escape(name) + r'(?![A-Za-z0-9_])', text, re.IGNORECASE) is not None
+
+
+def build_dependencies(tasks: List[Task]) -> Dict[str, Set[str]]:
+    """推导任务之间的依赖关系
+
+    模块任务依赖于其名称、描述或接口中提到的数据模型任务；其余任务没有依赖。
+    返回 {任务标识: 依赖的任务标识集合}。
+    """
+    # 名称只由字母数字下划线组成的数据模型按单词查表匹配，其余名称退回正则匹配，
+    # 避免模块数 × 数据模型数次正则搜索
+    models_by_word = {}
+    other_models = []
+    for task in tasks:
+        if task.type != DATA_MODEL_TASK or not task.name:
+            continue
+        if _WORD_RE.fullmatch(task.name):
+            models_by_word.setdefault(task.name.lower(), []).append(task.key)
+        else:
+            other_models.append(task)
+    dependencies = {}
+    for task in tasks:
+        deps = set()
+        if task.type == MODULE_TASK and (models_by_word or other_models):
+            text = " ".join([
+                task.description,
+                " ".join(
+                    " ".join(str(value) for value in interface.values())
+                    for interface in task.interfaces if isinstance(interface, dict)
+                )
+            ])
+            for word in {word.lower() for word in _WORD_RE.findall(text)}:
+                deps.update(models_by_word.get(word, ()))
+            deps.update(model.key for model in other_models if _mentions(text, model.name))
+        dependencies[task.key] = deps
+    return dependencies
+
+
+def topological_waves(dependencies: Dict[str, Set[str]]) -> List[List[str]]:
+    """按拓扑顺序把任务分成若干波次，同一波次内的任务互不依赖，可以并行执行"""
+    remaining = {key: set(deps) & dependencies.keys() for key, deps in dependencies.items()}
+    waves = []
+    while remaining:
+        ready = [key for key, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"任务依赖存在环: {sorted(remaining)}")
+        waves.append(ready)
+        for key in ready:
+            del remaining[key]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return waves
+
+
+def update_latency(history: Dict[str, float], task_type: str, seconds: float):
+    """用指数滑动平均更新某类任务的历史耗时"""
+    previous = history.get(task_type)
+    if previous is None:
+        history[task_type] = seconds
+    else:
+        history[task_type] = (1 - LATENCY_SMOOTHING) * previous + LATENCY_SMOOTHING * seconds
+
+
+def estimate_duration(task: Task, history: Dict[str, float]) -> float:
+    """根据同类任务的历史耗时估计任务耗时，接口或字段越多估计越长"""
+    base = history.get(task.type, DEFAULT_TASK_LATENCY.get(task.type, 1.0))
+    size = len(task.interfaces) + len(task.fields)
+    return base * (1 + 0.1 * size)
+
+
+def order_longest_first(tasks: List[Task], history: Dict[str, float]) -> List[Task]:
+    """按估计耗时从长到短排序，尽量缩短整体完成时间"""
+    return sorted(tasks, key=lambda task: estimate_duration(task, history), reverse=True)
@@ -0,0 +1,66 @@
+# task_model.py
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+MODULE_TASK = 'module_implementation'
+DATA_MODEL_TASK = 'data_model'
+CONFIG_TASK = 'config_files'
+BATCH_TASK = 'data_model_batch'
+
+# 预计输出 token 数的粗略估计：基础部分 + 每个接口 / 字段的增量，用于模型路由
+MODULE_BASE_TOKENS = 300
+TOKENS_PER_INTERFACE = 200
+DATA_MODEL_BASE_TOKENS = 100
+TOKENS_PER_FIELD = 30
+
+
+@dataclass(slots=True)
+class Task:
+    """任务记录
+
+    只保存任务类型、输出路径以及对架构中模块 / 数据模型字典的引用，
+    名称、接口、字段、描述等都从引用的字典中按需读取，不复制数据。
+    """
+    type: str
+    source: Optional[Dict] = None
+    file_path: Optional[str] = None
+    # 批次任务包含的子任务
+    tasks: Optional[List["Task"]] = None
+
+    @property
+    def key(self) -> str:
+        """任务的唯一标识，用于记录结果、错误与构建清单"""
+        return self.file_path or self.type
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.source.get('name') if self.source else None
+
+    @property
+    def interfaces(self) -> List:
+        return self.source.get('interfaces', []) if self.source else []
+
+    @property
+    def fields(self) -> List:
+        return self.source.get('fields', []) if self.source else []
+
+    @property
+    def description(self) -> str:
+        if self.type == MODULE_TASK:
+            return f"实现 {self.name} 模块: {self.source.get('description')}"
+        if self.type == DATA_MODEL_TASK:
+            return f"实现 {self.name} 数据模型"
+        if self.type == BATCH_TASK:
+            return f"批量实现 {len(self.tasks)} 个数据模型"
+        return "生成项目配置文件"
+
+    @property
+    def expected_tokens(self) -> int:
+        """预计输出的 token 数"""
+        if self.type == MODULE_TASK:
+            return MODULE_BASE_TOKENS + TOKENS_PER_INTERFACE * len(self.interfaces)
+        if self.type == DATA_MODEL_TASK:
+            return DATA_MODEL_BASE_TOKENS + TOKENS_PER_FIELD * len(self.fields)
+        if self.type == BATCH_TASK:
+            return sum(task.expected_tokens for task in self.tasks)
+        return 0
@@ -1,58 +1,177 @@
 # task_scheduler.py
 import os
 import json
-from typing import List, Dict
-from LLM_Engine import call_llm
+import time
+import asyncio
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator, AsyncIterable
+from llm_governor import AdaptiveLimiter
+from LLM_Engine import run_async, call_llm, call_llm_async, stream_llm, stream_llm_async, forget_cached, response_cache, metrics, governor, hedging, router, fallback_used
+from build_manifest import BuildManifest, MANIFEST_FILE_NAME, fingerprint
+from task_graph import build_dependencies, topological_waves, update_latency, order_longest_first
+from task_batching import pack_batches, build_batch_task, parse_batch_response
+from prompt_builder import PromptBuilder, TASK_SYSTEM_PROMPT
+from output_sink import OutputSink, DirectorySink
+from code_verifier import CodeVerifier, verify_source, has_check
+from code_patch import PatchError, MAX_PATCH_SOURCE_CHARS, task_snapshot, describe_delta, apply_patch_response
+from context_index import ContextIndex, SignatureCollector, DEFAULT_CONTEXT_TOKENS, task_signature
+from code_templates import render_task, render_config, render_model_base
+from tracing import tracer
+from task_model import Task, MODULE_TASK, DATA_MODEL_TASK, CONFIG_TASK, BATCH_TASK
 
-TASK_PROMPT_TEMPLATE = """
-你是一位资深软件开发工程师，现在需要根据以下任务说明和架构设计实现具体的代码模块。
+# 并发执行模式下同时执行的任务数的硬上限；实际并发跟随 governor 的 AIMD 上限（初始 8）变化
+DEFAULT_MAX_CONCURRENCY = 64
+# 代码生成任务使用的模型与 temperature（同时参与增量构建指纹计算）
+TASK_MODEL = "deepseek-chat"
+TASK_TEMPERATURE = 0.2
+# 代码检查未通过的文件最多重新生成的次数
+DEFAULT_MAX_REGENERATIONS = 1
 
-架构设计摘要:
-{architecture_summary}
+class CodeFenceStripper:
+    """在流式输出中实时去除 markdown 代码块标记（```lang ... ```）
 
-任务详情:
-{task_description}
+    按行处理：开头的围栏行直接丢弃；中途出现的围栏行先暂存，
+    若其后还有内容则原样输出，若到流结束都没有内容则视为结尾围栏丢弃。
+    """
 
-请严格按照以下要求输出代码:
-1. 只返回代码内容，不要包含任何解释或注释
-2. 确保代码符合架构设计中指定的技术栈
-3. 代码应该完整可运行，包含必要的导入和依赖
-4. 文件路径: {file_path}
-"""
+    def __init__(self):
+        self._pending = ""
+        self._held = []
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        """输入一段文本，返回可以立即写出的内容"""
+        self._pending += chunk
+        *lines, self._pending = self._pending.split("\n")
+        return "".join(self._process_line(line + "\n") for line in lines)
+
+    def finish(self) -> str:
+        """流结束时调用，返回剩余内容"""
+        out = self._process_line(self._pending) if self._pending else ""
+        self._pending = ""
+        self._held = []
+        return out
+
+    def _process_line(self, line: str) -> str:
+        stripped = line.strip()
+        if not self._started:
+            if not stripped:
+                return ""
+            self._started = True
+            if stripped.startswith("```"):
+                return ""
+        if stripped.startswith("```") or (self._held and not stripped):
+            self._held.append(line)
+            return ""
+        out = "".join(self._held) + line
+        self._held = []
+        return out
+
+def strip_code_fences(text: str) -> str:
+    """去除完整响应中的代码块标记，与流式写入的处理保持一致"""
+    stripper = CodeFenceStripper()
+    return stripper.feed(text) + stripper.finish()
 
 class TaskScheduler:
-    def __init__(self, architecture: dict):
+    def __init__(self, architecture: dict, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, stream: bool = False,
+                 incremental: bool = True, batch_token_budget: int = 0, call_timeout: Optional[float] = None,
+                 build_deadline: Optional[float] = None, hedge: Optional[bool] = None, output_root: str = "",
+                 limiter=None, sink: Optional[OutputSink] = None, verify: bool = True,
+                 verifier: Optional[CodeVerifier] = None, max_regenerations: int = DEFAULT_MAX_REGENERATIONS,
+                 context_tokens: int = DEFAULT_CONTEXT_TOKENS, patch_updates: bool = True,
+                 templates: bool = True):
         self.architecture = architecture
         self.task_queue = []
         self.generated_files = []
+        self.max_concurrency = max_concurrency
+        # 流式模式下生成内容边接收边写入文件
+        self.stream = stream
+        # 增量构建：输入指纹未变化且输出文件存在的任务直接跳过
+        self.incremental = incremental
+        self.manifest = None
+        self.skipped_tasks = 0
+        # 任务依赖图 {任务标识: 依赖的任务标识集合}，执行时生成
+        self.task_graph = {}
+        # 大于 0 时把同一波次内的小型数据模型任务按该 token 预算合并为一次请求
+        self.batch_token_budget = batch_token_budget
+        # 单次 LLM 请求超时与整个构建的截止时间（秒），超出截止时间的任务记为失败
+        self.call_timeout = call_timeout
+        self.build_deadline = build_deadline
+        self._deadline_at = None
+        # 是否对慢请求发出对冲请求（仅并发模式），None 时使用 LLM_Engine.hedging 的开关
+        self.hedge = hedge
+        # 项目目录所在的根目录，默认为当前目录
+        self.output_root = output_root
+        # 可选的外部并发限制器（异步上下文管理器），用于多个项目共享并发配额
+        self.limiter = limiter
+        # 生成文件的输出目标，默认后台线程原子写入本地目录；也可以写入内存或归档
+        self.sink = sink or DirectorySink()
+        self._owns_sink = sink is None
+        # 每个文件写出后在进程池中检查（语法、JSON、外部 linter），与后续生成并行；
+        # 未通过的文件带着错误信息定向重新生成，最多 max_regenerations 次
+        self.verifier = verifier or (CodeVerifier() if verify else None)
+        self._owns_verifier = verifier is None
+        self.max_regenerations = max_regenerations
+        self.regenerations = {}
+        self.verification_errors = {}
+        self.verification_stats = {'files': 0, 'failed': 0, 'seconds': 0.0, 'wait_seconds': 0.0}
+        self._pending_checks = []
+        self._check_tasks = []
+        # {文件路径: (上一次的代码, 检查错误)}，重新生成时附在提示词末尾
+        self._repairs = {}
+        # 生成各文件的模型请求（见 _llm_args），代码检查未通过时据此删除缓存结果
+        self._requests = {}
+        self._semaphore = None
+        # 前缀缓存友好的提示词构造器，共享前缀在本次构建中只生成一次
+        self.prompt_builder = PromptBuilder(architecture)
+        # 模块、数据模型与已生成文件签名的检索索引，每个提示词只附带不超过 context_tokens 的相关签名；
+        # 为 0 时不附带跨模块上下文
+        self.context_tokens = context_tokens
+        self._context_index = None
+        # 增量构建中架构有变化、输出文件已存在的任务，只请求 SEARCH/REPLACE 修改并在本地应用，
+        # 补丁无法应用或检查未通过时退回完整重新生成
+        self.patch_updates = patch_updates
+        self.patch_stats = {'attempted': 0, 'applied': 0, 'fallback': 0}
+        # 技术栈有对应本地模板的任务（常见数据库的数据模型、纯 CRUD 路由、Dockerfile 等）直接渲染，
+        # 不调用 LLM；模板未覆盖的任务仍由模型生成
+        self.templates = templates
+        self.template_stats = {'rendered': 0, 'seconds': 0.0}
+        # 模板渲染结果（没有模板时为 None），键为任务标识，分波次判断与写出共用一次渲染
+        self._rendered = {}
+        self._metrics_mark = 0
+        # 每个任务的执行结果与错误，键为任务标识（见 Task.key）
+        self.task_results = {}
+        self.task_errors = {}
+        # 由备用路由（其他模型或接口）生成的任务，不记入构建清单，下次构建时用首选路由重新生成
+        self.fallback_tasks = set()
         
     def create_project_structure(self):
         """根据架构设计创建基础项目结构"""
         project_name = self.architecture.get('project_name', 'my_project')
+        project_dir = self._project_dir()
         
         try:
             # 创建项目根目录
-            os.makedirs(project_name, exist_ok=True)
+            self.sink.makedirs(project_dir)
             
             # 根据技术栈创建基本目录结构
             tech_stack = self.architecture.get('tech_stack', {})
             
             if tech_stack.get('frontend'):
-                os.makedirs(f"{project_name}/frontend/src", exist_ok=True)
+                self.sink.makedirs(f"{project_dir}/frontend/src")
                 
             if tech_stack.get('backend'):
-                os.makedirs(f"{project_name}/backend", exist_ok=True)
+                self.sink.makedirs(f"{project_dir}/backend")
                 
             if tech_stack.get('database'):
-                os.makedirs(f"{project_name}/models", exist_ok=True)
+                self.sink.makedirs(f"{project_dir}/models")
                 
             # 创建配置文件
-            with open(f"{project_name}/README.md", 'w') as f:
-                f.write(f"# {project_name}\n\n## 技术栈\n")
-                for k, v in tech_stack.items():
-                    f.write(f"- {k}: {v}\n")
+            readme = f"# {project_name}\n\n## 技术栈\n"
+            for k, v in tech_stack.items():
+                readme += f"- {k}: {v}\n"
+            self.sink.write(f"{project_dir}/README.md", readme)
             
-            self.generated_files.append(f"创建项目目录结构: {project_name}/")
+            self.generated_files.append(f"创建项目目录结构: {project_dir}/")
             return True
             
         except Exception as e:
@@ -61,114 +180,650 @@ class TaskScheduler:
     
     def build_task_queue(self):
         """根据架构设计构建任务队列"""
-        self.task_queue = []
-        
-        # 添加模块开发任务
+        with tracer.span("build_task_queue") as span:
+            self.task_queue = list(self.iter_tasks())
+            span.set(tasks=len(self.task_queue))
+        return len(self.task_queue)
+    
+    def iter_tasks(self) -> Iterator[Task]:
+        """按需逐个产出任务记录，任务只引用架构中的模块 / 数据模型，不复制数据"""
+        # 模块开发任务
         for module in self.architecture.get('modules', []):
-            task = {
-                'type': 'module_implementation',
-                'module_name': module.get('name'),
-                'description': f"实现 {module.get('name')} 模块: {module.get('description')}",
-                'interfaces': module.get('interfaces', []),
-                'file_path': self._get_module_file_path(module.get('name'))
-            }
-            self.task_queue.append(task)
+            yield self.build_module_task(module)
         
-        # 添加数据模型任务
+        # 数据模型任务
         for model in self.architecture.get('data_models', []):
-            task = {
-                'type': 'data_model',
-                'model_name': model.get('name'),
-                'description': f"实现 {model.get('name')} 数据模型",
-                'fields': model.get('fields', []),
-                'file_path': self._get_model_file_path(model.get('name'))
-            }
-            self.task_queue.append(task)
+            yield self.build_data_model_task(model)
         
-        # 添加配置文件任务
-        config_task = {
-            'type': 'config_files',
-            'description': "生成项目配置文件",
-            'tech_stack': self.architecture.get('tech_stack', {}),
-            'file_paths': self._get_config_file_paths()
-        }
-        self.task_queue.append(config_task)
+        # 配置文件任务
+        yield self.build_config_task()
+    
+    def build_module_task(self, module: Dict) -> Task:
+        """根据架构中的一个模块构建模块开发任务"""
+        return Task(MODULE_TASK, module, self._get_module_file_path(module.get('name')))
+    
+    def build_data_model_task(self, model: Dict) -> Task:
+        """根据架构中的一个数据模型构建数据模型任务"""
+        return Task(DATA_MODEL_TASK, model, self._get_model_file_path(model.get('name')))
+    
+    def build_config_task(self) -> Task:
+        """构建配置文件任务"""
+        return Task(CONFIG_TASK)
+    
+    def execute_tasks(self, concurrent: bool = False):
+        """执行任务队列中的所有任务
+
+        concurrent=True 时使用 asyncio 并发执行，整体耗时取决于最慢的任务，
+        而不是所有任务耗时之和。
+        """
+        if not self.task_queue:
+            print("任务队列为空，请先构建任务队列")
+            return
         
-        return len(self.task_queue)
+        if concurrent:
+            return run_async(self.execute_tasks_async())
+        
+        self._load_manifest()
+        self._start_deadline()
+        try:
+            for wave in self._plan_waves(self._pending_tasks()):
+                for task in wave:
+                    if self._remaining_time() == 0:
+                        self._on_task_error(task, TimeoutError("超出构建截止时间"))
+                        continue
+                    self._run_task(task)
+            self._drain_checks()
+        finally:
+            self._finish_build()
     
-    def execute_tasks(self):
-        """执行任务队列中的所有任务"""
+    async def execute_tasks_async(self, max_concurrency: Optional[int] = None):
+        """按依赖关系分波次并发执行任务队列，同时执行的任务数跟随 governor 的 AIMD 并发上限，不超过 max_concurrency
+
+        同一波次内的任务按估计耗时从长到短启动，使最慢的任务尽早开始。
+        """
         if not self.task_queue:
             print("任务队列为空，请先构建任务队列")
             return
-            
-        for task in self.task_queue:
+        
+        semaphore = self.limiter or AdaptiveLimiter(governor, max_concurrency or self.max_concurrency)
+        self._semaphore = semaphore
+        
+        self._load_manifest()
+        self._start_deadline()
+        try:
+            for wave in self._plan_waves(self._pending_tasks()):
+                await asyncio.gather(*(self._run_limited_async(task, semaphore) for task in wave))
+            await self._drain_checks_async()
+        finally:
+            self._finish_build()
+    
+    async def execute_task_stream_async(self, tasks: asyncio.Queue, max_concurrency: Optional[int] = None):
+        """流水线模式：从队列中逐个取出任务立即开始执行，直到取到 None 为止
+
+        任务在上游（如流式架构设计）产出时即可开始生成，不等待完整的任务列表，
+        因此不做依赖分析与批量合并。
+        """
+        semaphore = self.limiter or AdaptiveLimiter(governor, max_concurrency or self.max_concurrency)
+        self._semaphore = semaphore
+        running = []
+        
+        self._start_deadline()
+        try:
+            while True:
+                task = await tasks.get()
+                if task is None:
+                    break
+                if self.manifest is None:
+                    # 项目目录在 project_name 解析出来之后才确定，第一个任务到达时再读取构建清单
+                    self._load_manifest()
+                self.task_queue.append(task)
+                self._index_task(task)
+                if self.incremental and self._is_task_up_to_date(task):
+                    self.skipped_tasks += 1
+                    self.task_results[task.key] = "skipped"
+                    continue
+                running.append(asyncio.ensure_future(self._run_limited_async(task, semaphore)))
+            await asyncio.gather(*running)
+            await self._drain_checks_async()
+        finally:
+            if self.manifest is None:
+                self._load_manifest()
+            self._finish_build()
+    
+    def refresh_architecture(self):
+        """流式设计中架构有新内容时调用：共享前缀按当前已知的模块与数据模型重新生成"""
+        self.prompt_builder.refresh()
+        self._rendered.clear()
+    
+    # 以下接口供持久化队列（work_queue）使用：入队时规划构建，worker 逐个执行领取的任务
+    
+    def plan_pending_waves(self) -> Dict[str, int]:
+        """建立任务队列并载入构建清单，返回需要执行的任务 {任务标识: 波次编号}；不在其中的任务输入未变化"""
+        self.build_task_queue()
+        self._load_manifest()
+        return {task.key: index for index, wave in enumerate(self._plan_waves(self._pending_tasks())) for task in wave}
+    
+    def task_fingerprint(self, task: Task) -> Optional[str]:
+        """任务输入的指纹，与构建清单中记录的相同；不参与增量跳过的任务返回 None"""
+        return self._task_fingerprint(task)
+    
+    def start_worker(self) -> Dict[str, Task]:
+        """worker 开始执行前调用：建立任务队列、载入构建清单并开始计算截止时间，返回 {任务标识: 任务}"""
+        self.build_task_queue()
+        self._load_manifest()
+        self._start_deadline()
+        return {task.key: task for task in self.task_queue}
+    
+    def run_to_completion(self, task: Task) -> Tuple[Optional[str], Optional[str]]:
+        """执行单个任务，等待代码检查（以及可能的重新生成）与写盘完成，返回 (错误信息, 指纹)
+
+        失败时错误信息不为空；由备用路由生成的结果不返回指纹，不记入构建清单。
+        """
+        self._run_task(task)
+        self._drain_checks()
+        self.sink.flush()
+        error = self.task_errors.pop(task.key, None) or self.sink.errors.get(task.file_path)
+        if error:
+            return error, None
+        return None, None if task.key in self.fallback_tasks else self._task_fingerprint(task)
+    
+    def refresh_context(self, tasks: Iterable[Task]):
+        """把这些任务已写出的文件（例如由其他 worker 生成）读回检索索引，使提示词引用实际生成的签名"""
+        if self.context_tokens <= 0:
+            return
+        index = self._get_context_index()
+        for task in tasks:
+            if not task.file_path:
+                continue
+            content = self.sink.read(task.file_path)
+            if content:
+                index.update_file(task.file_path, content)
+    
+    def record_completed(self, completed: List[Dict]):
+        """把完成任务 [{key, type, fingerprint, seconds}] 的指纹与耗时写入构建清单并保存"""
+        self._load_manifest()
+        tasks = {task.key: task for task in self.iter_tasks()}
+        for item in completed:
+            if item['fingerprint']:
+                self.manifest.record(item['key'], item['fingerprint'],
+                                     task_snapshot(tasks[item['key']]) if item['key'] in tasks else None)
+            if item['seconds']:
+                update_latency(self.manifest.latency, item['type'], item['seconds'])
+        if self.sink.persistent:
+            self.manifest.save()
+    
+    async def _run_limited_async(self, task: Task, semaphore):
+        """在并发上限与构建截止时间约束下执行单个任务"""
+        queued_at = time.perf_counter()
+        async with semaphore:
+            remaining = self._remaining_time()
+            try:
+                await asyncio.wait_for(self._run_task_async(task, queued_at), remaining)
+            except asyncio.TimeoutError:
+                self._on_task_error(task, TimeoutError("超出构建截止时间"))
+    
+    def _start_deadline(self):
+        """开始计算构建截止时间"""
+        self._deadline_at = time.monotonic() + self.build_deadline if self.build_deadline else None
+    
+    def _remaining_time(self) -> Optional[float]:
+        """距离构建截止时间的剩余秒数，未设置截止时间时返回 None"""
+        if self._deadline_at is None:
+            return None
+        return max(0.0, self._deadline_at - time.monotonic())
+    
+    def _call_timeout(self) -> Optional[float]:
+        """单次请求的超时，不超过构建剩余时间"""
+        remaining = self._remaining_time()
+        if remaining is None:
+            return self.call_timeout
+        return min(self.call_timeout or remaining, remaining) or 0.001
+    
+    def _run_task(self, task: Task):
+        """执行单个任务并记录结果或错误"""
+        with tracer.span("task", **self._span_attributes(task)):
+            fallback_used.set(False)
+            if task.type == BATCH_TASK:
+                self._run_data_model_batch(task)
+                return
             try:
-                if task['type'] == 'module_implementation':
+                started = time.perf_counter()
+                if task.type == MODULE_TASK:
                     self._generate_module(task)
-                elif task['type'] == 'data_model':
+                elif task.type == DATA_MODEL_TASK:
                     self._generate_data_model(task)
-                elif task['type'] == 'config_files':
+                elif task.type == CONFIG_TASK:
                     self._generate_config_files(task)
-                    
+                self._on_task_success(task, time.perf_counter() - started)
             except Exception as e:
-                print(f"执行任务失败: {task.get('description')} - 错误: {str(e)}")
+                self._on_task_error(task, e)
     
-    def _generate_module(self, task: Dict):
-        """生成模块代码"""
-        architecture_summary = {
-            'tech_stack': self.architecture.get('tech_stack'),
-            'module_description': {
-                'name': task['module_name'],
-                'interfaces': task['interfaces']
-            }
-        }
+    async def _run_task_async(self, task: Task, queued_at: Optional[float] = None):
+        """异步执行单个任务并记录结果或错误；queued_at 为开始等待并发名额的时间，等待时间记为 queued span"""
+        if queued_at is not None:
+            tracer.record("queued", queued_at, time.perf_counter() - queued_at, task=task.key)
+        with tracer.span("task", **self._span_attributes(task)):
+            fallback_used.set(False)
+            if task.type == BATCH_TASK:
+                await self._run_data_model_batch_async(task)
+                return
+            try:
+                started = time.perf_counter()
+                await self._execute_task_async(task)
+                self._on_task_success(task, time.perf_counter() - started)
+            except Exception as e:
+                self._on_task_error(task, e)
+    
+    def _span_attributes(self, task: Task) -> Dict:
+        """任务 span 的属性"""
+        if task.type == BATCH_TASK:
+            return {'task': task.key, 'type': task.type, 'models': len(task.tasks), 'expected_tokens': task.expected_tokens}
+        return {'task': task.key, 'type': task.type, 'name': task.name, 'expected_tokens': task.expected_tokens or None}
+    
+    def _run_data_model_batch(self, batch: Task):
+        """用一次 JSON 请求生成一批数据模型，解析失败或缺失的文件退回逐个生成"""
+        started = time.perf_counter()
+        prompt, system = self.prompt_builder.build_tail(build_batch_task(batch))
+        response = call_llm(**self._llm_args([task.file_path for task in batch.tasks], prompt, system, batch.type,
+                                                     batch.expected_tokens, json_output=True))
+        for task in self._apply_batch_response(batch, response, time.perf_counter() - started):
+            self._run_task(task)
+    
+    async def _run_data_model_batch_async(self, batch: Task):
+        """_run_data_model_batch 的异步版本"""
+        started = time.perf_counter()
+        prompt, system = self.prompt_builder.build_tail(build_batch_task(batch))
+        response = await call_llm_async(**self._llm_args([task.file_path for task in batch.tasks], prompt, system, batch.type,
+                                                     batch.expected_tokens, json_output=True), hedge=self.hedge)
+        for task in self._apply_batch_response(batch, response, time.perf_counter() - started):
+            await self._run_task_async(task)
+    
+    def _apply_batch_response(self, batch: Task, response: str, seconds: float) -> List[Task]:
+        """把批量响应拆分写入各个文件，返回需要退回逐个生成的任务"""
+        files = parse_batch_response(response)
+        if files is None:
+            print(f"批量响应解析失败，退回逐个生成: {batch.description}")
+            return batch.tasks
         
-        prompt = TASK_PROMPT_TEMPLATE.format(
-            architecture_summary=json.dumps(architecture_summary, indent=2),
-            task_description=task['description'],
-            file_path=task['file_path']
-        )
+        fallback = []
+        for task in batch.tasks:
+            code = files.get(task.file_path)
+            if code is None:
+                fallback.append(task)
+                continue
+            try:
+                self._write_file(task.file_path, code)
+                self.generated_files.append(f"生成数据模型: {task.file_path}")
+                self._on_task_success(task, seconds / len(batch.tasks))
+            except Exception as e:
+                self._on_task_error(task, e)
+        return fallback
+    
+    def _plan_waves(self, tasks: List[Task]) -> List[List[Task]]:
+        """根据任务依赖图划分拓扑波次，每个波次内按估计耗时从长到短排序
+
+        已跳过的任务视为已完成，不再阻塞依赖它的任务。
+        """
+        self.task_graph = build_dependencies(tasks)
+        tasks_by_key = {task.key: task for task in tasks}
+        waves = [
+            order_longest_first([tasks_by_key[key] for key in wave], self.manifest.latency)
+            for wave in topological_waves(self.task_graph)
+        ]
+        if self.batch_token_budget > 0:
+            # 使用模板的任务不经过 LLM，不参与合并
+            waves = [
+                [task for task in wave if self._has_template(task)]
+                + pack_batches([task for task in wave if not self._has_template(task)], self.batch_token_budget)
+                for wave in waves
+            ]
+        return waves
+    
+    def _load_manifest(self):
+        """读取项目目录下的构建清单，并开始统计本次构建的调用"""
+        self._metrics_mark = metrics.mark()
+        if self.sink.persistent:
+            self.manifest = BuildManifest.load(self._project_dir())
+        else:
+            self.manifest = BuildManifest(os.path.join(self._project_dir(), MANIFEST_FILE_NAME))
+        self.skipped_tasks = 0
+    
+    def _pending_tasks(self) -> List[Task]:
+        """过滤出需要执行的任务，并统计被跳过的任务数"""
+        pending = []
+        for task in self.task_queue:
+            if self.incremental and self._is_task_up_to_date(task):
+                self.skipped_tasks += 1
+                self.task_results[task.key] = "skipped"
+            else:
+                pending.append(task)
+        if self.skipped_tasks:
+            print(f"增量构建: 跳过 {self.skipped_tasks} 个输入未变化的任务")
+        return pending
+    
+    def _task_fingerprint(self, task: Task) -> Optional[str]:
+        """计算任务有效输入的指纹；配置文件任务不参与增量跳过"""
+        if task.type not in (MODULE_TASK, DATA_MODEL_TASK):
+            return None
+        # 只计入技术栈与任务自身的内容：共享前缀中的架构摘要、定向重新生成时附加的错误信息、
+        # 随生成顺序变化的检索上下文都不计入指纹
+        return fingerprint(self.prompt_builder.fingerprint_input(task), TASK_SYSTEM_PROMPT, TASK_MODEL, TASK_TEMPERATURE)
+    
+    def _is_task_up_to_date(self, task: Task) -> bool:
+        """判断任务是否可以跳过"""
+        task_fingerprint = self._task_fingerprint(task)
+        if task_fingerprint is None:
+            return False
+        return self.manifest.is_up_to_date(task.key, task_fingerprint, [task.file_path], exists=self.sink.exists)
+    
+    def _on_task_success(self, task: Task, seconds: float):
+        """记录任务成功及耗时，并把输入指纹写入构建清单"""
+        self.task_results[task.key] = "success"
+        update_latency(self.manifest.latency, task.type, seconds)
+        if fallback_used.get():
+            self.fallback_tasks.add(task.key)
+            return
+        task_fingerprint = self._task_fingerprint(task)
+        if task_fingerprint is not None:
+            self.manifest.record(task.key, task_fingerprint, task_snapshot(task))
+    
+    def _on_task_error(self, task: Task, error: Exception):
+        """记录任务失败；批次任务失败时记录到其中每个子任务"""
+        if task.type == BATCH_TASK:
+            for sub_task in task.tasks:
+                if sub_task.key not in self.task_results:
+                    self.task_errors[sub_task.key] = str(error)
+            print(f"执行任务失败: {task.description} - 错误: {str(error)}")
+            return
+        self.task_results.pop(task.key, None)
+        self.task_errors[task.key] = str(error)
+        print(f"执行任务失败: {task.description} - 错误: {str(error)}")
+    
+    async def _execute_task_async(self, task: Task):
+        """异步执行单个任务"""
+        if task.type == MODULE_TASK:
+            await self._generate_module_async(task)
+        elif task.type == DATA_MODEL_TASK:
+            await self._generate_data_model_async(task)
+        elif task.type == CONFIG_TASK:
+            await self._generate_config_files_async(task)
+    
+    def _build_module_prompt(self, task: Task) -> Tuple[str, str]:
+        """构造模块任务的提示词和系统提示词"""
+        return self._build_task_prompt(task)
+    
+    def _build_data_model_prompt(self, task: Task) -> Tuple[str, str]:
+        """构造数据模型任务的提示词和系统提示词"""
+        return self._build_task_prompt(task)
+    
+    def _build_task_prompt(self, task: Task) -> Tuple[str, str]:
+        """附上检索到的相关签名；文件上一次未通过代码检查时，再附上错误与上一次的代码"""
+        context = self._task_context(task)
+        repair = self._repairs.get(task.file_path)
+        if repair:
+            return self.prompt_builder.build_repair(task, *repair, context=context)
+        return self.prompt_builder.build(task, context)
+    
+    def _get_context_index(self) -> ContextIndex:
+        """第一次使用时用全部模块与数据模型建立检索索引"""
+        if self._context_index is None:
+            self._context_index = ContextIndex.from_tasks(self.iter_tasks(), max_tokens=self.context_tokens)
+        return self._context_index
+    
+    def _index_task(self, task: Task):
+        """把流式到达的任务加入已建立的检索索引（已有生成代码签名的文档不覆盖）"""
+        if self._context_index is not None and task.file_path and task.file_path not in self._context_index.documents:
+            self._context_index.add(task.file_path, task_signature(task))
+    
+    def _task_context(self, task: Task) -> str:
+        if self.context_tokens <= 0:
+            return ""
+        return self._get_context_index().context_for(task)
+    
+    def _update_context(self, file_path: str, content: str):
+        """文件写出后用其中的函数、类与路由签名更新检索索引"""
+        if self._context_index is not None:
+            self._context_index.update_file(file_path, content)
+    
+    def _update_context_signatures(self, file_path: str, signatures: List[str]):
+        """流式写出的文件：用边写边提取的签名更新检索索引"""
+        if self._context_index is not None:
+            self._context_index.update_signatures(file_path, signatures)
+    
+    def _patch_request(self, task: Task) -> Optional[Tuple[str, str, str]]:
+        """任务可以用补丁更新时返回 (现有代码, 提示词, 系统提示词)，否则返回 None
+
+        需要：增量构建、构建清单中有上次生成时的任务详情且与当前不同、输出文件可以读回，
+        该文件不是因为代码检查未通过而重新生成，并且有检查适用于该文件类型
+        （补丁应用错位时无法发现，没有检查的文件直接完整重新生成）。
+        """
+        if not self.patch_updates or not self.incremental or self.manifest is None or task.file_path in self._repairs:
+            return None
+        if not has_check(task.file_path, self.verifier.linters if self.verifier is not None else None):
+            return None
+        entry = self.manifest.tasks.get(task.key) or {}
+        if 'detail' not in entry:
+            return None
+        delta = describe_delta(entry['detail'], task_snapshot(task))
+        if not delta:
+            return None
+        current_code = self.sink.read(task.file_path)
+        if not current_code or len(current_code) > MAX_PATCH_SOURCE_CHARS:
+            return None
+        prompt, system = self.prompt_builder.build_patch(task, current_code, delta, self._task_context(task))
+        self.patch_stats['attempted'] += 1
+        return current_code, prompt, system
+    
+    def _apply_patch(self, task: Task, current_code: str, response: str) -> bool:
+        """应用补丁并做本地语法检查后写出；失败时返回 False，由调用方完整重新生成"""
+        try:
+            if response.startswith("[ERROR]"):
+                raise PatchError(response)
+            code = apply_patch_response(current_code, response)
+            error = verify_source(task.file_path, code)
+            if error:
+                raise PatchError(error)
+        except PatchError as e:
+            self.patch_stats['fallback'] += 1
+            print(f"补丁更新失败，改为完整重新生成: {task.file_path} - {str(e)}")
+            return False
+        self._write_file(task.file_path, code)
+        self.patch_stats['applied'] += 1
+        return True
+    
+    def _render_template(self, task: Task) -> Optional[str]:
+        if not self.templates or task.file_path in self._repairs:
+            return None
+        if task.key not in self._rendered:
+            self._rendered[task.key] = render_task(task, self.architecture)
+        return self._rendered[task.key]
+
+    def _has_template(self, task: Task) -> bool:
+        return self._render_template(task) is not None
+
+    def _try_template(self, task: Task) -> bool:
+        """用本地模板渲染并写出任务的文件，成功时返回 True；模板渲染的文件未通过检查时由模型重新生成"""
+        started = time.perf_counter()
+        content = self._render_template(task)
+        if content is None:
+            return False
+        tracer.record("render_template", started, time.perf_counter() - started, file=task.file_path)
+        self._write_file(task.file_path, content)
+        self.template_stats['rendered'] += 1
+        self.template_stats['seconds'] += time.perf_counter() - started
+        return True
+    
+    def _llm_args(self, file_paths: List[str], prompt: str, system: str, stage: str,
+                  expected_tokens: Optional[int] = None, json_output: bool = False) -> Dict:
+        """生成文件的模型调用参数
+
+        记录每个文件对应的请求，文件未通过代码检查时删除该请求的缓存结果；
+        重新生成（修复）的请求跳过缓存读取。
+        """
+        request = {'prompt': prompt, 'system': system, 'json_output': json_output, 'model': TASK_MODEL,
+                   'temperature': TASK_TEMPERATURE, 'stage': stage, 'expected_tokens': expected_tokens}
+        for file_path in file_paths:
+            self._requests[file_path] = request
+        return dict(request, use_cache=not any(file_path in self._repairs for file_path in file_paths),
+                    timeout=self._call_timeout(), deadline=self._deadline_at)
+    
+    def _forget_response(self, file_path: str):
+        """删除生成该文件的缓存结果，重新生成与下次构建都重新请求模型，而不是拿回同一份有问题的代码"""
+        request = self._requests.pop(file_path, None)
+        if request is not None:
+            forget_cached(**request)
+    
+    def _try_patch(self, task: Task) -> bool:
+        """尝试用补丁更新现有文件，成功时返回 True"""
+        request = self._patch_request(task)
+        if request is None:
+            return False
+        current_code, prompt, system = request
+        response = call_llm(**self._llm_args([task.file_path], prompt, system, f"{task.type}_patch"))
+        return self._apply_patch(task, current_code, response)
+    
+    async def _try_patch_async(self, task: Task) -> bool:
+        """_try_patch 的异步版本"""
+        request = self._patch_request(task)
+        if request is None:
+            return False
+        current_code, prompt, system = request
+        response = await call_llm_async(**self._llm_args([task.file_path], prompt, system, f"{task.type}_patch"), hedge=self.hedge)
+        return self._apply_patch(task, current_code, response)
+    
+    def _generate_module(self, task: Task):
+        """生成模块代码"""
+        if self._try_template(task):
+            self.generated_files.append(f"生成模块（模板）: {task.file_path}")
+            return
+        if self._try_patch(task):
+            self.generated_files.append(f"更新模块: {task.file_path}")
+            return
+        prompt, system = self._build_module_prompt(task)
         
-        code = call_llm(
-            prompt=prompt,
-            system="你是一位资深软件开发工程师，专注于编写高质量、可维护的代码。",
-            temperature=0.2
-        )
+        if self.stream:
+            self._write_stream(task.file_path, stream_llm(**self._llm_args([task.file_path], prompt, system, task.type, task.expected_tokens)))
+        else:
+            code = call_llm(**self._llm_args([task.file_path], prompt, system, task.type, task.expected_tokens))
+            self._check_llm_output(code)
+            self._write_file(task.file_path, strip_code_fences(code))
+        self.generated_files.append(f"生成模块: {task.file_path}")
+    
+    async def _generate_module_async(self, task: Task):
+        """异步生成模块代码"""
+        if self._try_template(task):
+            self.generated_files.append(f"生成模块（模板）: {task.file_path}")
+            return
+        if await self._try_patch_async(task):
+            self.generated_files.append(f"更新模块: {task.file_path}")
+            return
+        prompt, system = self._build_module_prompt(task)
         
-        self._write_file(task['file_path'], code)
-        self.generated_files.append(f"生成模块: {task['file_path']}")
+        if self.stream:
+            await self._write_stream_async(task.file_path, stream_llm_async(**self._llm_args([task.file_path], prompt, system, task.type, task.expected_tokens)))
+        else:
+            code = await call_llm_async(**self._llm_args([task.file_path], prompt, system, task.type, task.expected_tokens), hedge=self.hedge)
+            self._check_llm_output(code)
+            self._write_file(task.file_path, strip_code_fences(code))
+        self.generated_files.append(f"生成模块: {task.file_path}")
     
-    def _generate_data_model(self, task: Dict):
+    def _generate_data_model(self, task: Task):
         """生成数据模型代码"""
-        architecture_summary = {
-            'tech_stack': self.architecture.get('tech_stack'),
-            'model_description': {
-                'name': task['model_name'],
-                'fields': task['fields']
-            }
-        }
-        
-        prompt = TASK_PROMPT_TEMPLATE.format(
-            architecture_summary=json.dumps(architecture_summary, indent=2),
-            task_description=task['description'],
-            file_path=task['file_path']
-        )
+        if self._try_template(task):
+            self.generated_files.append(f"生成数据模型（模板）: {task.file_path}")
+            return
+        if self._try_patch(task):
+            self.generated_files.append(f"更新数据模型: {task.file_path}")
+            return
+        prompt, system = self._build_data_model_prompt(task)
         
-        code = call_llm(
-            prompt=prompt,
-            system="你是一位资深软件开发工程师，专注于数据模型设计和实现。",
-            temperature=0.2
-        )
+        if self.stream:
+            self._write_stream(task.file_path, stream_llm(**self._llm_args([task.file_path], prompt, system, task.type, task.expected_tokens)))
+        else:
+            code = call_llm(**self._llm_args([task.file_path], prompt, system, task.type, task.expected_tokens))
+            self._check_llm_output(code)
+            self._write_file(task.file_path, strip_code_fences(code))
+        self.generated_files.append(f"生成数据模型: {task.file_path}")
+    
+    async def _generate_data_model_async(self, task: Task):
+        """异步生成数据模型代码"""
+        if self._try_template(task):
+            self.generated_files.append(f"生成数据模型（模板）: {task.file_path}")
+            return
+        if await self._try_patch_async(task):
+            self.generated_files.append(f"更新数据模型: {task.file_path}")
+            return
+        prompt, system = self._build_data_model_prompt(task)
         
-        self._write_file(task['file_path'], code)
-        self.generated_files.append(f"生成数据模型: {task['file_path']}")
+        if self.stream:
+            await self._write_stream_async(task.file_path, stream_llm_async(**self._llm_args([task.file_path], prompt, system, task.type, task.expected_tokens)))
+        else:
+            code = await call_llm_async(**self._llm_args([task.file_path], prompt, system, task.type, task.expected_tokens), hedge=self.hedge)
+            self._check_llm_output(code)
+            self._write_file(task.file_path, strip_code_fences(code))
+        self.generated_files.append(f"生成数据模型: {task.file_path}")
+    
+    def _generate_config_files(self, task: Task):
+        """生成配置文件：package.json 与有模板的配置文件在本地生成，其余配置文件由模型生成"""
+        self._write_package_json()
+        self._write_model_base()
+        for file_path in self._get_config_file_paths():
+            if self._write_config_template(file_path):
+                continue
+            prompt, system = self.prompt_builder.build_config(file_path)
+            content = call_llm(**self._llm_args([file_path], prompt, system, task.type))
+            self._check_llm_output(content)
+            self._write_file(file_path, strip_code_fences(content))
+            self.generated_files.append(f"生成配置文件: {file_path}")
+    
+    async def _generate_config_files_async(self, task: Task):
+        """_generate_config_files 的异步版本"""
+        self._write_package_json()
+        self._write_model_base()
+        for file_path in self._get_config_file_paths():
+            if self._write_config_template(file_path):
+                continue
+            prompt, system = self.prompt_builder.build_config(file_path)
+            content = await call_llm_async(**self._llm_args([file_path], prompt, system, task.type), hedge=self.hedge)
+            self._check_llm_output(content)
+            self._write_file(file_path, strip_code_fences(content))
+            self.generated_files.append(f"生成配置文件: {file_path}")
     
-    def _generate_config_files(self, task: Dict):
-        """生成配置文件"""
-        tech_stack = task['tech_stack']
+    def _write_config_template(self, file_path: str) -> bool:
+        """用本地模板写出配置文件，没有对应模板时返回 False"""
+        if not self.templates:
+            return False
+        started = time.perf_counter()
+        content = render_config(file_path, self.architecture.get('project_name', 'my_project'),
+                                self.architecture.get('tech_stack', {}))
+        if content is None:
+            return False
+        tracer.record("render_template", started, time.perf_counter() - started, file=file_path)
+        self._write_file(file_path, content)
+        self.template_stats['rendered'] += 1
+        self.template_stats['seconds'] += time.perf_counter() - started
+        self.generated_files.append(f"生成配置文件（模板）: {file_path}")
+        return True
+    
+    def _write_model_base(self):
+        """使用模板时写出数据模型共用的 models/base.py（关系型数据库的 SQLAlchemy Base）"""
+        if not self.templates:
+            return
+        started = time.perf_counter()
+        content = render_model_base(self.architecture.get('tech_stack', {}))
+        if content is None:
+            return
+        file_path = f"{self._project_dir()}/models/base.py"
+        tracer.record("render_template", started, time.perf_counter() - started, file=file_path)
+        self._write_file(file_path, content)
+        self.template_stats['rendered'] += 1
+        self.template_stats['seconds'] += time.perf_counter() - started
+        self.generated_files.append(f"生成数据模型基础文件（模板）: {file_path}")
+    
+    def _write_package_json(self):
+        """生成 package.json 如果使用 Node.js"""
+        tech_stack = self.architecture.get('tech_stack', {})
         
-        # 生成 package.json 如果使用 Node.js
         if tech_stack.get('backend') == 'Node.js' or tech_stack.get('frontend') == 'React':
             content = {
                 "name": self.architecture.get('project_name', 'my_project'),
@@ -184,50 +839,205 @@ class TaskScheduler:
                 }
             }
             
-            file_path = f"{self.architecture.get('project_name', 'my_project')}/package.json"
+            file_path = f"{self._project_dir()}/package.json"
             self._write_file(file_path, json.dumps(content, indent=2))
             self.generated_files.append(f"生成配置文件: {file_path}")
     
+    def _check_llm_output(self, code: str):
+        """模型调用失败时抛出异常，避免把错误信息当作代码写入文件并记入构建清单"""
+        if code.startswith("[ERROR]"):
+            raise RuntimeError(code)
+    
     def _write_file(self, file_path: str, content: str):
-        """将内容写入文件"""
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w') as f:
-            f.write(content)
+        """将内容交给输出目标写出，并提交代码检查"""
+        with tracer.span("write_file", file=file_path, chars=len(content)):
+            self.sink.write(file_path, content)
+            self._update_context(file_path, content)
+            self._submit_check(file_path, content)
+    
+    def _write_stream(self, file_path: str, chunks: Iterable[str]):
+        """将流式内容去除代码块标记后边接收边交给输出目标，全部完成后才提交
+
+        写入磁盘时不在内存中保留完整文件：签名边写边提取，代码检查由检查进程从磁盘读取。
+        """
+        stripper = CodeFenceStripper()
+        signatures = SignatureCollector()
+        writer = self.sink.open(file_path)
+        stats = [0, 0.0]
+        try:
+            for chunk in chunks:
+                self._write_chunk(writer, signatures, stripper.feed(chunk), stats)
+            self._write_chunk(writer, signatures, stripper.finish(), stats)
+        except BaseException:
+            writer.abort()
+            raise
+        self._commit_stream(file_path, writer, signatures, stats)
+    
+    async def _write_stream_async(self, file_path: str, chunks: AsyncIterable[str]):
+        """_write_stream 的异步版本"""
+        stripper = CodeFenceStripper()
+        signatures = SignatureCollector()
+        writer = self.sink.open(file_path)
+        stats = [0, 0.0]
+        try:
+            async for chunk in chunks:
+                self._write_chunk(writer, signatures, stripper.feed(chunk), stats)
+            self._write_chunk(writer, signatures, stripper.finish(), stats)
+        except BaseException:
+            writer.abort()
+            raise
+        self._commit_stream(file_path, writer, signatures, stats)
+
+    @staticmethod
+    def _write_chunk(writer, signatures: SignatureCollector, text: str, stats: List):
+        """写出一段流式内容，stats 累计 [字符数, 写出耗时]"""
+        started = time.perf_counter()
+        writer.write(text)
+        signatures.feed(text)
+        stats[0] += len(text)
+        stats[1] += time.perf_counter() - started
+
+    def _commit_stream(self, file_path: str, writer, signatures: SignatureCollector, stats: List):
+        """提交流式写出的文件并提交代码检查；write_file span 的耗时只计写出与提交，不含等待模型输出的时间"""
+        started = time.perf_counter()
+        content = writer.commit()
+        self._update_context_signatures(file_path, signatures.finish())
+        self._submit_check(file_path, content)
+        finished = time.perf_counter()
+        seconds = stats[1] + finished - started
+        tracer.record("write_file", finished - seconds, seconds, file=file_path, chars=stats[0], streamed=True)
+    
+    def _submit_check(self, file_path: str, content: Optional[str]):
+        """把刚写出的文件提交到检查进程池，不等待结果；content 为 None 时由检查进程读取磁盘上的文件"""
+        if self.verifier is None or not self.verifier.needs_check(file_path):
+            self._requests.pop(file_path, None)
+            return
+        future = self.verifier.submit(file_path, content) if content is not None else self.verifier.submit_file(file_path)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # 串行模式在构建末尾统一收取结果
+            self._pending_checks.append((file_path, content, future))
+            return
+        self._check_tasks.append(asyncio.ensure_future(self._check_async(file_path, content, future)))
+    
+    async def _check_async(self, file_path: str, content: Optional[str], future):
+        """等待检查结果，未通过时立即定向重新生成"""
+        error, seconds = await asyncio.wrap_future(future)
+        task = self._on_check_result(file_path, content, error, seconds)
+        if task is not None:
+            await self._run_limited_async(task, self._semaphore)
+    
+    async def _drain_checks_async(self):
+        """等待所有检查（以及由此触发的重新生成）完成"""
+        started = time.perf_counter()
+        while self._check_tasks:
+            pending, self._check_tasks = self._check_tasks, []
+            await asyncio.gather(*pending)
+        self.verification_stats['wait_seconds'] += time.perf_counter() - started
+    
+    def _drain_checks(self):
+        """串行模式：收取检查结果，未通过的文件重新生成后再次检查"""
+        started = time.perf_counter()
+        while self._pending_checks:
+            pending, self._pending_checks = self._pending_checks, []
+            for file_path, content, future in pending:
+                error, seconds = future.result()
+                task = self._on_check_result(file_path, content, error, seconds)
+                if task is not None:
+                    self._run_task(task)
+        self.verification_stats['wait_seconds'] += time.perf_counter() - started
+    
+    def _on_check_result(self, file_path: str, content: Optional[str], error: Optional[str], seconds: float) -> Optional[Task]:
+        """记录检查结果；需要重新生成时返回对应的任务（流式写出的文件此时才读回内容，用于修复提示词）"""
+        self.verification_stats['files'] += 1
+        self.verification_stats['seconds'] += seconds
+        if error is None:
+            self._repairs.pop(file_path, None)
+            self.verification_errors.pop(file_path, None)
+            self._requests.pop(file_path, None)
+            return None
+        
+        self.verification_stats['failed'] += 1
+        self._forget_response(file_path)
+        task = next((task for task in self.task_queue if task.file_path == file_path), None)
+        attempts = self.regenerations.get(file_path, 0)
+        if task is not None and attempts < self.max_regenerations and self._remaining_time() != 0:
+            self.regenerations[file_path] = attempts + 1
+            if content is None:
+                content = self.sink.read(file_path) or ""
+            self._repairs[file_path] = (content, error)
+            print(f"🔧 代码检查未通过，重新生成: {file_path} - {error}")
+            return task
+        
+        # 无法重新生成或已达到次数上限：记为失败，并让下次增量构建重新生成
+        self._repairs.pop(file_path, None)
+        self.verification_errors[file_path] = error
+        self.task_results.pop(file_path, None)
+        self.task_errors[file_path] = f"代码检查未通过: {error}"
+        if self.manifest is not None:
+            self.manifest.tasks.pop(file_path, None)
+        return None
+    
+    def _finish_build(self):
+        """等待后台写入完成，把写入失败的文件记为任务失败，再保存构建清单
+
+        非磁盘输出（内存、归档）不读写构建清单，整个构建不接触磁盘。
+        """
+        self.sink.flush()
+        for path, error in self.sink.errors.items():
+            self.task_errors[path] = error
+            self.task_results.pop(path, None)
+            self.manifest.tasks.pop(path, None)
+        if self.sink.persistent:
+            self.manifest.save()
+    
+    def close(self):
+        """关闭调度器自己创建的输出目标与检查进程池；外部传入的由调用方关闭"""
+        if self._owns_sink:
+            self.sink.close()
+        if self._owns_verifier and self.verifier is not None:
+            self.verifier.close()
+    
+    def _project_dir(self) -> str:
+        """项目输出目录"""
+        project_name = self.architecture.get('project_name', 'my_project')
+        return os.path.join(self.output_root, project_name) if self.output_root else project_name
     
     def _get_module_file_path(self, module_name: str) -> str:
         """根据模块名获取文件路径"""
         tech_stack = self.architecture.get('tech_stack', {})
-        project_name = self.architecture.get('project_name', 'my_project')
+        project_dir = self._project_dir()
         
         if tech_stack.get('backend') == 'Node.js':
-            return f"{project_name}/backend/{module_name.lower()}.js"
+            return f"{project_dir}/backend/{module_name.lower()}.js"
         elif tech_stack.get('backend') == 'Django':
-            return f"{project_name}/backend/{module_name.lower()}/views.py"
+            return f"{project_dir}/backend/{module_name.lower()}/views.py"
         else:
-            return f"{project_name}/backend/{module_name.lower()}.py"
+            return f"{project_dir}/backend/{module_name.lower()}.py"
     
     def _get_model_file_path(self, model_name: str) -> str:
         """根据模型名获取文件路径"""
         tech_stack = self.architecture.get('tech_stack', {})
-        project_name = self.architecture.get('project_name', 'my_project')
+        project_dir = self._project_dir()
         
         if tech_stack.get('database') == 'MongoDB':
-            return f"{project_name}/models/{model_name.lower()}_schema.js"
+            return f"{project_dir}/models/{model_name.lower()}_schema.js"
         elif tech_stack.get('database') == 'PostgreSQL':
-            return f"{project_name}/models/{model_name.lower()}.py"
+            return f"{project_dir}/models/{model_name.lower()}.py"
         else:
-            return f"{project_name}/models/{model_name.lower()}.py"
+            return f"{project_dir}/models/{model_name.lower()}.py"
     
     def _get_config_file_paths(self) -> List[str]:
         """获取配置文件路径列表"""
         tech_stack = self.architecture.get('tech_stack', {})
-        project_name = self.architecture.get('project_name', 'my_project')
+        project_dir = self._project_dir()
         paths = []
         
         if tech_stack.get('infrastructure') == 'Docker':
-            paths.append(f"{project_name}/Dockerfile")
+            paths.append(f"{project_dir}/Dockerfile")
         if tech_stack.get('infrastructure') == 'Kubernetes':
-            paths.append(f"{project_name}/k8s-deployment.yaml")
+            paths.append(f"{project_dir}/k8s-deployment.yaml")
         
         return paths
 
@@ -236,11 +1046,68 @@ class TaskScheduler:
         print("\n📋 任务执行结果:")
         print(f"总任务数: {len(self.task_queue)}")
         print(f"生成文件数: {len(self.generated_files)}")
+        sink_stats = self.sink.stats()
+        if sink_stats['skipped']:
+            print(f"内容未变化未重写的文件数: {sink_stats['skipped']}")
+        if self.skipped_tasks:
+            print(f"跳过任务数（输入未变化）: {self.skipped_tasks}")
+        if self.task_errors:
+            print(f"失败任务数: {len(self.task_errors)}")
+            for key, error in self.task_errors.items():
+                print(f"- {key}: {error}")
+        if self.verification_stats['files']:
+            stats = self.verification_stats
+            print(f"代码检查: {stats['files']} 次，未通过 {stats['failed']} 次，检查耗时 {stats['seconds']:.2f}s"
+                  f"（构建末尾等待 {stats['wait_seconds']:.2f}s），重新生成 {sum(self.regenerations.values())} 个文件")
+        if self.template_stats['rendered']:
+            print(f"模板生成: {self.template_stats['rendered']} 个文件，共 {self.template_stats['seconds'] * 1000:.1f}ms，未调用 LLM")
+        if self.patch_stats['attempted']:
+            print(f"补丁更新: 尝试 {self.patch_stats['attempted']} 个文件，成功 {self.patch_stats['applied']} 个，"
+                  f"退回完整重新生成 {self.patch_stats['fallback']} 个")
+        if self._context_index is not None and self._context_index.stats()['queries']:
+            stats = self._context_index.stats()
+            print(f"跨模块上下文: {stats['queries']} 次检索，共 {stats['seconds'] * 1000:.1f}ms，附带 {stats['context_tokens']} token"
+                  f"（附带完整架构约需 {stats['full_tokens']} token，节省 {stats['saved_tokens']} token），"
+                  f"索引更新 {stats['updates']} 次")
+        cache_stats = response_cache.stats()
+        print(f"LLM缓存命中: {cache_stats['hits']} / 未命中: {cache_stats['misses']}")
+        metrics.print_report()
+        build_report = metrics.report(since=self._metrics_mark)
+        print(f"本次构建前缀缓存命中率: {build_report['cache_hit_ratio']:.1%} "
+              f"（{build_report['cached_tokens']} / {build_report['prompt_tokens']} 输入 token）")
+        governor_stats = governor.stats()
+        print(f"请求重试: {governor_stats['retries']} 次（429 限流 {governor_stats['rate_limited']} 次），"
+              f"当前并发上限: {governor_stats['concurrency_limit']}")
+        hedge_stats = hedging.stats()
+        if hedge_stats['hedged']:
+            print(f"对冲请求: {hedge_stats['hedged']} 次，其中 {hedge_stats['hedge_wins']} 次先于原请求完成")
+        router.print_report()
+        tracer.print_report()
         print("\n生成的文件列表:")
         for file in self.generated_files:
             print(f"- {file}")
 
 
+def build_project(architecture: Dict, concurrent: bool = True, sink: Optional[OutputSink] = None) -> TaskScheduler:
+    """根据架构设计创建项目结构、构建并执行任务队列，最后打印结果
+
+    sink 为 MemorySink / ArchiveSink 时生成结果留在内存或写入归档，不接触磁盘。
+    """
+    scheduler = TaskScheduler(architecture, sink=sink)
+    try:
+        if not scheduler.create_project_structure():
+            print("❌ 项目结构创建失败")
+            return scheduler
+        
+        task_count = scheduler.build_task_queue()
+        print(f"构建了 {task_count} 个任务")
+        scheduler.execute_tasks(concurrent=concurrent)
+    finally:
+        scheduler.close()
+    scheduler.print_summary()
+    return scheduler
+
+
 if __name__ == "__main__":
     # 示例用法
     from Software_Architect import design_architecture
@@ -297,8 +1164,8 @@ if __name__ == "__main__":
         task_count = scheduler.build_task_queue()
         print(f"构建了 {task_count} 个任务")
         
-        # 执行任务
-        scheduler.execute_tasks()
+        # 并发执行任务
+        scheduler.execute_tasks(concurrent=True)
         
         # 打印结果
         scheduler.print_summary()
\ No newline at end of file
@@ -0,0 +1,94 @@
+# tests/test_batch_runner.py
+import asyncio
+
+import pytest
+
+from batch_runner import FairShareLimiter
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_free_slot_goes_to_project_using_fewest():
+    async def main():
+        limiter = FairShareLimiter(capacity=2)
+        await limiter.acquire("big")
+        await limiter.acquire("big")
+        order = []
+
+        async def worker(project_id: str):
+            async with limiter.for_project(project_id):
+                order.append(project_id)
+                await asyncio.sleep(0)
+
+        # 大项目先排队三个任务，小项目后到，但空出的名额先分给小项目
+        tasks = [asyncio.ensure_future(worker("big")) for _ in range(3)]
+        await _settle()
+        tasks.append(asyncio.ensure_future(worker("small")))
+        await _settle()
+        assert order == []
+        limiter.release("big")
+        await _settle()
+        assert order[0] == "small"
+        limiter.release("big")
+        await asyncio.gather(*tasks)
+        assert sorted(order) == ["big", "big", "big", "small"]
+        assert limiter.in_use == 0
+
+    asyncio.run(main())
+
+
+def test_new_caller_does_not_jump_queue():
+    async def main():
+        limiter = FairShareLimiter(capacity=1)
+        await limiter.acquire("a")
+        waiter = asyncio.ensure_future(limiter.acquire("b"))
+        await _settle()
+        limiter.release("a")
+        # 名额已经分给等待中的 b
+        assert limiter.active == {"a": 0, "b": 1}
+        late = asyncio.ensure_future(limiter.acquire("c"))
+        await _settle()
+        assert waiter.done() and not late.done()
+        limiter.release("b")
+        await late
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_releases_its_place():
+    async def main():
+        limiter = FairShareLimiter(capacity=1)
+        await limiter.acquire("a")
+        cancelled = asyncio.ensure_future(limiter.acquire("b"))
+        other = asyncio.ensure_future(limiter.acquire("c"))
+        await _settle()
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert not limiter.waiters["b"]
+        limiter.release("a")
+        await other
+        assert limiter.in_use == 1
+        assert limiter.active.get("b", 0) == 0
+
+    asyncio.run(main())
+
+
+def test_cancel_after_grant_returns_slot():
+    async def main():
+        limiter = FairShareLimiter(capacity=1)
+        await limiter.acquire("a")
+        waiter = asyncio.ensure_future(limiter.acquire("b"))
+        await _settle()
+        # 名额分配给 b 之后、b 恢复运行之前被取消
+        limiter.release("a")
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.in_use == 0
+        assert limiter.active == {"a": 0, "b": 0}
+
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+# tests/test_code_patch.py
+from types import SimpleNamespace
+
+import pytest
+
+from bench_server import synthetic_architecture
+from code_patch import PatchError, apply_edits, apply_patch_response, parse_edits, task_snapshot
+from code_verifier import CodeVerifier
+from task_model import MODULE_TASK
+from task_scheduler import TaskScheduler
+
+SOURCE = (
+    "class Service:\n"
+    "    def load(self):\n"
+    "        return 1\n"
+    "\n"
+    "    def save(self):  \n"
+    "        return 2\n"
+)
+
+
+def _patch(search: str, replace: str) -> str:
+    return f"<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE"
+
+
+def test_parse_edits_requires_blocks():
+    assert parse_edits(_patch("a = 1", "a = 2")) == [("a = 1", "a = 2")]
+    with pytest.raises(PatchError):
+        parse_edits("没有补丁")
+
+
+def test_exact_match():
+    result = apply_edits(SOURCE, [("        return 1", "        return 10")])
+    assert "        return 10\n" in result
+    assert "return 2" in result
+
+
+def test_trailing_whitespace_is_ignored():
+    result = apply_edits(SOURCE, [("    def save(self):\n        return 2", "    def save(self):\n        return 20")])
+    assert result.endswith("    def save(self):\n        return 20\n")
+
+
+def test_indentation_fallback_reindents_replacement():
+    # SEARCH 与 REPLACE 都少了一层缩进，唯一匹配时按原文缩进修正
+    result = apply_edits(SOURCE, [("def load(self):\n    return 1", "def load(self):\n    value = 1\n    return value")])
+    assert "    def load(self):\n        value = 1\n        return value\n" in result
+    compile(result, "service.py", "exec")
+
+
+def test_ambiguous_or_missing_search_fails():
+    source = "if a:\n    x = 1\nif b:\n        x = 1\n"
+    with pytest.raises(PatchError):
+        apply_edits(source, [("x = 1", "x = 2")])
+    # 精确匹配不存在时，忽略缩进后也有两处匹配
+    with pytest.raises(PatchError):
+        apply_edits(source, [("\tx = 1", "\tx = 2")])
+    with pytest.raises(PatchError):
+        apply_edits(source, [("y = 1", "y = 2")])
+
+
+def test_edits_apply_in_order():
+    response = _patch("        return 1", "        return 10") + "\n" + _patch("        return 10", "        return 100")
+    assert "return 100" in apply_patch_response(SOURCE, response)
+
+
+def _scheduler(tmp_path, backend: str, verifier=None) -> TaskScheduler:
+    architecture = synthetic_architecture(2)
+    architecture['tech_stack']['backend'] = backend
+    scheduler = TaskScheduler(architecture, output_root=str(tmp_path), templates=False,
+                              verify=verifier is not None, verifier=verifier)
+    scheduler.build_task_queue()
+    return scheduler
+
+
+def _module_task(scheduler: TaskScheduler):
+    task = next(task for task in scheduler.task_queue if task.type == MODULE_TASK)
+    # 构建清单中记录的上次任务详情与当前不同
+    scheduler.manifest = SimpleNamespace(tasks={task.key: {'detail': dict(task_snapshot(task), description="旧的职责")}})
+    scheduler.sink.write(task.file_path, SOURCE)
+    return task
+
+
+def test_apply_patch_writes_checked_result(tmp_path):
+    scheduler = _scheduler(tmp_path, "Python")
+    task = _module_task(scheduler)
+    assert scheduler._apply_patch(task, SOURCE, _patch("        return 1", "        return 10"))
+    assert "return 10" in scheduler.sink.read(task.file_path)
+    assert scheduler.patch_stats['applied'] == 1
+
+
+@pytest.mark.parametrize("response", [
+    "[ERROR] 请求失败",
+    "没有补丁块",
+    _patch("        return 3", "        return 30"),
+    _patch("        return 1", "        return (1"),
+])
+def test_apply_patch_falls_back_to_regeneration(tmp_path, response):
+    scheduler = _scheduler(tmp_path, "Python")
+    task = _module_task(scheduler)
+    assert not scheduler._apply_patch(task, SOURCE, response)
+    assert scheduler.sink.read(task.file_path) == SOURCE
+    assert scheduler.patch_stats['fallback'] == 1
+
+
+def test_patch_only_for_checked_file_types(tmp_path):
+    python = _scheduler(tmp_path / "py", "Python")
+    assert python._patch_request(_module_task(python)) is not None
+
+    # .js 没有内置检查，未配置检查工具时完整重新生成
+    node = _scheduler(tmp_path / "js", "Node.js")
+    assert node._patch_request(_module_task(node)) is None
+
+    linted = _scheduler(tmp_path / "lint", "Node.js", CodeVerifier(linters={'.js': [["node", "--check", "{path}"]]}))
+    assert linted._patch_request(_module_task(linted)) is not None
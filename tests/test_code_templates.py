@@ -0,0 +1,42 @@
+# tests/test_code_templates.py
+import pytest
+
+from code_templates import _crud_operation
+
+
+def _interface(name: str, method: str, endpoint: str):
+    return {'name': name, 'method': method, 'endpoint': endpoint}
+
+
+@pytest.mark.parametrize("interface, operation", [
+    (_interface("listTasks", "GET", "/api/tasks"), 'list'),
+    (_interface("getTasks", "GET", "/tasks"), 'list'),
+    (_interface("listTask", "GET", "/tasks"), 'list'),
+    (_interface("get_task", "GET", "/tasks/:id"), 'read'),
+    (_interface("createTask", "POST", "/tasks"), 'create'),
+    (_interface("update-task", "PUT", "/tasks/:id"), 'update'),
+    (_interface("updateTask", "patch", "/tasks/:id"), 'update'),
+    (_interface("deleteTask", "DELETE", "/tasks/:id"), 'delete'),
+])
+def test_standard_crud_shapes(interface, operation):
+    assert _crud_operation(interface, "Task") == operation
+
+
+@pytest.mark.parametrize("interface", [
+    # 名称带有额外含义，不是标准操作
+    _interface("getTaskStats", "GET", "/tasks/stats"),
+    _interface("createTaskComment", "POST", "/tasks"),
+    _interface("deleteTasksByOwner", "DELETE", "/tasks/:id"),
+    _interface("getTasks", "GET", "/tasks/archived"),
+    # 方法或路径参数与操作不符
+    _interface("getTask", "POST", "/tasks/:id"),
+    _interface("getTask", "GET", "/tasks"),
+    _interface("deleteTask", "DELETE", "/tasks"),
+    _interface("updateTask", "PUT", "/tasks/:taskId"),
+    _interface("getTask", "GET", "/users/:userId/tasks/:id"),
+    _interface("getTask", "GET", "tasks/:id"),
+    # 操作的是其他数据模型
+    _interface("getUser", "GET", "/tasks/:id"),
+])
+def test_other_interfaces_are_not_templated(interface):
+    assert _crud_operation(interface, "Task") is None
@@ -0,0 +1,84 @@
+# tests/test_llm_cache.py
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+def _keys(cache: LLMCache):
+    return {row[0] for row in cache._connect().execute("SELECT key FROM responses")}
+
+
+def test_get_returns_put_value_and_counts_hits(clock):
+    cache = LLMCache(path=":memory:")
+    assert cache.get("a") is None
+    cache.put("a", "响应")
+    assert cache.get("a") == "响应"
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_evicts_least_recently_used_entry(clock):
+    cache = LLMCache(path=":memory:", max_entries=3, evict_interval=1)
+    for key in ("a", "b", "c"):
+        cache.put(key, key)
+        clock.advance(1)
+    # 读取会刷新最近访问时间，最久未使用的变为 b
+    assert cache.get("a") == "a"
+    clock.advance(1)
+    cache.put("d", "d")
+    assert _keys(cache) == {"a", "c", "d"}
+
+
+def test_evicts_by_total_size(clock):
+    cache = LLMCache(path=":memory:", max_bytes=10, evict_interval=1)
+    cache.put("a", "x" * 6)
+    clock.advance(1)
+    cache.put("b", "y" * 6)
+    assert _keys(cache) == {"b"}
+
+
+def test_expired_entry_is_a_miss_and_is_evicted(clock):
+    cache = LLMCache(path=":memory:", max_age=60, evict_interval=1)
+    cache.put("old", "旧")
+    clock.advance(61)
+    assert cache.get("old") is None
+    cache.put("new", "新")
+    assert _keys(cache) == {"new"}
+
+
+def test_eviction_runs_every_interval(clock):
+    cache = LLMCache(path=":memory:", max_entries=5, evict_interval=4)
+    for i in range(20):
+        cache.put(str(i), "x")
+        clock.advance(1)
+        # 两次淘汰之间最多超出上限 evict_interval - 1 条
+        assert len(_keys(cache)) < 5 + 4
+    # 淘汰在第 1、5、9、13、17 次写入时执行，之后又写入了 3 条
+    assert len(_keys(cache)) == 8
+
+
+def test_delete_removes_entry(clock):
+    cache = LLMCache(path=":memory:")
+    cache.put("a", "a")
+    cache.delete("a")
+    assert cache.get("a") is None
@@ -0,0 +1,83 @@
+# tests/test_work_queue.py
+from types import SimpleNamespace
+
+import pytest
+
+import work_queue
+from work_queue import WorkQueue, DONE, FAILED, LEASED, PENDING
+
+BUILD = "build-1"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(work_queue, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), lease_seconds=60, max_attempts=2)
+    queue.create_build(BUILD, {'project_name': "demo"}, {}, [
+        {'key': "a", 'type': "module", 'wave': 0},
+        {'key': "b", 'type': "module", 'wave': 1},
+    ])
+    yield queue
+    queue.close()
+
+
+def _state(queue: WorkQueue, key: str) -> str:
+    return next(task['state'] for task in queue.tasks(BUILD) if task['key'] == key)
+
+
+def test_later_wave_waits_for_earlier_wave(queue):
+    assert queue.lease(BUILD, "w1") == "a"
+    assert queue.lease(BUILD, "w2") is None
+    assert queue.complete(BUILD, "a", "w1")
+    assert queue.lease(BUILD, "w2") == "b"
+
+
+def test_expired_lease_is_taken_over(queue, clock):
+    assert queue.lease(BUILD, "w1") == "a"
+    clock.advance(59)
+    assert queue.lease(BUILD, "w2") is None
+    clock.advance(2)
+    assert queue.lease(BUILD, "w2") == "a"
+    # 原持有者的心跳与完成都不再生效
+    assert not queue.heartbeat(BUILD, "a", "w1")
+    assert not queue.complete(BUILD, "a", "w1")
+    assert queue.complete(BUILD, "a", "w2")
+    assert _state(queue, "a") == DONE
+    assert [key for _, key in queue.completed_since(BUILD)] == ["a"]
+
+
+def test_heartbeat_extends_lease(queue, clock):
+    assert queue.lease(BUILD, "w1") == "a"
+    clock.advance(50)
+    assert queue.heartbeat(BUILD, "a", "w1")
+    clock.advance(50)
+    assert queue.lease(BUILD, "w2") is None
+    assert _state(queue, "a") == LEASED
+
+
+def test_failed_task_retries_until_attempt_limit(queue):
+    assert queue.lease(BUILD, "w1") == "a"
+    queue.fail(BUILD, "a", "w1", "错误")
+    assert _state(queue, "a") == PENDING
+    assert queue.lease(BUILD, "w1") == "a"
+    queue.fail(BUILD, "a", "w1", "错误")
+    assert _state(queue, "a") == FAILED
+    assert queue.retry_failed(BUILD) == 1
+    assert _state(queue, "a") == PENDING
@@ -0,0 +1,313 @@
+# tracing.py
+import os
+import sys
+import json
+import time
+import atexit
+import asyncio
+import threading
+import functools
+import weakref
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# 设置为文件路径时启用追踪，进程退出时导出 Chrome trace-event JSON（可在 Perfetto / chrome://tracing 中查看）；
+# 路径中的 {pid} 替换为进程号，多进程构建时每个工作进程写入各自的文件
+TRACE_ENV = "CODEGEN_TRACE"
+# 启用追踪时同时运行采样分析器的采样间隔（毫秒），未设置时不采样
+SAMPLE_ENV = "CODEGEN_TRACE_SAMPLE_MS"
+# 内存中保留的事件数上限，超出后丢弃新事件并计数
+MAX_EVENTS = 1000000
+# 采样分析器记录的调用栈深度上限
+MAX_SAMPLE_DEPTH = 64
+# 采样分析器轨道编号的起点，与 span 轨道区分开
+SAMPLE_TRACK_BASE = 100000
+
+
+class Span:
+    """一个进行中的 span，可以在结束前补充属性（例如调用完成后的 token 数）"""
+    __slots__ = ('name', 'start', 'attributes')
+
+    def __init__(self, name: str, start: float, attributes: Dict):
+        self.name = name
+        self.start = start
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class _NullSpan:
+    """追踪关闭时使用的空 span"""
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """记录构建过程中各阶段的 span，导出为 Chrome trace-event JSON
+
+    每个线程、每个 asyncio 任务各自使用一条轨道，span 在轨道内按时间嵌套，
+    并发执行的任务并排显示，可以看出时间花在排队、网络、生成还是文件写出上。
+    未启用时 span() 只返回空 span，几乎没有开销。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._events: List[Dict] = []
+        self._dropped = 0
+        self._tracks = weakref.WeakKeyDictionary()
+        self._thread_tracks: Dict[int, int] = {}
+        self._track_names: Dict[int, str] = {}
+        self._next_track = 1
+        self._profiler = None
+
+    def enable(self, sample_ms: Optional[float] = None):
+        """开始记录；sample_ms 大于 0 时同时启动采样分析器"""
+        self.enabled = True
+        if sample_ms:
+            self.start_profiler(sample_ms / 1000.0)
+
+    def disable(self):
+        self.stop_profiler()
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self._events = []
+            self._dropped = 0
+
+    def _track(self) -> int:
+        """当前 asyncio 任务（不在事件循环中时为当前线程）对应的轨道编号"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        with self._lock:
+            if task is not None:
+                track = self._tracks.get(task)
+                if track is None:
+                    track = self._tracks[task] = self._new_track(f"{threading.current_thread().name} / {task.get_name()}")
+                return track
+            ident = threading.get_ident()
+            track = self._thread_tracks.get(ident)
+            if track is None:
+                track = self._thread_tracks[ident] = self._new_track(threading.current_thread().name)
+            return track
+
+    def _new_track(self, name: str) -> int:
+        track = self._next_track
+        self._next_track += 1
+        self._track_names[track] = name
+        return track
+
+    def _append(self, event: Dict):
+        with self._lock:
+            if len(self._events) >= MAX_EVENTS:
+                self._dropped += 1
+                return
+            self._events.append(event)
+
+    def _complete_event(self, name: str, start: float, duration: float, track: int, attributes: Dict) -> Dict:
+        return {
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self._origin) * 1e6,
+            'dur': max(duration, 0.0) * 1e6,
+            'pid': os.getpid(),
+            'tid': track,
+            'args': {key: value for key, value in attributes.items() if value is not None},
+        }
+
+    @contextmanager
+    def span(self, name: str, /, **attributes):
+        """记录一个 span；异常时在属性中记录错误"""
+        if not self.enabled:
+            yield _NULL_SPAN
+            return
+        track = self._track()
+        current = Span(name, time.perf_counter(), attributes)
+        try:
+            yield current
+        except BaseException as e:
+            current.attributes['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self._append(self._complete_event(name, current.start, time.perf_counter() - current.start,
+                                              track, current.attributes))
+
+    def traced(self, name: Optional[str] = None):
+        """装饰器：把函数（同步或异步）的每次调用记录为一个 span"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(span_name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name: str, start: float, duration: float, /, **attributes):
+        """记录一个已经结束的 span，start 为 time.perf_counter() 的读数（用于已有计时代码）"""
+        if not self.enabled:
+            return
+        self._append(self._complete_event(name, start, duration, self._track(), attributes))
+
+    def events(self) -> List[Dict]:
+        """全部事件，附带轨道名称的元数据事件"""
+        with self._lock:
+            events = list(self._events)
+            names = dict(self._track_names)
+        pid = os.getpid()
+        metadata = [
+            {'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': f"codegen ({pid})"}}
+        ] + [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': track, 'args': {'name': name}}
+            for track, name in names.items()
+        ]
+        return metadata + events
+
+    def export(self, path: str):
+        """把事件写入 Chrome trace-event JSON 文件"""
+        path = path.replace("{pid}", str(os.getpid()))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_events': self._dropped}}, f, ensure_ascii=False)
+        return path
+
+    def summary(self) -> Dict[str, Dict]:
+        """按 span 名称汇总次数、总耗时与最长耗时（秒），不含采样分析器的事件"""
+        result = {}
+        with self._lock:
+            events = [event for event in self._events if event['tid'] < SAMPLE_TRACK_BASE]
+        for event in events:
+            item = result.setdefault(event['name'], {'count': 0, 'total': 0.0, 'max': 0.0})
+            seconds = event['dur'] / 1e6
+            item['count'] += 1
+            item['total'] += seconds
+            item['max'] = max(item['max'], seconds)
+        return result
+
+    def print_report(self, limit: int = 10):
+        summary = self.summary()
+        if not summary:
+            return
+        print("追踪汇总（按总耗时，并发的 span 会重叠计算）:")
+        for name, item in sorted(summary.items(), key=lambda pair: -pair[1]['total'])[:limit]:
+            print(f"- {name}: {item['count']} 次，共 {item['total']:.2f}s，最长 {item['max']:.2f}s")
+
+    def start_profiler(self, interval: float = 0.005):
+        """启动采样分析器，按固定间隔采集各线程的调用栈，导出为火焰图式的 span"""
+        if self._profiler is None:
+            self._profiler = SamplingProfiler(self, interval)
+            self._profiler.start()
+
+    def stop_profiler(self):
+        if self._profiler is not None:
+            self._profiler.stop()
+            self._profiler = None
+
+
+class SamplingProfiler:
+    """基于 sys._current_frames() 的采样分析器
+
+    相邻采样中相同的调用栈前缀合并为一个 span，写入每个线程单独的采样轨道，
+    在 Perfetto 中显示为 CPU 侧代码（提示词构造、JSON 解析、检索等）的火焰图。
+    采样需要获得 GIL，间隔不宜小于 1ms。
+    """
+
+    def __init__(self, tracer: Tracer, interval: float = 0.005):
+        self.tracer = tracer
+        self.interval = interval
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        # {线程标识: [(帧标签, 开始时间)]}，外层在前
+        self._open: Dict[int, List] = {}
+        self._tracks: Dict[int, int] = {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="trace-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        now = time.perf_counter()
+        for ident in list(self._open):
+            self._close(ident, 0, now)
+
+    def _track(self, ident: int) -> int:
+        track = self._tracks.get(ident)
+        if track is None:
+            track = self._tracks[ident] = SAMPLE_TRACK_BASE + len(self._tracks)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            with self.tracer._lock:
+                self.tracer._track_names[track] = f"采样: {names.get(ident, ident)}"
+        return track
+
+    def _close(self, ident: int, keep: int, now: float):
+        """结束第 keep 层及更深的帧"""
+        frames = self._open.get(ident, [])
+        while len(frames) > keep:
+            label, start = frames.pop()
+            self.tracer._append(self.tracer._complete_event(label, start, now - start, self._track(ident), {}))
+
+    @staticmethod
+    def _stack(frame) -> List[str]:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.reverse()
+        return stack[:MAX_SAMPLE_DEPTH]
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            self.samples += 1
+            for ident in list(self._open):
+                if ident not in frames:
+                    self._close(ident, 0, now)
+                    del self._open[ident]
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = self._stack(frame)
+                opened = self._open.setdefault(ident, [])
+                common = 0
+                while common < len(opened) and common < len(stack) and opened[common][0] == stack[common]:
+                    common += 1
+                self._close(ident, common, now)
+                opened.extend((label, now) for label in stack[common:])
+
+
+# 全局追踪器，默认关闭（CODEGEN_TRACE=文件路径 时启用并在退出时导出）
+tracer = Tracer()
+
+if os.environ.get(TRACE_ENV):
+    tracer.enable(float(os.environ.get(SAMPLE_ENV) or 0))
+
+    def _export_at_exit():
+        tracer.stop_profiler()
+        print(f"追踪已导出: {tracer.export(os.environ[TRACE_ENV])}")
+
+    atexit.register(_export_at_exit)
@@ -0,0 +1,533 @@
+# work_queue.py
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from build_manifest import fingerprint
+
+# 队列数据库默认位置，可通过环境变量覆盖
+DEFAULT_QUEUE_PATH = os.environ.get("CODEGEN_QUEUE_PATH", ".codegen_queue.sqlite")
+# 任务租约时长（秒）：持有者超过该时间没有心跳，其他 worker 可以接手
+DEFAULT_LEASE_SECONDS = 120.0
+# 单个任务最多尝试的次数，超过后记为失败
+DEFAULT_MAX_ATTEMPTS = 3
+# 没有可领取的任务、但仍有其他 worker 持有租约时的轮询间隔（秒）
+POLL_INTERVAL = 1.0
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def worker_name() -> str:
+    """worker 标识：主机名:进程号，用于识别同一主机上已经退出的 worker"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    # 父进程被强制结束后，未被回收的 worker 会以僵尸进程的形式残留
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            return f.read().rpartition(')')[2].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return True
+
+
+class WorkQueue:
+    """基于 SQLite 的持久化构建任务队列
+
+    每个构建保存架构设计、输出选项以及所有任务的状态（pending / leased / done / failed）。
+    多个 worker 进程（可以在共享该文件的不同主机上）通过租约领取任务，执行期间定期心跳续约，
+    持有者崩溃后租约过期，任务自动回到可领取状态。进程中断后已完成的任务不会重新生成。
+
+    默认使用 WAL 模式，读写互不阻塞；WAL 依赖共享内存，队列文件放在网络文件系统上供
+    多台主机共享时需要 wal=False（使用回滚日志模式）。
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, wal: bool = True,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.wal = wal
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # 每个线程使用自己的连接（心跳线程与执行任务的线程并行访问）
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=" + ("WAL" if self.wal else "DELETE"))
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS builds (
+                    build_id TEXT PRIMARY KEY,
+                    project_name TEXT,
+                    architecture TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    finished_at REAL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS tasks (
+                    build_id TEXT NOT NULL,
+                    task_key TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    wave INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    fingerprint TEXT,
+                    seconds REAL,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (build_id, task_key)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(build_id, state, wave)")
+            # 任务完成的顺序记录，worker 按自增编号只读取上次之后新完成的任务
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS completions (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    build_id TEXT NOT NULL,
+                    task_key TEXT NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_build ON completions(build_id, seq)")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, sql_calls):
+        """在 BEGIN IMMEDIATE 事务中执行，保证领取任务时多个进程之间互斥"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = sql_calls(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def create_build(self, build_id: str, architecture: Dict, options: Dict, tasks: List[Dict]) -> bool:
+        """登记构建及其任务 [{key, type, wave, state, fingerprint}]；构建已存在时保留已有状态，返回 False"""
+        now = time.time()
+
+        def insert(conn):
+            exists = conn.execute("SELECT 1 FROM builds WHERE build_id = ?", (build_id,)).fetchone()
+            if exists:
+                return False
+            conn.execute(
+                "INSERT INTO builds (build_id, project_name, architecture, options, created_at) VALUES (?, ?, ?, ?, ?)",
+                (build_id, architecture.get('project_name'), json.dumps(architecture, ensure_ascii=False),
+                 json.dumps(options, ensure_ascii=False), now)
+            )
+            conn.executemany(
+                "INSERT INTO tasks (build_id, task_key, type, wave, state, fingerprint, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(build_id, task['key'], task['type'], task.get('wave', 0), task.get('state', PENDING),
+                  task.get('fingerprint'), now) for task in tasks]
+            )
+            conn.executemany(
+                "INSERT INTO completions (build_id, task_key) VALUES (?, ?)",
+                [(build_id, task['key']) for task in tasks if task.get('state') == DONE]
+            )
+            return True
+        return self._transaction(insert)
+
+    def load_build(self, build_id: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT architecture, options, finished_at FROM builds WHERE build_id = ?", (build_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'build_id': build_id, 'architecture': json.loads(row[0]), 'options': json.loads(row[1]), 'finished_at': row[2]}
+
+    def unfinished_builds(self) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT build_id FROM builds WHERE finished_at IS NULL ORDER BY created_at"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def lease(self, build_id: str, owner: str) -> Optional[str]:
+        """领取一个待执行或租约已过期的任务，返回任务标识；没有可领取的任务时返回 None
+
+        只领取最早未完成波次中的任务：前一波次的任务（被依赖的文件）全部完成前，后面的波次不会开始。
+        """
+        def take(conn):
+            now = time.time()
+            row = conn.execute(
+                """SELECT task_key FROM tasks
+                   WHERE build_id = ? AND (state = ? OR (state = ? AND lease_expires < ?))
+                     AND wave <= (SELECT MIN(wave) FROM tasks WHERE build_id = ? AND state IN (?, ?))
+                   ORDER BY wave, attempts, rowid LIMIT 1""",
+                (build_id, PENDING, LEASED, now, build_id, PENDING, LEASED)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """UPDATE tasks SET state = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ?
+                   WHERE build_id = ? AND task_key = ?""",
+                (LEASED, owner, now + self.lease_seconds, now, build_id, row[0])
+            )
+            return row[0]
+        return self._transaction(take)
+
+    def heartbeat(self, build_id: str, task_key: str, owner: str) -> bool:
+        """续约；租约已被其他 worker 接手时返回 False"""
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE build_id = ? AND task_key = ? AND state = ? AND lease_owner = ?",
+            (now + self.lease_seconds, now, build_id, task_key, LEASED, owner)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, build_id: str, task_key: str, owner: str, task_fingerprint: Optional[str] = None,
+                 seconds: Optional[float] = None) -> bool:
+        """标记任务完成；租约已不属于该 worker 时返回 False（任务已由其他 worker 接手）"""
+        def update(conn):
+            cursor = conn.execute(
+                """UPDATE tasks SET state = ?, fingerprint = ?, seconds = ?, error = NULL, lease_owner = NULL,
+                       lease_expires = NULL, updated_at = ?
+                   WHERE build_id = ? AND task_key = ? AND state = ? AND lease_owner = ?""",
+                (DONE, task_fingerprint, seconds, time.time(), build_id, task_key, LEASED, owner)
+            )
+            if cursor.rowcount != 1:
+                return False
+            conn.execute("INSERT INTO completions (build_id, task_key) VALUES (?, ?)", (build_id, task_key))
+            return True
+        return self._transaction(update)
+
+    def completed_since(self, build_id: str, after: int = 0) -> List[Tuple[int, str]]:
+        """编号大于 after 的完成记录 [(编号, 任务标识)]，按完成顺序"""
+        return self._connect().execute(
+            "SELECT seq, task_key FROM completions WHERE build_id = ? AND seq > ? ORDER BY seq", (build_id, after)
+        ).fetchall()
+
+    def fail(self, build_id: str, task_key: str, owner: str, error: str):
+        """记录失败；未达到尝试次数上限时放回队列"""
+        self._connect().execute(
+            """UPDATE tasks SET state = CASE WHEN attempts < ? THEN ? ELSE ? END, error = ?, lease_owner = NULL,
+                   lease_expires = NULL, updated_at = ?
+               WHERE build_id = ? AND task_key = ? AND state = ? AND lease_owner = ?""",
+            (self.max_attempts, PENDING, FAILED, error, time.time(), build_id, task_key, LEASED, owner)
+        )
+
+    def reclaim(self, build_id: str) -> int:
+        """把本机上已经退出的 worker 持有的租约放回队列，返回放回的任务数"""
+        host = socket.gethostname()
+        rows = self._connect().execute(
+            "SELECT task_key, lease_owner FROM tasks WHERE build_id = ? AND state = ?", (build_id, LEASED)
+        ).fetchall()
+        dead = [
+            (build_id, key) for key, owner in rows
+            if owner and owner.rpartition(':')[0] == host and not _pid_alive(int(owner.rpartition(':')[2]))
+        ]
+        if dead:
+            self._connect().executemany(
+                "UPDATE tasks SET state = ?, lease_owner = NULL, lease_expires = NULL WHERE build_id = ? AND task_key = ?",
+                [(PENDING,) + item for item in dead]
+            )
+        return len(dead)
+
+    def retry_failed(self, build_id: str) -> int:
+        """把失败的任务放回队列并重置尝试次数"""
+        cursor = self._connect().execute(
+            "UPDATE tasks SET state = ?, attempts = 0, updated_at = ? WHERE build_id = ? AND state = ?",
+            (PENDING, time.time(), build_id, FAILED)
+        )
+        return cursor.rowcount
+
+    def counts(self, build_id: str) -> Dict[str, int]:
+        rows = self._connect().execute(
+            "SELECT state, COUNT(*) FROM tasks WHERE build_id = ? GROUP BY state", (build_id,)
+        ).fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def tasks(self, build_id: str, state: Optional[str] = None) -> List[Dict]:
+        sql = "SELECT task_key, type, state, attempts, fingerprint, seconds, error FROM tasks WHERE build_id = ?"
+        params = [build_id]
+        if state:
+            sql += " AND state = ?"
+            params.append(state)
+        columns = ('key', 'type', 'state', 'attempts', 'fingerprint', 'seconds', 'error')
+        return [dict(zip(columns, row)) for row in self._connect().execute(sql + " ORDER BY wave, rowid", params)]
+
+    def mark_finished(self, build_id: str):
+        self._connect().execute("UPDATE builds SET finished_at = ? WHERE build_id = ?", (time.time(), build_id))
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _make_scheduler(architecture: Dict, options: Dict):
+    from task_scheduler import TaskScheduler
+    return TaskScheduler(
+        architecture,
+        output_root=options.get('output_root', ""),
+        stream=options.get('stream', False),
+        call_timeout=options.get('call_timeout'),
+        # 任务逐个领取执行，不做批量合并；增量跳过在入队时完成，worker 中只用于决定能否补丁更新
+        incremental=options.get('incremental', False),
+    )
+
+
+def enqueue_build(architecture: Dict, queue: WorkQueue, output_root: str = "", incremental: bool = True,
+                  stream: bool = False, call_timeout: Optional[float] = None) -> str:
+    """把一个构建的所有任务写入队列，返回构建标识
+
+    同一架构与输出目录的构建标识相同，重复入队不会覆盖已有的任务状态。
+    增量构建时输入未变化的任务直接记为完成。
+    """
+    options = {'output_root': output_root, 'stream': stream, 'call_timeout': call_timeout, 'incremental': incremental}
+    build_id = fingerprint(architecture, output_root)[:16]
+    if queue.load_build(build_id) is not None:
+        return build_id
+
+    scheduler = _make_scheduler(architecture, options)
+    try:
+        if not scheduler.create_project_structure():
+            raise RuntimeError("项目结构创建失败")
+        waves = scheduler.plan_pending_waves()
+        tasks = [
+            {
+                'key': task.key,
+                'type': task.type,
+                'wave': waves.get(task.key, 0),
+                'state': PENDING if task.key in waves else DONE,
+                'fingerprint': None if task.key in waves else scheduler.task_fingerprint(task),
+            }
+            for task in scheduler.task_queue
+        ]
+    finally:
+        scheduler.close()
+    queue.create_build(build_id, architecture, options, tasks)
+    print(f"构建 {build_id} 已入队: {len(tasks)} 个任务，其中 {len(waves)} 个待执行")
+    return build_id
+
+
+class _Heartbeat:
+    """执行任务期间在后台线程中定期续约"""
+
+    def __init__(self, queue: WorkQueue, build_id: str, task_key: str, owner: str):
+        self.queue = queue
+        self.args = (build_id, task_key, owner)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            if not self.queue.heartbeat(*self.args):
+                print(f"⚠️ 任务 {self.args[1]} 的租约已被其他 worker 接手")
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def run_worker(queue_path: str, build_id: str, wal: bool = True, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+               owner: Optional[str] = None) -> Dict:
+    """worker 主循环：领取任务、执行并在输出写入磁盘后标记完成，直到队列中没有待执行或被租用的任务
+
+    模块级函数，可以在进程池中执行，也可以在其他主机上通过 `python work_queue.py worker` 启动。
+    """
+    queue = WorkQueue(queue_path, wal=wal, lease_seconds=lease_seconds)
+    owner = owner or worker_name()
+    build = queue.load_build(build_id)
+    if build is None:
+        raise ValueError(f"队列中没有构建: {build_id}")
+    scheduler = _make_scheduler(build['architecture'], build['options'])
+    stats = {'worker': owner, 'completed': 0, 'failed': 0, 'lost': 0}
+    try:
+        tasks = scheduler.start_worker()
+        # 已读回检索索引的完成记录编号：每次领取前只读取之后新完成的任务（包括其他 worker 完成的）
+        synced = 0
+        while True:
+            task_key = queue.lease(build_id, owner)
+            if task_key is None:
+                counts = queue.counts(build_id)
+                if not counts[PENDING] and not counts[LEASED]:
+                    break
+                # 其他 worker 仍持有租约：等待其完成或租约过期
+                time.sleep(POLL_INTERVAL)
+                continue
+            task = tasks.get(task_key)
+            if task is None:
+                queue.fail(build_id, task_key, owner, "架构中不存在该任务")
+                continue
+            completed = queue.completed_since(build_id, synced)
+            if completed:
+                synced = completed[-1][0]
+                scheduler.refresh_context(tasks[key] for _, key in completed if key in tasks)
+            started = time.perf_counter()
+            with _Heartbeat(queue, build_id, task_key, owner):
+                # 代码检查（以及可能的重新生成）与写盘完成后才算完成
+                error, task_fingerprint = scheduler.run_to_completion(task)
+            if error:
+                queue.fail(build_id, task_key, owner, error)
+                stats['failed'] += 1
+            elif queue.complete(build_id, task_key, owner, task_fingerprint, time.perf_counter() - started):
+                stats['completed'] += 1
+            else:
+                stats['lost'] += 1
+    finally:
+        scheduler.close()
+        queue.close()
+    return stats
+
+
+def finish_build(queue: WorkQueue, build_id: str) -> Dict[str, int]:
+    """所有任务结束后把完成任务的指纹与耗时写入项目的构建清单，供之后的增量构建使用"""
+    counts = queue.counts(build_id)
+    if counts[PENDING] or counts[LEASED]:
+        return counts
+    build = queue.load_build(build_id)
+    scheduler = _make_scheduler(build['architecture'], build['options'])
+    try:
+        scheduler.record_completed(queue.tasks(build_id, DONE))
+    finally:
+        scheduler.close()
+    if not counts[FAILED]:
+        queue.mark_finished(build_id)
+    return counts
+
+
+def resume(queue_path: str = DEFAULT_QUEUE_PATH, build_id: Optional[str] = None, workers: int = 4,
+           wal: bool = True, lease_seconds: float = DEFAULT_LEASE_SECONDS, retry_failed: bool = True) -> Dict:
+    """继续执行中断的构建：回收本机已退出 worker 的租约，启动多个 worker 进程执行剩余任务
+
+    build_id 为空时继续队列中所有未完成的构建。其他主机可以同时运行 worker 分担任务。
+    """
+    queue = WorkQueue(queue_path, wal=wal, lease_seconds=lease_seconds)
+    build_ids = [build_id] if build_id else queue.unfinished_builds()
+    results = {}
+    try:
+        for current in build_ids:
+            reclaimed = queue.reclaim(current)
+            retried = queue.retry_failed(current) if retry_failed else 0
+            counts = queue.counts(current)
+            print(f"继续构建 {current}: 已完成 {counts[DONE]}，待执行 {counts[PENDING]}，"
+                  f"执行中 {counts[LEASED]}（回收 {reclaimed} 个中断的任务，重试 {retried} 个失败任务）")
+            started = time.perf_counter()
+            # spawn 启动的 worker 不继承父进程中已经建立的 HTTP 连接与 SQLite 连接
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(run_worker, queue_path, current, wal, lease_seconds) for _ in range(workers)]
+                worker_stats = [future.result() for future in futures]
+            counts = finish_build(queue, current)
+            results[current] = {
+                'counts': counts,
+                'workers': worker_stats,
+                'wall_time': time.perf_counter() - started,
+                'errors': {task['key']: task['error'] for task in queue.tasks(current, FAILED)},
+            }
+            print(f"构建 {current} 结束: 完成 {counts[DONE]}，失败 {counts[FAILED]}，"
+                  f"耗时 {results[current]['wall_time']:.1f}s")
+            for key, error in results[current]['errors'].items():
+                print(f"- {key}: {error}")
+    finally:
+        queue.close()
+    return results
+
+
+def build_project_durable(architecture: Dict, queue_path: str = DEFAULT_QUEUE_PATH, workers: int = 4,
+                          output_root: str = "", **options) -> Dict:
+    """入队并用多个 worker 进程执行构建；进程中断后用 resume 继续"""
+    queue = WorkQueue(queue_path)
+    try:
+        build_id = enqueue_build(architecture, queue, output_root=output_root, **options)
+    finally:
+        queue.close()
+    return resume(queue_path, build_id, workers=workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="持久化任务队列：入队、继续中断的构建或启动 worker")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="队列数据库路径")
+    parser.add_argument("--no-wal", action="store_true", help="不使用 WAL 模式（队列文件位于网络文件系统时）")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS, help="任务租约时长（秒）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser("enqueue", help="把架构设计 JSON 文件中的构建写入队列并执行")
+    enqueue_parser.add_argument("architecture", help="架构设计 JSON 文件")
+    enqueue_parser.add_argument("--output-root", default="", help="项目输出根目录")
+    enqueue_parser.add_argument("--workers", type=int, default=4, help="worker 进程数，0 表示只入队")
+
+    resume_parser = commands.add_parser("resume", help="继续执行中断的构建")
+    resume_parser.add_argument("--build", help="构建标识，默认继续所有未完成的构建")
+    resume_parser.add_argument("--workers", type=int, default=4, help="worker 进程数")
+    resume_parser.add_argument("--no-retry-failed", action="store_true", help="不重试已失败的任务")
+
+    worker_parser = commands.add_parser("worker", help="在当前进程中运行一个 worker（例如在另一台主机上）")
+    worker_parser.add_argument("build", help="构建标识")
+
+    commands.add_parser("status", help="查看队列中各构建的任务状态")
+    args = parser.parse_args(argv)
+    wal = not args.no_wal
+
+    if args.command == "enqueue":
+        with open(args.architecture, 'r', encoding='utf-8') as f:
+            architecture = json.load(f)
+        queue = WorkQueue(args.queue, wal=wal, lease_seconds=args.lease)
+        try:
+            build_id = enqueue_build(architecture, queue, output_root=args.output_root)
+        finally:
+            queue.close()
+        print(f"构建标识: {build_id}")
+        if args.workers > 0:
+            resume(args.queue, build_id, workers=args.workers, wal=wal, lease_seconds=args.lease)
+        return 0
+
+    if args.command == "resume":
+        results = resume(args.queue, args.build, workers=args.workers, wal=wal, lease_seconds=args.lease,
+                         retry_failed=not args.no_retry_failed)
+        return 0 if all(not result['counts'][FAILED] for result in results.values()) else 1
+
+    if args.command == "worker":
+        stats = run_worker(args.queue, args.build, wal=wal, lease_seconds=args.lease)
+        print(f"worker {stats['worker']}: 完成 {stats['completed']}，失败 {stats['failed']}")
+        return 0
+
+    queue = WorkQueue(args.queue, wal=wal)
+    try:
+        rows = queue._connect().execute(
+            "SELECT build_id, project_name, finished_at FROM builds ORDER BY created_at"
+        ).fetchall()
+        for build_id, project_name, finished_at in rows:
+            counts = queue.counts(build_id)
+            state = "已完成" if finished_at else "未完成"
+            print(f"{build_id} {project_name} [{state}] 完成 {counts[DONE]} / 待执行 {counts[PENDING]} / "
+                  f"执行中 {counts[LEASED]} / 失败 {counts[FAILED]}")
+    finally:
+        queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())